@@ -3,6 +3,19 @@
 This module implements a Flask server to post score data to a localhost port.
 It serves to interface between the Python and Next.js sections of the project.
 
+Live score updates are pushed by the local_save Node as UDP datagrams of binary records, and are reduced
+into the maximum score of each person as they arrive, without touching the file system.
+They are streamed to the web app as Server-Sent Events from the '/stream' route, together with the state
+of the session, at no more than `STREAM_MAX_RATE` updates per second per client.
+
+The health and throughput of every running pipeline with the metrics Node are served from the '/metrics' route
+in the Prometheus text format, read from the memory-mapped counter blocks of the pipelines.
+
+The binary score log is kept as the history of every session. It is tailed incrementally from the last read
+offset and memory-mapped as a NumPy array, and is also used for the final score if the score feed cannot be opened.
+Tailing starts at the end of the log, as the scores already in it are from before the app was started.
+Once the log outgrows `MAX_LOG_BYTES`, it is moved aside at the end of a session, replacing the previous log.
+
 Usage
 -----
 This file can be run on the terminal:
@@ -12,17 +25,271 @@ python app.py
 ```
 """
 
-from collections import defaultdict
+import glob
 import logging
+import json
+import mmap
 import os
+import socket
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
 
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
+import numpy as np
+
+import worker
+
+sys.path.insert(0, os.path.join(worker.ROOT_DIR, 'cv', 'src'))
+from custom_nodes.output.utils import (  # pylint: disable=wrong-import-position
+    SCORE_HOST, SCORE_PORT, SCORE_RECORD, format_metrics, obtain_totals, read_metrics
+)
 
 
 # Define constants
 app = Flask(__name__)
 logger = logging.getLogger(__name__)
-PATH = 'tmp.txt'
+PATH = os.path.join(worker.ROOT_DIR, 'scores.bin')
+MAX_LOG_BYTES = 64 * 1024 * 1024
+METRICS_PATTERN = os.path.join(worker.ROOT_DIR, 'metrics*.bin')
+STREAM_MAX_RATE = 10.0
+STREAM_KEEPALIVE = 15.0
+
+
+def update_max_scores(
+        scores: Dict[Tuple[int, int], int],
+        records: np.ndarray
+) -> None:
+    """Updates the maximum score of each (session, ID) person with the given `SCORE_RECORD` records
+
+    Tracking IDs restart with every session, so the same ID in two sessions is taken as two people.
+    """
+
+    # Pack the session and the non-negative tracking ID of each record into a single key
+    keys = (records['session'].astype(np.int64) << 32) | records['id'].astype(np.int64)
+    keys, inverse = np.unique(keys, return_inverse=True)
+    max_scores = np.full(len(keys), np.iinfo(np.int32).min)
+    np.maximum.at(max_scores, inverse, records['score'])
+    for key, score in zip(keys.tolist(), max_scores.tolist()):
+        person = (key >> 32, key & 0xFFFFFFFF)
+        scores[person] = max(scores.get(person, score), score)
+
+
+class LiveState:
+    """Holds the latest live state of the session, waking the streaming clients whenever it changes
+
+    Clients only ever read the latest state, so a slow client skips the intermediate updates
+    instead of holding up the score feed.
+    """
+
+    def __init__(self) -> None:
+
+        # Implement trackers
+        self.condition = threading.Condition()
+        self.version = 0
+        self.state: Dict[str, Any] = {'status': 'idle', 'exercise': None}
+        self.scores: Dict[str, Dict[str, int]] = {}
+
+    def update(
+            self,
+            scores: Optional[Dict[str, Dict[str, int]]] = None,
+            **state: Any
+    ) -> None:
+        """Replaces the scores, if given, and updates the given keys of the session state"""
+
+        with self.condition:
+            if scores is not None:
+                self.scores = scores
+            self.state.update(state)
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(
+            self,
+            version: int,
+            timeout: float
+    ) -> Tuple[int, Dict[str, Any], Dict[str, Dict[str, int]]]:
+        """Waits until the live state is newer than the given version, or until the timeout
+
+        Returns
+        -------
+        tuple
+            The latest version, session state and scores.
+        """
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version, dict(self.state), self.scores
+
+
+live = LiveState()
+
+
+class ScoreFeed(threading.Thread):
+    """Receives the score updates published by the local_save Node, keeping the maximum score of each person"""
+
+    def __init__(
+            self,
+            port: int = SCORE_PORT
+    ) -> None:
+        """Opens the score feed
+
+        Parameters
+        ----------
+        port : int, default=`SCORE_PORT`
+            UDP port on localhost to receive the score updates from
+
+        Raises
+        ------
+        OSError
+            If the port is already in use.
+        """
+
+        super().__init__(name='score-feed', daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((SCORE_HOST, port))
+
+        # Implement trackers
+        self.lock = threading.Lock()
+        self.scores: Dict[Tuple[int, int], int] = {}
+        self.reps: Dict[Tuple[int, int], int] = {}
+
+    def _publish(self) -> None:
+
+        # Show the latest session of any ID reused by several sessions
+        live.update(scores={str(curr_id): {'score': score, 'reps': self.reps.get((session, curr_id), 0)}
+                            for (session, curr_id), score in sorted(self.scores.items())})
+
+    def run(self) -> None:
+        while True:
+            data = self.sock.recv(65536)
+            records = np.frombuffer(data, dtype=SCORE_RECORD, count=len(data) // SCORE_RECORD.itemsize)
+            with self.lock:
+                update_max_scores(self.scores, records)
+                self.reps.update(zip(zip(records['session'].tolist(), records['id'].tolist()),
+                                     records['reps'].tolist()))
+                self._publish()
+
+    def pop_total(self) -> int:
+        """Returns the sum of the maximum score of each person, and clears the scores for the next session"""
+
+        with self.lock:
+            total = sum(self.scores.values())
+            self.scores.clear()
+            self.reps.clear()
+            self._publish()
+        return total
+
+
+class ScoreLog:
+    """Tails the binary score log written by the local_save Node, keeping the maximum score of each person"""
+
+    def __init__(
+            self,
+            path: str
+    ) -> None:
+        """Initialises the score log reader
+
+        Parameters
+        ----------
+        path : str
+            Path of the score log, made up of `SCORE_RECORD` records
+        """
+
+        self.path = path
+        self.previous_path = path + '.1'
+
+        # Implement trackers
+        self.lock = threading.Lock()
+        self.inode: Optional[int] = None
+        self.offset = 0
+        self.scores: Dict[Tuple[int, int], int] = {}
+
+        # Start at the end of the log, as its scores are from before the app was started
+        try:
+            stat = os.stat(path)
+            self.inode, self.offset = stat.st_ino, stat.st_size - stat.st_size % SCORE_RECORD.itemsize
+        except FileNotFoundError:
+            pass
+
+    def _map(self, offset: int, reduce: Callable[[np.ndarray], None]) -> int:
+
+        # Map the complete records from the given offset without copying them;
+        # a trailing record that is still being written is left for the next read
+        try:
+            with open(self.path, 'rb') as file:
+                stat = os.fstat(file.fileno())
+
+                # Start over if the log has been replaced or truncated
+                if stat.st_ino != self.inode or stat.st_size < self.offset:
+                    if self.inode is not None:
+                        logger.info("Score log at filepath %s was rotated", self.path)
+                    self.inode, self.offset = stat.st_ino, 0
+                    offset = 0
+                num_records = (stat.st_size - offset) // SCORE_RECORD.itemsize
+                if num_records <= 0:
+                    return offset
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    records = np.frombuffer(buffer, dtype=SCORE_RECORD, count=num_records, offset=offset)
+                    reduce(records)
+                    del records
+        except FileNotFoundError:
+            return offset
+        return offset + num_records * SCORE_RECORD.itemsize
+
+    def update(self) -> None:
+        """Reads the records appended to the score log since the last update"""
+
+        with self.lock:
+            self.offset = self._map(self.offset, lambda records: update_max_scores(self.scores, records))
+
+    def pop_total(self) -> int:
+        """Returns the sum of the maximum score of each person, and clears the scores for the next session"""
+
+        self.update()
+        with self.lock:
+            total = sum(self.scores.values())
+            self.scores.clear()
+        return total
+
+    def rotate(
+            self,
+            max_bytes: int = MAX_LOG_BYTES
+    ) -> None:
+        """Moves the score log aside, replacing the previous log, if it has outgrown the given size
+
+        This should only be called at the end of a session, once its final score has been read.
+        The local_save Node reopens the log on every flush, so it starts a new log on its next flush.
+        """
+
+        with self.lock:
+            try:
+                if os.path.getsize(self.path) < max_bytes:
+                    return
+                os.replace(self.path, self.previous_path)
+            except OSError as error:
+                if not isinstance(error, FileNotFoundError):
+                    logger.error("Unable to rotate the score log at filepath %s: %s", self.path, error)
+                return
+            self.inode, self.offset = None, 0
+            logger.info("Score log at filepath %s was rotated to %s", self.path, self.previous_path)
+
+    def totals(self) -> np.ndarray:
+        """Returns the total score of every session in the previous and current score logs, see `obtain_totals()`"""
+
+        logs = []
+        with self.lock:
+            self._map(0, lambda records: logs.append(records.copy()))
+        try:
+            logs.insert(0, np.fromfile(self.previous_path, dtype=SCORE_RECORD))
+        except FileNotFoundError:
+            pass
+        return obtain_totals(np.concatenate(logs) if logs else np.zeros(0, dtype=SCORE_RECORD))
+
+
+score_log = ScoreLog(PATH)
+score_feed: Optional[ScoreFeed] = None
 
 
 @app.route('/', methods=['POST'])
@@ -31,24 +298,113 @@ def post_scores():
     Posts the total sum of all scores recorded per each person ID to the localhost
     """
 
-    scores = defaultdict(int)
+    # Post the final score, calculated as the total sum of all the scores
+    # (assuming that only one user was in front of the camera)
+    scores = score_feed if score_feed is not None else score_log
+    total = scores.pop_total()
 
-    # Read from temp file
-    with open(PATH, 'r', encoding='utf-8') as file:
-        for line in file.readlines()[:-1]:
-            curr_id, score = map(int, line.split(':'))
-            scores[curr_id] = max(scores[curr_id], score)
+    # Keep the score log from growing without bound, now that the session has ended
+    score_log.rotate()
+    return jsonify(score=total)
 
-    # Delete the temp file
-    try:
-        os.remove(PATH)
-    except FileNotFoundError:
-        logger.warning("Expected to delete file at filepath %s but file was not found", PATH)
 
-    # Post the final score, calculated as the total sum of all the scores
-    # (assuming that only one user was in front of the camera)
-    return jsonify(score=sum(scores.items()))
+@app.route('/sessions', methods=['GET'])
+def get_sessions():
+    """
+    Gets the total score of every session saved in the score log
+    """
+
+    return jsonify(sessions=[{'session': int(session), 'score': int(score)}
+                             for session, score in score_log.totals().tolist()])
+
+
+@app.route('/stream', methods=['GET'])
+def stream_updates():
+    """
+    Streams the scores and repetitions of each person, and the state of the session, as Server-Sent Events
+
+    The 'state' event is sent whenever the session starts, stops or switches exercises,
+    and the 'scores' event whenever a score or repetition changes, at most `rate` times per second.
+    A `rate` that is not positive is rejected with 400.
+    """
+
+    rate = request.args.get('rate', STREAM_MAX_RATE, type=float)
+    if not rate > 0:
+        return jsonify(status='error', message='rate must be a positive number of updates per second'), 400
+    rate = min(rate, STREAM_MAX_RATE)
+    return Response(_stream(1 / rate), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'})
+
+
+def _stream(interval: float) -> Iterator[str]:
+
+    version, sent_state, sent_scores = -1, None, None
+    while True:
+        version, state, scores = live.wait(version, STREAM_KEEPALIVE)
+        if state == sent_state and scores == sent_scores:
+            # Keep the connection alive through idle periods
+            yield ': keepalive\n\n'
+            continue
+        if state != sent_state:
+            yield f'event: state\ndata: {json.dumps(state)}\n\n'
+            sent_state = state
+        if scores != sent_scores:
+            yield f'event: scores\ndata: {json.dumps(scores)}\n\n'
+            sent_scores = scores
+
+        # Coalesce the updates made while waiting into the next event
+        time.sleep(interval)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Gets the metrics of every pipeline in the Prometheus text format, labelled by stream
+    """
+
+    blocks = [block for block in map(read_metrics, sorted(glob.glob(METRICS_PATTERN))) if block is not None]
+    return Response(format_metrics(blocks), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/start', methods=['POST'])
+def start_stretch():
+    """
+    Starts a stretch session on the running worker, optionally with the given exercise
+    """
+
+    # Discard the scores of any previous session
+    (score_feed if score_feed is not None else score_log).pop_total()
+
+    exercise = (request.get_json(silent=True) or {}).get('exercise', '')
+    return _worker_command(f'start {exercise}')
+
+
+@app.route('/stop', methods=['POST'])
+def stop_stretch():
+    """
+    Stops the stretch session on the running worker
+    """
+
+    return _worker_command('stop')
+
+
+def _worker_command(command: str):
+    try:
+        reply = worker.send_command(command)
+    except OSError as error:
+        logger.error("Unable to reach the worker: %s", error)
+        return jsonify(status='error', message='worker is not running'), 503
+    status, *message = reply.split(maxsplit=1)
+    if status == 'ok':
+        active, exercise = message[0].split()
+        live.update(status=active, exercise=exercise)
+    return jsonify(status=status, message=' '.join(message)), 200 if status == 'ok' else 400
 
 
 if __name__ == '__main__':
-    app.run()
+    try:
+        score_feed = ScoreFeed()
+        score_feed.start()
+    except OSError as error:
+        logger.error("Unable to open the score feed, falling back to the score log: %s", error)
+    app.run(threaded=True)
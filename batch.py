@@ -0,0 +1,298 @@
+"""Docstring for the batch.py module
+
+This module implements the offline analysis of a directory of recorded stretch videos.
+
+Every video is split into chunks of at most `chunk_seconds` seconds, and the chunks are spread across
+a pool of processes, each running the pose estimation and stretch analysis Nodes of `cv/pipeline_config.yml`
+on its own frames. The display and output Nodes are left out.
+
+Each chunk after the first starts `overlap_seconds` before its own frames, to let the tracker and the
+stretch state machines warm up, but only the repetitions and scores gained on its own frames are counted.
+The repetitions and scores of every chunk of a video are then summed into a single row of the results table.
+
+Usage
+-----
+This file can be run on the terminal from the root directory:
+
+```
+python batch.py path/to/videos --exercise arm --workers 4 --output results.csv
+```
+
+It can also be run through `python main.py arm --videos path/to/videos`.
+"""
+
+import argparse
+import concurrent.futures
+import copy
+import csv
+import logging
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+
+# Define constants
+logger = logging.getLogger(__name__)
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CV_DIR = os.path.join(ROOT_DIR, 'cv')
+EXERCISES = {'arm': 'yw', 'neck': 'ms', 'side': 'lat'}
+VIDEO_EXTENSIONS = ('.avi', '.m4v', '.mkv', '.mov', '.mp4', '.mpeg', '.mpg', '.webm')
+FIELDS = ['video', 'exercise', 'frames', 'duration', 'chunks', 'people', 'reps', 'score', 'seconds']
+
+"""Type-hinting alias for a chunk of a video
+
+It holds the path, the first frame to run, the first frame to count and the end frame.
+"""  # pylint: disable=pointless-string-statement
+Chunk = Tuple[str, int, int, int]
+
+# The analysis Nodes of each pool process, set up once per process
+_pipeline: Optional[Dict[str, Any]] = None
+
+
+def obtain_nodes(exercise: str) -> Tuple[List[Any], Optional[Dict[str, int]]]:
+    """Obtains the analysis Nodes of `cv/pipeline_config.yml` for the given exercise
+
+    Returns
+    -------
+    tuple
+        The input Node and the analysis Nodes up to the display Nodes, with the stretch and stats Nodes
+        of the given exercise, and the resolution frames are resized to by the input Node, if any.
+    """
+
+    with open(os.path.join(CV_DIR, 'pipeline_config.yml'), 'r', encoding='utf-8') as file:
+        nodes = yaml.safe_load(file)['nodes']
+
+    prefix = EXERCISES[exercise]
+    resize = None
+    analysis_nodes = []
+    for node in nodes:
+        node_name = node if isinstance(node, str) else next(iter(node))
+        config = node[node_name] if isinstance(node, dict) else None
+        if node_name == 'input.visual':
+            resize = (config or {}).get('resize', {})
+            resize = resize if resize.get('do_resizing', False) else None
+            analysis_nodes.append({node_name: config or {}})
+            continue
+
+        # Frames are never displayed or saved, so only the Nodes with outputs used by the analysis are kept
+        if (node_name.startswith(('output.', 'custom_nodes.output.', 'draw.'))
+                or node_name in ('dabble.fps', 'custom_nodes.draw.overlay')):
+            continue
+        if node_name.startswith('custom_nodes.dabble.') and node_name.endswith('_stretch'):
+            node_name = f'custom_nodes.dabble.{prefix}_stretch'
+        elif node_name.startswith('custom_nodes.draw.') and node_name.endswith('_stats'):
+            node_name = f'custom_nodes.draw.{prefix}_stats'
+        analysis_nodes.append({node_name: config} if config else node_name)
+    return analysis_nodes, resize
+
+
+def obtain_chunks(
+        path: str,
+        num_frames: int,
+        fps: float,
+        chunk_seconds: float,
+        overlap_seconds: float
+) -> List[Chunk]:
+    """Splits a video into chunks of at most `chunk_seconds` seconds
+
+    Each chunk is warmed up on the `overlap_seconds` before it.
+    """
+
+    # Analyse the whole video at once if its length is unknown
+    if num_frames <= 0:
+        return [(path, 0, 0, sys.maxsize)]
+
+    chunk_frames = max(int(chunk_seconds * fps), 1)
+    overlap_frames = int(overlap_seconds * fps)
+    return [(path, max(start - overlap_frames, 0), start, min(start + chunk_frames, num_frames))
+            for start in range(0, num_frames, chunk_frames)]
+
+
+def _init_process(exercise: str) -> None:
+
+    # Give every process a single thread, so that the processes scale with the cores instead of contending for them
+    for variable in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+        os.environ[variable] = '1'
+
+    global _pipeline  # pylint: disable=global-statement
+    os.chdir(CV_DIR)
+    sys.path.insert(0, os.path.join(CV_DIR, 'src'))
+    nodes, resize = obtain_nodes(exercise)
+    _pipeline = {'nodes': nodes, 'resize': resize}
+
+
+def analyse_chunk(chunk: Chunk) -> Dict[str, Any]:
+    """Runs the analysis Nodes on a chunk of a video, in a pool process
+
+    Returns
+    -------
+    dict
+        Frames counted, and repetitions and score gained by each person on the counted frames of the chunk.
+    """
+
+    import cv2  # pylint: disable=import-outside-toplevel
+    from peekingduck.runner import Runner  # pylint: disable=import-outside-toplevel
+
+    path, first_frame, count_from, end_frame = chunk
+    start = time.perf_counter()
+
+    # Reload the Nodes for every chunk, so that no tracking or stretch state carries over from the previous chunk.
+    # The input Node is only kept for PeekingDuck to accept the pipeline; the frames are read here instead,
+    # so that each chunk can seek straight to its first frame
+    pipeline_nodes = [{'input.visual': {**node['input.visual'], 'source': path}}
+                      if isinstance(node, dict) and 'input.visual' in node else node for node in _pipeline['nodes']]
+    with tempfile.NamedTemporaryFile('w', suffix='.yml', dir=CV_DIR, delete=False) as file:
+        yaml.safe_dump({'nodes': pipeline_nodes}, file)
+    try:
+        runner = Runner(pipeline_path=Path(file.name), config_updates_cli='None', custom_nodes_parent_subdir='src')
+        nodes = [node for node in runner.pipeline.nodes if node.node_name != 'input.visual']
+    finally:
+        os.remove(file.name)
+
+    capture = cv2.VideoCapture(path)
+    if first_frame:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    reps_before: Dict[Any, int] = {}
+    scores_before: Dict[Any, int] = {}
+    max_reps: Dict[Any, int] = {}
+    max_scores: Dict[Any, int] = {}
+    num_frames = 0
+    for frame in range(first_frame, end_frame):
+        success, img = capture.read()
+        if not success:
+            break
+        if _pipeline['resize'] is not None:
+            img = cv2.resize(img, (_pipeline['resize']['width'], _pipeline['resize']['height']))
+
+        data: Dict[str, Any] = {'img': img}
+        for node in nodes:
+            inputs = copy.deepcopy(data) if 'all' in node.inputs else {key: data[key] for key in node.inputs
+                                                                         if key in data}
+            data.update(node.run(inputs))
+
+        # Remember what was gained during the warm-up, so that it is only counted by the previous chunk
+        reps, scores = data.get('reps', {}), data.get('scores', {})
+        if frame < count_from:
+            reps_before, scores_before = dict(reps), dict(scores)
+            continue
+
+        # Keep the most of each person over the counted frames, as people who leave are evicted from the state,
+        # and the pool processes run much slower than real time
+        num_frames += 1
+        for curr_id, count in reps.items():
+            max_reps[curr_id] = max(max_reps.get(curr_id, count), count)
+        for curr_id, score in scores.items():
+            max_scores[curr_id] = max(max_scores.get(curr_id, score), score)
+    capture.release()
+
+    return {
+        'path': path,
+        'frames': num_frames,
+        'reps': {curr_id: max(count - reps_before.get(curr_id, 0), 0) for curr_id, count in max_reps.items()},
+        'scores': {curr_id: max(score - scores_before.get(curr_id, 0), 0) for curr_id, score in max_scores.items()},
+        'seconds': time.perf_counter() - start
+    }
+
+
+def analyse_videos(
+        videos_dir: str,
+        exercise: str,
+        workers: Optional[int] = None,
+        chunk_seconds: float = 300.0,
+        overlap_seconds: float = 5.0
+) -> List[Dict[str, Any]]:
+    """Analyses every video in a directory in parallel
+
+    Parameters
+    ----------
+    videos_dir : str
+        Directory of the videos to analyse
+    exercise : str
+        Stretch performed in the videos; one of 'arm', 'neck' or 'side'
+    workers : int, optional
+        Number of processes to analyse the videos with; defaults to the number of cores
+    chunk_seconds : float, default=300.0
+        Maximum number of seconds of video analysed by a single process at a time
+    overlap_seconds : float, default=5.0
+        Number of seconds before each chunk that are analysed but not counted, to warm up the analysis
+
+    Returns
+    -------
+    list
+        One row of results per video, with the keys of `FIELDS`; 'people' is the most people seen in a single chunk.
+    """
+
+    import cv2  # pylint: disable=import-outside-toplevel
+
+    # Split every video into chunks, in order of decreasing length so the longest chunks are not left for last
+    rows: Dict[str, Dict[str, Any]] = {}
+    chunks: List[Chunk] = []
+    for path in sorted(Path(videos_dir).iterdir()):
+        if path.suffix.lower() not in VIDEO_EXTENSIONS:
+            continue
+        capture = cv2.VideoCapture(str(path))
+        num_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        capture.release()
+        video_chunks = obtain_chunks(str(path.resolve()), num_frames, fps, chunk_seconds, overlap_seconds)
+        chunks.extend(video_chunks)
+        rows[str(path.resolve())] = {'video': path.name, 'exercise': exercise, 'frames': 0,
+                                     'duration': round(max(num_frames, 0) / fps, 2), 'chunks': len(video_chunks),
+                                     'people': 0, 'reps': 0, 'score': 0, 'seconds': 0.0}
+    chunks.sort(key=lambda chunk: chunk[3] - chunk[1], reverse=True)
+
+    workers = min(workers or os.cpu_count() or 1, max(len(chunks), 1))
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_process, initargs=(exercise,)) as pool:
+        for result in pool.map(analyse_chunk, chunks):
+            row = rows[result['path']]
+            row['frames'] += result['frames']
+            row['people'] = max(row['people'], len(result['scores']))
+            row['reps'] += sum(result['reps'].values())
+            row['score'] += sum(result['scores'].values())
+            row['seconds'] = round(row['seconds'] + result['seconds'], 2)
+
+    total_frames = sum(row['frames'] for row in rows.values())
+    elapsed = time.perf_counter() - start
+    logger.info('Analysed %d frames of %d videos in %.2f seconds with %d processes: %.1f frames per second.',
+                total_frames, len(rows), elapsed, workers, total_frames / elapsed)
+    return list(rows.values())
+
+
+def write_results(rows: List[Dict[str, Any]], output: Optional[str] = None) -> None:
+    """Writes the results table as CSV to the given path, or to the standard output if not given"""
+
+    if output is None:
+        writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return
+    with open(output, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Stretch925 batch analysis',
+        description='Count the repetitions and scores of every recorded stretch video in a directory.'
+    )
+    parser.add_argument('videos', help='directory of the video files to analyse')
+    parser.add_argument('--exercise', choices=list(EXERCISES), default='arm')
+    parser.add_argument('--workers', type=int, help='number of processes; defaults to the number of cores')
+    parser.add_argument('--chunk-seconds', type=float, default=300.0,
+                        help='maximum number of seconds of video analysed by a process at a time')
+    parser.add_argument('--overlap-seconds', type=float, default=5.0,
+                        help='number of seconds analysed before each chunk to warm up the analysis')
+    parser.add_argument('--output', help='path of the CSV file to save the results to')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    write_results(analyse_videos(args.videos, args.exercise, args.workers, args.chunk_seconds, args.overlap_seconds),
+                  os.path.abspath(args.output) if args.output else None)
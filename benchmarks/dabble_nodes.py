@@ -0,0 +1,288 @@
+"""Docstring for the benchmarks/dabble_nodes.py script
+
+This script measures the per-frame latency and throughput of the stretch analysis hot path,
+on synthetic keypoint trajectories of 1, 5, 20 and 100 tracked people by default.
+
+The pose_features, yw_stretch, ms_stretch and lat_stretch Nodes are each timed on their own,
+on pose features computed beforehand. So are the vectorised `obtain_joint_angles()` and
+`angles_between_vectors_in_rad()` that the pose_features Node runs on every frame, on the limb vectors
+of every person, and the scalar `angle_between_vectors_in_rad()` on its own.
+Every number of people is run through the following cases:
+
+- 'clean' - every keypoint is detected, and a third of the people each do the arm, neck and side stretch
+- 'missing' - a fifth of the keypoints are undetected on every frame
+- 'degenerate' - a quarter of the people have every keypoint on the same point, and another quarter none at all
+- 'churn' - everyone is given a new tracking ID every 30 frames, as when tracks are lost
+
+Usage
+-----
+Run from the root directory:
+
+```
+python benchmarks/dabble_nodes.py --frames 300 --output dabble_nodes.json
+```
+
+Compare two saved results, such as before and after a change to the hot path, with:
+
+```
+python benchmarks/dabble_nodes.py --compare before.json after.json
+```
+"""
+
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import yaml
+
+
+# Define constants
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CV_DIR = os.path.join(ROOT_DIR, 'cv')
+IMG_SHAPE = (1080, 1920, 3)
+PEOPLE = [1, 5, 20, 100]
+CASES = ['clean', 'missing', 'degenerate', 'churn']
+STRETCH_NODES = ['custom_nodes.dabble.yw_stretch', 'custom_nodes.dabble.ms_stretch', 'custom_nodes.dabble.lat_stretch']
+
+"""Defines the relative keypoints of a person standing upright
+
+The arms are down, and the keypoints lie within a unit box.
+"""  # pylint: disable=pointless-string-statement
+STANDING_POSE = np.array([
+    (0.50, 0.10), (0.53, 0.08), (0.47, 0.08), (0.56, 0.09), (0.44, 0.09),
+    (0.62, 0.22), (0.38, 0.22), (0.65, 0.38), (0.35, 0.38), (0.66, 0.52), (0.34, 0.52),
+    (0.58, 0.55), (0.42, 0.55), (0.58, 0.75), (0.42, 0.75), (0.58, 0.95), (0.42, 0.95)
+])
+
+
+def _rotate(points: np.ndarray, centres: np.ndarray, angles: np.ndarray) -> np.ndarray:
+
+    # Rotate the points of shape (N, K, 2) about the centres of shape (N, 2) by the angles of shape (N,)
+    cos, sin = np.cos(angles)[:, None], np.sin(angles)[:, None]
+    offsets = points - centres[:, None]
+    return centres[:, None] + np.stack((offsets[..., 0] * cos - offsets[..., 1] * sin,
+                                        offsets[..., 0] * sin + offsets[..., 1] * cos), axis=-1)
+
+
+def obtain_trajectories(num_people: int, num_frames: int, case: str, seed: int = 0) -> List[Dict[str, Any]]:
+    """Obtains the synthetic model outputs and tracking IDs of every frame
+
+    Every person stands in their own cell of a grid over the frame, and repeatedly does one of the stretches,
+    out of phase with each other: the people at indices 0, 3, 6, ... move their arms between the W and Y poses,
+    those at indices 1, 4, 7, ... tilt their neck, and the rest bend sideways with their arms in the Y pose.
+    """
+
+    rng = np.random.default_rng(seed)
+    cols = int(np.ceil(np.sqrt(num_people)))
+    cells = np.array([divmod(i, cols)[::-1] for i in range(num_people)], dtype=float) / cols
+    phases = rng.uniform(0, 2 * np.pi, num_people)
+    arms, neck, side = (np.arange(num_people) % 3 == exercise for exercise in range(3))
+
+    frames = []
+    for frame in range(num_frames):
+        wave = np.sin(2 * np.pi * frame / 60 + phases)
+        poses = np.repeat(STANDING_POSE[None], num_people, axis=0)
+
+        # Move the arms from the W pose, with the upper arms out and the forearms up,
+        # to the Y pose, with the whole arms straight up and out
+        raised = arms | side
+        progress = np.where(arms, (wave + 1) / 2, 1)[raised]
+        upper_arm, forearm = np.radians(20 + 30 * progress), np.radians(90 - 40 * progress)
+        for shoulder, elbow, wrist, side_x in ((5, 7, 9, 1), (6, 8, 10, -1)):
+            poses[raised, elbow] = poses[raised, shoulder] + 0.16 * np.stack(
+                (side_x * np.cos(upper_arm), -np.sin(upper_arm)), axis=-1)
+            poses[raised, wrist] = poses[raised, elbow] + 0.14 * np.stack(
+                (side_x * np.cos(forearm), -np.sin(forearm)), axis=-1)
+
+        # Tilt the head about the neck, or bend the upper body about the hips
+        poses[neck, :5] = _rotate(poses[neck, :5], poses[neck][:, [5, 6]].mean(axis=1), 0.5 * wave[neck])
+        poses[side, :11] = _rotate(poses[side, :11], poses[side][:, [11, 12]].mean(axis=1), 0.4 * wave[side])
+
+        keypoints = np.clip(cells[:, None] + poses / cols, 0, 1)
+        ids = list(range(num_people))
+        if case == 'missing':
+            keypoints[rng.random(keypoints.shape[:2]) < 0.2] = -1
+        elif case == 'degenerate':
+            quarter = max(num_people // 4, 1)
+            keypoints[:quarter] = keypoints[:quarter, :1]
+            keypoints[quarter:2 * quarter] = -1
+        elif case == 'churn':
+            ids = [curr_id + num_people * (frame // 30) for curr_id in ids]
+
+        detected = keypoints != -1
+        bboxes = np.concatenate((np.where(detected, keypoints, 1).min(axis=1),
+                                 np.where(detected, keypoints, 0).max(axis=1)), axis=1)
+        frames.append({'keypoints': keypoints, 'bboxes': bboxes, 'obj_attrs': {'ids': ids}})
+    return frames
+
+
+def load_nodes(node_names: List[str]) -> Dict[str, Any]:
+    """Loads the given custom Nodes with their default configurations, as done by `peekingduck run`"""
+
+    from peekingduck.runner import Runner  # pylint: disable=import-outside-toplevel
+
+    # PeekingDuck only accepts a pipeline starting with an input Node, which is never run here.
+    # It also looks for the custom Nodes next to the pipeline configuration, so save it in the cv directory
+    input_node = {'custom_nodes.input.keypoint_replay': {'path': tempfile.gettempdir()}}
+    with tempfile.NamedTemporaryFile('w', suffix='.yml', dir=CV_DIR, delete=False) as file:
+        yaml.safe_dump({'nodes': [input_node, *node_names]}, file)
+    try:
+        _, *nodes = Runner(pipeline_path=Path(file.name), config_updates_cli='None',
+                           custom_nodes_parent_subdir='src').pipeline.nodes
+    finally:
+        os.remove(file.name)
+    return dict(zip(node_names, nodes))
+
+
+def time_calls(function: Callable[[Any], Any], inputs: List[Any], num_warmup: int) -> Dict[str, Any]:
+    """Calls the function on every input in turn, and summarises the latency of each call after the warm-up"""
+
+    for arg in inputs[:num_warmup]:
+        function(arg)
+    latencies = np.zeros(len(inputs) - num_warmup)
+    for i, arg in enumerate(inputs[num_warmup:]):
+        start = time.perf_counter()
+        function(arg)
+        latencies[i] = time.perf_counter() - start
+
+    latencies_us = latencies * 1e6
+    return {
+        'calls': len(latencies),
+        'calls_per_second': float(len(latencies) / latencies.sum()) if len(latencies) else 0.0,
+        'latency_us': {f'p{q}': float(np.percentile(latencies_us, q)) if len(latencies) else 0.0
+                       for q in (50, 95, 99)},
+        'mean_us': float(latencies_us.mean()) if len(latencies) else 0.0
+    }
+
+
+def benchmark_angles(num_calls: int, num_warmup: int, seed: int = 0) -> Dict[str, Any]:
+    """Times `angle_between_vectors_in_rad()` on random vectors, and on zero vectors, which are logged as errors"""
+
+    from custom_nodes.dabble.utils import angle_between_vectors_in_rad  # pylint: disable=import-outside-toplevel
+
+    rng = np.random.default_rng(seed)
+    vectors = [tuple(v) for v in rng.integers(-500, 500, (num_calls + num_warmup, 4)).tolist()]
+    return {
+        'random': time_calls(lambda v: angle_between_vectors_in_rad(*v), vectors, num_warmup),
+        'zero': time_calls(lambda v: angle_between_vectors_in_rad(0, 0, *v[2:]), vectors, num_warmup)
+    }
+
+
+def benchmark_joint_angles(frames: List[Dict[str, Any]], num_warmup: int) -> Dict[str, Any]:
+    """Times `obtain_joint_angles()` and `angles_between_vectors_in_rad()` on the limb vectors of every frame"""
+
+    # pylint: disable=import-outside-toplevel
+    from custom_nodes.dabble.utils import (
+        JOINT_ANGLES,
+        angles_between_vectors_in_rad,
+        obtain_joint_angles,
+        obtain_keypoints,
+        obtain_limb_vectors
+    )
+
+    first, second = np.asarray(JOINT_ANGLES).T
+    limb_vectors = [obtain_limb_vectors(obtain_keypoints(frame['keypoints'], IMG_SHAPE[1], IMG_SHAPE[0]))
+                    for frame in frames]
+    return {
+        'obtain_joint_angles': time_calls(obtain_joint_angles, limb_vectors, num_warmup),
+        'angles_between_vectors_in_rad': time_calls(
+            lambda vectors: angles_between_vectors_in_rad(*vectors),
+            [(vectors[:, first], vectors[:, second]) for vectors in limb_vectors], num_warmup)
+    }
+
+
+def benchmark_nodes(num_people: int, case: str, num_frames: int, num_warmup: int) -> Dict[str, Any]:
+    """Times the pose_features Node, its joint angles and each stretch Node on the synthetic trajectories of one case"""
+
+    frames = obtain_trajectories(num_people, num_warmup + num_frames, case)
+    img = np.zeros(IMG_SHAPE, dtype=np.uint8)
+    for frame in frames:
+        frame['img'] = img
+
+    # Load fresh Nodes, so that no state carries over from the previous case
+    nodes = load_nodes(['custom_nodes.dabble.pose_features', *STRETCH_NODES])
+    features = nodes.pop('custom_nodes.dabble.pose_features')
+    results = {'pose_features': time_calls(features.run, frames, num_warmup),
+               **benchmark_joint_angles(frames, num_warmup)}
+    for frame in frames:
+        frame.update(features.run(frame))
+
+    for node_name, node in nodes.items():
+        results[node_name.rsplit('.', 1)[-1]] = time_calls(
+            node.run, [{key: frame[key] for key in node.inputs if key in frame} for frame in frames], num_warmup)
+    for result in results.values():
+        result['people_per_second'] = result['calls_per_second'] * num_people
+    return results
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Prints the change in median latency of every benchmark between two saved results"""
+
+    with open(before_path, 'r', encoding='utf-8') as file:
+        before = json.load(file)['results']
+    with open(after_path, 'r', encoding='utf-8') as file:
+        after = json.load(file)['results']
+
+    def flatten(results: Dict[str, Any], prefix: str = '') -> Dict[str, float]:
+        if 'latency_us' in results:
+            return {prefix: results['latency_us']['p50']}
+        flat = {}
+        for key, value in results.items():
+            flat.update(flatten(value, f'{prefix}/{key}' if prefix else key))
+        return flat
+
+    before_flat, after_flat = flatten(before), flatten(after)
+    for name in sorted(before_flat.keys() & after_flat.keys()):
+        change = (after_flat[name] / before_flat[name] - 1) * 100 if before_flat[name] else 0.0
+        print(f'{name:<50} p50 {before_flat[name]:10.1f} us -> {after_flat[name]:10.1f} us ({change:+6.1f}%)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmark the stretch analysis Nodes on synthetic poses.')
+    parser.add_argument('--people', type=int, nargs='+', default=PEOPLE, help='numbers of tracked people')
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--frames', type=int, default=300, help='number of frames to time per case')
+    parser.add_argument('--warmup', type=int, default=30, help='number of untimed frames per case')
+    parser.add_argument('--angle-calls', type=int, default=100000,
+                        help='number of calls to time angle_between_vectors_in_rad() with')
+    parser.add_argument('--output', help='path of the JSON file to save the results to')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two saved results instead')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    # Keep the errors logged for degenerate poses part of the measured cost, without printing them
+    logging.basicConfig(handlers=[logging.NullHandler()])
+
+    os.chdir(CV_DIR)
+    sys.path.insert(0, os.path.join(CV_DIR, 'src'))
+
+    results: Dict[str, Any] = {'angle_between_vectors_in_rad': benchmark_angles(args.angle_calls, args.warmup)}
+    print(f"angle_between_vectors_in_rad: "
+          f"{results['angle_between_vectors_in_rad']['random']['calls_per_second']:,.0f} calls/s, "
+          f"{results['angle_between_vectors_in_rad']['zero']['calls_per_second']:,.0f} calls/s on zero vectors")
+    for people in args.people:
+        for case in args.cases:
+            case_results = benchmark_nodes(people, case, args.frames, args.warmup)
+            results.setdefault(f'{people}_people', {})[case] = case_results
+            print(f'{people:>4} people, {case:<10}: ' + ', '.join(
+                f"{name} p50 {result['latency_us']['p50']:8.1f} us" for name, result in case_results.items()))
+
+    if args.output:
+        with open(os.path.join(ROOT_DIR, args.output), 'w', encoding='utf-8') as file:
+            json.dump({
+                'config': {'frames': args.frames, 'warmup': args.warmup, 'angle_calls': args.angle_calls},
+                'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                                'machine': platform.machine(), 'processor': platform.processor()},
+                'results': results
+            }, file, indent=2)
@@ -0,0 +1,171 @@
+"""Docstring for the benchmarks/draw_overlay.py script
+
+This script compares the per-frame time taken to draw the overlays of a frame by the separate draw.bbox, draw.tag,
+draw.poses, draw.legend and yw_stats Nodes, as in `cv/pipeline_config.yml` before, against the yw_stats Node
+with its `draw` config set to False followed by the overlay Node, which draws everything in a single pass.
+
+The poses are the synthetic trajectories of benchmarks/dabble_nodes.py, with a grid of people doing the stretches.
+Both pipelines draw the same frames onto copies of the same image, and the number of pixels that differ
+between them is reported, together with the largest difference. Each Node is given its inputs as the runner
+of PeekingDuck gives them, which deep copies the data of the pipeline for the Nodes that take in all of it.
+
+Usage
+-----
+Run from the root directory:
+
+```
+python benchmarks/draw_overlay.py --people 1 5 20 --frames 300 --output draw_overlay.json
+```
+"""
+
+import argparse
+import copy
+from importlib import import_module
+import json
+import os
+from pathlib import Path
+import platform
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from dabble_nodes import CV_DIR, IMG_SHAPE, obtain_trajectories
+
+
+# Define constants
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PEOPLE = [1, 5, 20]
+LEGEND = ['fps', 'keyframe_interval']
+
+"""Defines the pairs of keypoints connected in each pose, as by PoseNet"""  # pylint: disable=pointless-string-statement
+SKELETON = [(0, 1), (0, 2), (1, 3), (2, 4), (5, 6), (5, 7), (7, 9), (6, 8), (8, 10),
+            (5, 11), (6, 12), (11, 12), (11, 13), (13, 15), (12, 14), (14, 16)]
+
+"""Defines the draw Nodes of each pipeline, in order"""  # pylint: disable=pointless-string-statement
+SEPARATE_NODES = [
+    'draw.bbox',
+    {'draw.tag': {'show': ['ids']}},
+    'draw.poses',
+    {'draw.legend': {'show': LEGEND}},
+    'custom_nodes.draw.yw_stats'
+]
+FUSED_NODES = [
+    {'custom_nodes.draw.yw_stats': {'draw': False}},
+    {'custom_nodes.draw.overlay': {'legend': LEGEND}}
+]
+
+
+def load_pipeline(nodes: List[Any]) -> List[Any]:
+    """Instantiates the given Nodes with their default configurations, updated by the given ones"""
+
+    loaded = []
+    for node in nodes:
+        node_name, config = (node, {}) if isinstance(node, str) else next(iter(node.items()))
+        if node_name.startswith('custom_nodes.'):
+            node_class = import_module(node_name).Node
+            loaded.append(node_class(pkd_base_dir=Path(CV_DIR, 'src', 'custom_nodes'), **config))
+        else:
+            loaded.append(import_module(f'peekingduck.pipeline.nodes.{node_name}').Node(**config))
+    return loaded
+
+
+def obtain_frames(num_people: int, num_frames: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Obtains the outputs of the Nodes before the draw Nodes on every frame"""
+
+    rng = np.random.default_rng(seed)
+    frames = obtain_trajectories(num_people, num_frames, 'missing', seed)
+    max_angles, min_angles, reps = {}, {}, {}
+    for i, frame in enumerate(frames):
+        keypoints, ids = frame['keypoints'], frame['obj_attrs']['ids']
+        detected = np.all(keypoints != -1, axis=-1)
+        frame['keypoint_conns'] = [np.array([keypoints[person, pair] for pair in SKELETON
+                                             if detected[person, pair[0]] and detected[person, pair[1]]])
+                                   for person in range(num_people)]
+        frame['keypoint_scores'] = np.where(detected, 0.9, 0.0)
+        frame['bbox_labels'] = np.array(['person'] * num_people)
+        frame['abs_bboxes'] = np.round(frame['bboxes'] * np.tile(IMG_SHAPE[1::-1], 2)).astype(int)
+        frame['bboxes'] = frame['bboxes'].astype(np.float32)
+
+        # Widen the range of motion of a person every few frames, and count a repetition every few seconds
+        for curr_id in ids:
+            if rng.random() < 0.1:
+                max_angles[curr_id] = min(max_angles.get(curr_id, 0.0) + rng.random() * 0.05, np.pi)
+                min_angles[curr_id] = max(min_angles.get(curr_id, np.pi) - rng.random() * 0.05, 0.0)
+            reps[curr_id] = reps.get(curr_id, 0) + ((i + 7 * curr_id) % 90 == 0)
+        frame.update({'max_angle': dict(max_angles), 'min_angle': dict(min_angles), 'reps': dict(reps),
+                      'fps': 30 + rng.random(), 'keyframe_interval': 3})
+    return frames
+
+
+def obtain_inputs(node: Any, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Obtains the inputs of a Node from the data of the pipeline, as the PeekingDuck runner does"""
+
+    if 'all' in node.inputs:
+        return copy.deepcopy(data)
+    inputs = {key: data[key] for key in node.inputs if key in data}
+    inputs.update({key: data[key] for key in getattr(node, 'optional_inputs', []) if key in data})
+    return inputs
+
+
+def time_pipeline(nodes: List[Any], frames: List[Dict[str, Any]], base: np.ndarray) -> Dict[str, Any]:
+    """Runs the Nodes on every frame drawn onto a fresh copy of the base image, timing only the Nodes"""
+
+    latencies = np.zeros(len(frames))
+    img = base.copy()
+    for i, frame in enumerate(frames):
+        np.copyto(img, base)
+        data = {**frame, 'img': img}
+        start = time.perf_counter()
+        for node in nodes:
+            data.update(node.run(obtain_inputs(node, data)))
+        latencies[i] = time.perf_counter() - start
+
+    latencies_us = latencies * 1e6
+    return {
+        'frames': len(frames),
+        'latency_us': {f'p{q}': float(np.percentile(latencies_us, q)) for q in (50, 95, 99)},
+        'mean_us': float(latencies_us.mean()),
+        'last_frame': data['img']
+    }
+
+
+def benchmark(num_people: int, num_frames: int) -> Dict[str, Any]:
+    """Times the separate draw Nodes and the overlay Node on the same frames"""
+
+    frames = obtain_frames(num_people, num_frames)
+    base = np.random.default_rng(1).integers(0, 256, IMG_SHAPE, dtype=np.uint8)
+    separate = time_pipeline(load_pipeline(SEPARATE_NODES), frames, base)
+    fused = time_pipeline(load_pipeline(FUSED_NODES), frames, base)
+
+    diff = np.abs(separate.pop('last_frame').astype(np.int16) - fused.pop('last_frame'))
+    return {
+        'separate': separate,
+        'fused': fused,
+        'different_pixels': int(np.count_nonzero(diff.any(axis=-1))),
+        'max_pixel_diff': int(diff.max())
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the separate draw Nodes against the fused overlay Node.')
+    parser.add_argument('--people', type=int, nargs='+', default=PEOPLE, help='numbers of people on every frame')
+    parser.add_argument('--frames', type=int, default=300, help='number of frames to draw per pipeline')
+    parser.add_argument('--output', help='path of the JSON file to save the results to')
+    args = parser.parse_args()
+
+    # Load the custom Nodes as PeekingDuck does from the cv directory
+    os.chdir(CV_DIR)
+    sys.path.insert(0, os.path.join(CV_DIR, 'src'))
+    results: Dict[str, Any] = {}
+    for people in args.people:
+        results[f'{people}_people'] = result = benchmark(people, args.frames)
+        print(f"{people:>3} people: {result['separate']['latency_us']['p50']:8.1f} us per frame with the separate "
+              f"Nodes, {result['fused']['latency_us']['p50']:8.1f} us with the overlay Node "
+              f"({result['different_pixels']} pixels differ, by at most {result['max_pixel_diff']})")
+
+    if args.output:
+        environment = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine()}
+        with open(os.path.join(ROOT_DIR, args.output), 'w', encoding='utf-8') as file:
+            json.dump({'environment': environment, 'results': results}, file, indent=2)
@@ -0,0 +1,137 @@
+"""Docstring for the benchmarks/draw_stats.py script
+
+This script compares the per-frame time taken by `display_stats()` to draw the score and repetitions
+of every person, when every label is rasterised with `cv2.putText` as before, against when the labels
+are blended from the text sprite cache of the draw/utils.py script.
+
+The people stand in a grid on a 1080p frame, and their angles and repetitions change every few frames,
+so that the labels change as often as they would during a session. Both methods draw the same frames,
+and the largest difference between their pixels is reported.
+
+Usage
+-----
+Run from the root directory:
+
+```
+python benchmarks/draw_stats.py --people 1 5 20 --frames 600 --output draw_stats.json
+```
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+
+# Define constants
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMG_SHAPE = (1080, 1920, 3)
+PEOPLE = [1, 5, 20]
+
+sys.path.insert(0, os.path.join(ROOT_DIR, 'cv', 'src'))
+
+
+def obtain_frames(num_people: int, num_frames: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Obtains the inputs of `display_stats()` on every frame, for people standing in a grid"""
+
+    rng = np.random.default_rng(seed)
+    cols = int(np.ceil(np.sqrt(num_people)))
+    cell_width, cell_height = IMG_SHAPE[1] // cols, IMG_SHAPE[0] // cols
+    ids = list(range(num_people))
+    bboxes = [(col * cell_width + 20, row * cell_height + 80, (col + 1) * cell_width - 20, (row + 1) * cell_height)
+              for row, col in (divmod(i, cols) for i in ids)]
+
+    # Widen the range of motion of a person every few frames, and count a repetition every few seconds
+    max_angles, min_angles, reps = {i: 0.0 for i in ids}, {i: np.pi for i in ids}, {i: 0 for i in ids}
+    frames = []
+    for frame in range(num_frames):
+        for curr_id in ids:
+            if rng.random() < 0.1:
+                max_angles[curr_id] = min(max_angles[curr_id] + rng.random() * 0.05, np.pi)
+                min_angles[curr_id] = max(min_angles[curr_id] - rng.random() * 0.05, 0.0)
+            reps[curr_id] += (frame + 7 * curr_id) % 90 == 0
+        frames.append({'all_ids': ids, 'bboxes': bboxes, 'max_angles': dict(max_angles),
+                       'min_angles': dict(min_angles), 'reps': dict(reps)})
+    return frames
+
+
+def put_text(img, abs_x: int, abs_y: int, text: str, font_colour, **_) -> None:
+    """Rasterises the text straight onto the image, as `display_text()` did before the sprite cache"""
+
+    import cv2  # pylint: disable=import-outside-toplevel
+
+    cv2.putText(img, text, (abs_x, abs_y), cv2.FONT_HERSHEY_SIMPLEX, 1, font_colour, 2)  # pylint: disable=no-member
+
+
+def time_frames(draw: Callable[..., Any], frames: List[Dict[str, Any]], base: np.ndarray) -> Dict[str, Any]:
+    """Draws every frame onto a fresh copy of the base image, timing only the drawing"""
+
+    latencies = np.zeros(len(frames))
+    img = base.copy()
+    for i, frame in enumerate(frames):
+        np.copyto(img, base)
+        start = time.perf_counter()
+        draw(img, angle_range=np.pi, **frame)
+        latencies[i] = time.perf_counter() - start
+
+    latencies_us = latencies * 1e6
+    return {
+        'frames': len(frames),
+        'latency_us': {f'p{q}': float(np.percentile(latencies_us, q)) for q in (50, 95, 99)},
+        'mean_us': float(latencies_us.mean()),
+        'last_frame': img
+    }
+
+
+def benchmark(num_people: int, num_frames: int) -> Dict[str, Any]:
+    """Times `display_stats()` with `cv2.putText` and with the text sprite cache on the same frames"""
+
+    from custom_nodes.draw import utils  # pylint: disable=import-outside-toplevel
+
+    frames = obtain_frames(num_people, num_frames)
+    base = np.random.default_rng(1).integers(0, 256, IMG_SHAPE, dtype=np.uint8)
+
+    # Swap the sprite cache out for the direct rasterisation, then back in with an empty cache
+    cached_display_text = utils.display_text
+    utils.display_text = put_text
+    try:
+        before = time_frames(utils.display_stats, frames, base)
+    finally:
+        utils.display_text = cached_display_text
+    utils.sprite_cache = utils.SpriteCache()
+    after = time_frames(utils.display_stats, frames, base)
+
+    max_diff = int(np.abs(before.pop('last_frame').astype(np.int16) - after.pop('last_frame')).max())
+    return {
+        'put_text': before,
+        'sprite_cache': {**after, 'hit_rate': utils.sprite_cache.hits /
+                         max(utils.sprite_cache.hits + utils.sprite_cache.misses, 1)},
+        'max_pixel_diff': max_diff
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare cv2.putText against the text sprite cache in the stats Nodes.'
+    )
+    parser.add_argument('--people', type=int, nargs='+', default=PEOPLE, help='numbers of people on every frame')
+    parser.add_argument('--frames', type=int, default=600, help='number of frames to draw per method')
+    parser.add_argument('--output', help='path of the JSON file to save the results to')
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    for people in args.people:
+        results[f'{people}_people'] = result = benchmark(people, args.frames)
+        print(f"{people:>3} people: {result['put_text']['latency_us']['p50']:8.1f} us per frame with cv2.putText, "
+              f"{result['sprite_cache']['latency_us']['p50']:8.1f} us with the sprite cache "
+              f"({result['sprite_cache']['hit_rate']:.1%} hits, max pixel difference {result['max_pixel_diff']})")
+
+    if args.output:
+        environment = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine()}
+        with open(os.path.join(ROOT_DIR, args.output), 'w', encoding='utf-8') as file:
+            json.dump({'environment': environment, 'results': results}, file, indent=2)
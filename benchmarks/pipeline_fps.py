@@ -0,0 +1,136 @@
+"""Docstring for the benchmarks/pipeline_fps.py script
+
+This script compares the throughput and per-frame latency of the following chains of Nodes, see `CHAINS`:
+
+- yolo_posenet - YOLO detects and dabble.tracking tracks the people, and PoseNet estimates their poses
+- pose_only - PoseNet estimates the poses, and its bounding boxes are tracked by the pose_tracking custom Node
+- crop_pose - as pose_only, with PoseNet run on the crop around each tracked person by the crop_posenet Node
+- keyframe_pose - as crop_pose, with poses only estimated every few frames by the keyframe_posenet Node
+
+Every chain ends with the same stretch analysis Nodes; drawing and output Nodes are
+left out as they are identical in every chain.
+
+Usage
+-----
+Run from the root directory, preferably on a recorded video so every chain sees the same frames:
+
+```
+python benchmarks/pipeline_fps.py --source path/to/video.mp4 --frames 300 --output pipeline_fps.json
+```
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import yaml
+
+
+# Define constants
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CV_DIR = os.path.join(ROOT_DIR, 'cv')
+ANALYSIS_NODES = [
+    'custom_nodes.dabble.pose_features',
+    'custom_nodes.dabble.yw_stretch'
+]
+CHAINS = {
+    'yolo_posenet': [
+        {'model.yolo': {'score_threshold': 0.6}},
+        'dabble.tracking',
+        {'model.posenet': {'score_threshold': 0.6}},
+        *ANALYSIS_NODES
+    ],
+    'pose_only': [
+        {'model.posenet': {'score_threshold': 0.6}},
+        'custom_nodes.dabble.pose_tracking',
+        *ANALYSIS_NODES
+    ],
+    'crop_pose': [
+        {'custom_nodes.model.crop_posenet': {'score_threshold': 0.6}},
+        'custom_nodes.dabble.pose_tracking',
+        *ANALYSIS_NODES
+    ],
+    'keyframe_pose': [
+        {'custom_nodes.model.keyframe_posenet': {'pose_model': {'score_threshold': 0.6}}},
+        'custom_nodes.dabble.pose_tracking',
+        *ANALYSIS_NODES
+    ]
+}
+
+
+def load_pipeline(source: Any, nodes: List[Any]):
+    """Loads a PeekingDuck pipeline reading from the given source, followed by the given Nodes"""
+
+    from peekingduck.runner import Runner  # pylint: disable=import-outside-toplevel
+
+    input_node = {'input.visual': {'source': source, 'resize': {'do_resizing': True, 'width': 1920, 'height': 1080}}}
+    with tempfile.NamedTemporaryFile('w', suffix='.yml', dir=CV_DIR, delete=False) as file:
+        yaml.safe_dump({'nodes': [input_node, *nodes]}, file)
+    try:
+        return Runner(pipeline_path=Path(file.name), config_updates_cli='None',
+                      custom_nodes_parent_subdir='src').pipeline
+    finally:
+        os.remove(file.name)
+
+
+def benchmark(pipeline, num_frames: int, num_warmup: int) -> Dict[str, Any]:
+    """Runs the pipeline and times every Node except the input Node
+
+    Returns
+    -------
+    dict
+        Frames per second, percentiles of the per-frame latency and mean latency of each Node, in milliseconds.
+    """
+
+    input_node, *nodes = pipeline.nodes
+    node_times = np.zeros((num_frames, len(nodes)))
+    num_timed = 0
+    for frame in range(num_warmup + num_frames):
+        data = input_node.run({})
+        if data.get('pipeline_end', False):
+            break
+        for i, node in enumerate(nodes):
+            start = time.perf_counter()
+            data.update(node.run({key: data[key] for key in node.inputs if key in data}))
+            if frame >= num_warmup:
+                node_times[frame - num_warmup, i] = time.perf_counter() - start
+        num_timed = max(frame - num_warmup + 1, 0)
+
+    node_times = node_times[:num_timed] * 1000
+    frame_times = node_times.sum(axis=1)
+    return {
+        'frames': num_timed,
+        'fps': float(num_timed / frame_times.sum() * 1000) if num_timed else 0.0,
+        'latency_ms': {f'p{q}': float(np.percentile(frame_times, q)) if num_timed else 0.0 for q in (50, 95, 99)},
+        'node_latency_ms': {node.node_name: float(node_times[:, i].mean()) if num_timed else 0.0
+                            for i, node in enumerate(nodes)}
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the throughput of the pose estimation chains.')
+    parser.add_argument('--source', default='0', help='webcam index or path to a video file')
+    parser.add_argument('--frames', type=int, default=300, help='number of frames to time per chain')
+    parser.add_argument('--warmup', type=int, default=10, help='number of untimed frames per chain')
+    parser.add_argument('--output', help='path of the JSON file to save the results to')
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else os.path.abspath(args.source)
+    os.chdir(CV_DIR)
+    sys.path.insert(0, os.path.join(CV_DIR, 'src'))
+
+    results = {}
+    for name, chain in CHAINS.items():
+        results[name] = benchmark(load_pipeline(source, chain), args.frames, args.warmup)
+        print(f"{name:>14}: {results[name]['fps']:6.1f} fps, "
+              f"p50 {results[name]['latency_ms']['p50']:6.1f} ms, p95 {results[name]['latency_ms']['p95']:6.1f} ms")
+
+    if args.output:
+        with open(os.path.join(ROOT_DIR, args.output), 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,132 @@
+"""Docstring for the benchmarks/pose_server_throughput.py script
+
+This script compares the aggregate throughput of pose estimation over several concurrent streams
+when every stream loads its own PoseNet model, against when the streams share the batched pose server.
+
+Each stream is simulated by its own process, as each pipeline of the orchestrator is,
+and estimates the poses on the same frames of the given source.
+
+Usage
+-----
+Run from the root directory, preferably on a recorded video so every run sees the same frames:
+
+```
+python benchmarks/pose_server_throughput.py --source path/to/video.mp4 --streams 1 2 4 8 --output pose_server.json
+```
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+# Define constants
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'cv', 'src'))
+
+
+def load_frames(source: str, num_frames: int, tile_width: int, tile_height: int) -> np.ndarray:
+    """Loads the given number of frames from a video file, downscaled to the tile size, or random frames if not given"""
+
+    import cv2  # pylint: disable=import-outside-toplevel
+
+    frames = []
+    if source:
+        capture = cv2.VideoCapture(source)
+        while len(frames) < num_frames:
+            success, frame = capture.read()
+            if not success:
+                break
+            frames.append(cv2.resize(frame, (tile_width, tile_height), interpolation=cv2.INTER_AREA))
+        capture.release()
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = list(rng.integers(0, 256, (num_frames, tile_height, tile_width, 3), dtype=np.uint8))
+    return np.array(frames)
+
+
+def run_stream(mode: str, frames: np.ndarray, port: int, start_at: float) -> float:
+    """Estimates the poses of every frame with its own model or on the pose server, returning the seconds taken"""
+
+    # pylint: disable=import-outside-toplevel
+    from custom_nodes.model.utils import POSE_HOST, recv_poses, send_frame
+
+    if mode == 'per_stream':
+        from peekingduck.pipeline.nodes.model import posenet
+        height, width = frames.shape[1:3]
+        model = posenet.Node(resolution={'height': height, 'width': width}, score_threshold=0.6)
+        model.run({'img': frames[0]})
+    else:
+        sock = socket.create_connection((POSE_HOST, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # Start every stream at the same time, once all the models are loaded
+    time.sleep(max(start_at - time.time(), 0))
+    start = time.perf_counter()
+    for frame in frames:
+        if mode == 'per_stream':
+            model.run({'img': frame})
+        else:
+            send_frame(sock, frame)
+            recv_poses(sock)
+    return time.perf_counter() - start
+
+
+def benchmark(mode: str, frames: np.ndarray, num_streams: int, port: int, setup_seconds: float) -> Dict[str, Any]:
+    """Runs the given number of concurrent streams, and summarises their aggregate throughput"""
+
+    with multiprocessing.get_context('spawn').Pool(num_streams) as pool:
+        start_at = time.time() + setup_seconds
+        seconds = pool.starmap(run_stream, [(mode, frames, port, start_at)] * num_streams)
+    return {
+        'streams': num_streams,
+        'frames': num_streams * len(frames),
+        'fps': num_streams * len(frames) / max(seconds),
+        'fps_per_stream': float(np.mean([len(frames) / elapsed for elapsed in seconds]))
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-stream PoseNet models against the batched pose server.')
+    parser.add_argument('--source', default='', help='path to a video file; random frames are used if not given')
+    parser.add_argument('--streams', type=int, nargs='+', default=[1, 2, 4], help='numbers of concurrent streams')
+    parser.add_argument('--frames', type=int, default=100, help='number of frames per stream')
+    parser.add_argument('--max-wait-ms', type=float, default=10.0)
+    parser.add_argument('--tile-width', type=int, default=225)
+    parser.add_argument('--tile-height', type=int, default=225)
+    parser.add_argument('--port', type=int, default=9254, help='TCP port of the pose server started by the benchmark')
+    parser.add_argument('--setup-seconds', type=float, default=30.0,
+                        help='number of seconds given to every stream to load its model before starting')
+    parser.add_argument('--output', help='path of the JSON file to save the results to')
+    args = parser.parse_args()
+
+    from pose_server import PoseServer  # pylint: disable=import-outside-toplevel
+
+    test_frames = load_frames(args.source, args.frames, args.tile_width, args.tile_height)
+    results: Dict[str, List[Dict[str, Any]]] = {'per_stream': [], 'pose_server': []}
+    for streams in args.streams:
+        results['per_stream'].append(benchmark('per_stream', test_frames, streams, args.port, args.setup_seconds))
+
+        # The batch of the server fits exactly one frame of every stream
+        server = PoseServer(port=args.port, max_batch_size=streams, max_wait_ms=args.max_wait_ms,
+                            tile_width=args.tile_width, tile_height=args.tile_height)
+        server.start()
+        results['pose_server'].append(benchmark('pose_server', test_frames, streams, args.port, 5.0))
+        results['pose_server'][-1]['batching'] = server.stats()
+        server.shutdown()
+
+        print(f"{streams:>3} streams: {results['per_stream'][-1]['fps']:6.1f} fps with a model per stream, "
+              f"{results['pose_server'][-1]['fps']:6.1f} fps with the pose server "
+              f"({results['pose_server'][-1]['batching']})")
+
+    if args.output:
+        with open(os.path.join(ROOT_DIR, args.output), 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
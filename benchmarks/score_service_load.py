@@ -0,0 +1,185 @@
+"""Docstring for the benchmarks/score_service_load.py script
+
+This script load-tests the score service with many concurrent simulated sessions.
+
+Each simulated session starts, sends a number of score updates for a few people, reads its live scores,
+then finishes and checks that its final score matches the scores it sent. All sessions run concurrently.
+
+By default, requests are sent to the ASGI application in-process, measuring the service alone.
+With `--url`, they are sent over HTTP/1.1 keep-alive connections to a running server instead.
+
+Usage
+-----
+Run from the root directory:
+
+```
+python benchmarks/score_service_load.py --sessions 500 --updates 50
+uvicorn score_service:app --port 8000 &
+python benchmarks/score_service_load.py --sessions 500 --updates 50 --url http://127.0.0.1:8000
+```
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+# Define constants
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+"""Type-hinting alias for a function sending a request
+
+It returns the status and JSON response of the request.
+"""  # pylint: disable=pointless-string-statement
+Request = Callable[[str, str, Optional[Dict[str, Any]]], Awaitable[Tuple[int, Dict[str, Any]]]]
+
+
+def asgi_client(app: Any) -> Callable[[], Awaitable[Request]]:
+    """Returns a factory of clients calling the given ASGI application in-process"""
+
+    async def connect() -> Request:
+
+        async def request(method: str, path: str, payload: Optional[Dict[str, Any]] = None):
+            body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            response: Dict[str, Any] = {}
+
+            async def receive() -> Dict[str, Any]:
+                return messages.pop()
+
+            async def send(message: Dict[str, Any]) -> None:
+                if message['type'] == 'http.response.start':
+                    response['status'] = message['status']
+                else:
+                    response['body'] = message['body']
+
+            await app({'type': 'http', 'method': method, 'path': path}, receive, send)
+            return response['status'], json.loads(response['body'])
+
+        return request
+
+    return connect
+
+
+def http_client(url: str) -> Callable[[], Awaitable[Request]]:
+    """Returns a factory of clients, each sending requests over its own HTTP/1.1 keep-alive connection"""
+
+    parts = urlsplit(url)
+
+    async def connect() -> Request:
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+
+        async def request(method: str, path: str, payload: Optional[Dict[str, Any]] = None):
+            body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+            writer.write(f'{method} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+                         f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            return status, json.loads(await reader.readexactly(length))
+
+        return request
+
+    return connect
+
+
+async def simulate_session(
+        connect: Callable[[], Awaitable[Request]],
+        num_updates: int,
+        latencies: List[float],
+        rng: random.Random
+) -> bool:
+    """Simulates a single session, returning whether its final score is correct"""
+
+    request = await connect()
+
+    async def timed(method: str, path: str, payload: Optional[Dict[str, Any]] = None):
+        start = time.perf_counter()
+        result = await request(method, path, payload)
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    status, response = await timed('POST', '/sessions', {})
+    if status != 201:
+        return False
+    session = response['session']
+
+    # Send increasing scores for a few people, as the pipeline does
+    max_scores: Dict[int, int] = {}
+    num_people = rng.randint(1, 3)
+    for _ in range(num_updates):
+        updates = [{'id': curr_id, 'score': rng.randint(0, 100), 'reps': rng.randint(0, 10)}
+                   for curr_id in range(num_people)]
+        for update in updates:
+            max_scores[update['id']] = max(max_scores.get(update['id'], 0), update['score'])
+        await timed('POST', f'/sessions/{session}/updates', {'updates': updates})
+        await asyncio.sleep(0)
+
+    await timed('GET', f'/sessions/{session}')
+    status, response = await timed('POST', f'/sessions/{session}/finish')
+    return status == 200 and response['score'] == sum(max_scores.values())
+
+
+async def load_test(
+        connect: Callable[[], Awaitable[Request]],
+        num_sessions: int,
+        num_updates: int,
+        seed: int
+) -> Dict[str, Any]:
+    """Runs the given number of concurrent sessions, and summarises their throughput and latency"""
+
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    start = time.perf_counter()
+    results = await asyncio.gather(*(simulate_session(connect, num_updates, latencies, rng)
+                                     for _ in range(num_sessions)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'sessions': num_sessions,
+        'requests': len(latencies),
+        'failed_sessions': sum(result is not True for result in results),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'latency_ms': {f'p{q}': float(np.percentile(latencies_ms, q)) if len(latencies) else 0.0
+                       for q in (50, 95, 99)}
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test the score service with concurrent sessions.')
+    parser.add_argument('--sessions', type=int, default=500, help='number of concurrent sessions')
+    parser.add_argument('--updates', type=int, default=50, help='number of score updates per session')
+    parser.add_argument('--url', help='URL of a running score service; tests in-process if not given')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='path of the JSON file to save the results to')
+    args = parser.parse_args()
+
+    if args.url:
+        client = http_client(args.url)
+    else:
+        sys.path.insert(0, ROOT_DIR)
+        from score_service import ScoreService  # pylint: disable=import-outside-toplevel
+        client = asgi_client(ScoreService())
+
+    summary = asyncio.run(load_test(client, args.sessions, args.updates, args.seed))
+    print(f"{summary['sessions']} sessions, {summary['requests']} requests in {summary['seconds']:.2f} s: "
+          f"{summary['requests_per_second']:.0f} requests/s, p50 {summary['latency_ms']['p50']:.2f} ms, "
+          f"p99 {summary['latency_ms']['p99']:.2f} ms, {summary['failed_sessions']} failed sessions")
+
+    if args.output:
+        with open(os.path.join(ROOT_DIR, args.output), 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2)
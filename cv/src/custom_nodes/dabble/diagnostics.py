@@ -0,0 +1,159 @@
+"""Docstring for the dabble/diagnostics.py script
+
+This script implements the diagnostics of the stretch state machines, which reject the poses of people
+that are not in a valid position to be analysed on every frame, most of the time between repetitions.
+
+Every rejection is counted per reason and per tracked person, so that the counts can be queried
+at the end of a session with `summary()`. Once a person is evicted from the state of the stretch,
+their counts are folded into the totals of each reason with `archive()`, so that the counts stay bounded
+by the people being tracked however long the pipeline runs.
+
+Each person is only logged about each reason at most once every `interval` seconds, with the number
+of rejections since, and the messages are only formatted by the logger if they are emitted;
+nothing is done per person unless a pose is rejected.
+
+Usage
+-----
+This script is not meant to be used independently.
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+import numpy as np
+
+
+"""Defines the description of each rejection reason, as logged"""  # pylint: disable=pointless-string-statement
+REASONS = {
+    'elbow_angle_error': 'either one or both the calculated elbow angles has returned an error',
+    'neck_angle_error': 'either one or both the calculated neck angles has returned an error',
+    'hip_angle_error': 'either one or both the calculated hip angles has returned an error',
+    'arm_position': 'either left or right arm is not in a valid position'
+}
+
+"""Defines the number of rate-limited (reason, ID) pairs to keep
+
+The expired pairs are dropped once there are more.
+"""  # pylint: disable=pointless-string-statement
+MAX_LIMITS = 1024
+
+
+class Diagnostics:
+    """Counts the rejection reasons of every tracked person, logging each at most once per interval"""
+
+    def __init__(
+            self,
+            logger: logging.Logger,
+            interval: float = 10.0,
+            clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Initialises the diagnostics
+
+        Parameters
+        ----------
+        logger : logging.Logger
+            Logger of the Node hosting the state machine
+        interval : float, default=10.0
+            Minimum number of seconds between two logs of the same reason for the same person
+        clock : callable, default=time.monotonic
+            Function returning the current time in seconds
+        """
+
+        self.logger = logger
+        self.interval = interval
+        self.clock = clock
+
+        # Implement trackers
+        self.counts: Dict[str, Dict[Any, int]] = {reason: {} for reason in REASONS}
+        self.archived: Dict[str, Dict[str, int]] = {reason: {'rejections': 0, 'people': 0} for reason in REASONS}
+        self._limits: Dict[Tuple[str, Any], Tuple[float, int]] = {}
+
+    def reject(
+            self,
+            reason: str,
+            ids: Sequence[Any],
+            rejected: np.ndarray,
+            level: int = logging.INFO
+    ) -> None:
+        """Counts the given reason for every rejected pose, logging it for each person if it is due
+
+        Parameters
+        ----------
+        reason : str
+            Key of `REASONS`
+        ids : sequence
+            Tracking IDs of the poses
+        rejected : numpy.ndarray
+            Boolean mask of the rejected poses, of shape (N,)
+        level : int, default=logging.INFO
+            Level to log the rejections at
+        """
+
+        if not rejected.any():
+            return
+
+        counts = self.counts[reason]
+        enabled = self.logger.isEnabledFor(level)
+        now = self.clock()
+        for i in np.flatnonzero(rejected[:len(ids)]).tolist():
+            curr_id = ids[i]
+            counts[curr_id] = counts.get(curr_id, 0) + 1
+            if not enabled:
+                continue
+
+            # Only log the person once per interval, with the number of rejections since the last log
+            last_logged, suppressed = self._limits.get((reason, curr_id), (None, 0))
+            if last_logged is not None and now - last_logged < self.interval:
+                self._limits[reason, curr_id] = (last_logged, suppressed + 1)
+                continue
+            self.logger.log(level, 'Person %s: %s (%d rejections since the last log).',
+                            curr_id, REASONS[reason], suppressed + 1)
+            self._limits[reason, curr_id] = (now, 0)
+
+        # Drop the pairs that are no longer rate-limited, so that people who have left are forgotten
+        if len(self._limits) > MAX_LIMITS:
+            self._limits = {key: limit for key, limit in self._limits.items() if now - limit[0] < self.interval}
+
+    def archive(
+            self,
+            curr_id: Any
+    ) -> None:
+        """Folds the counts of an evicted person into the totals of each reason, and forgets the person"""
+
+        for reason, counts in self.counts.items():
+            count = counts.pop(curr_id, 0)
+            if count:
+                self.archived[reason]['rejections'] += count
+                self.archived[reason]['people'] += 1
+            self._limits.pop((reason, curr_id), None)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the number of rejections and people rejected for each reason,
+        and the counts of each person still being tracked"""
+
+        summary = {}
+        for reason, counts in self.counts.items():
+            archived = self.archived[reason]
+            if counts or archived['people']:
+                summary[reason] = {'rejections': archived['rejections'] + sum(counts.values()),
+                                   'people': archived['people'] + len(counts), 'per_person': dict(counts)}
+        return summary
+
+    def log_summary(self) -> None:
+        """Logs the number of rejections and people rejected for each reason"""
+
+        for reason, counts in self.summary().items():
+            self.logger.info('Rejected %d poses of %d people: %s.', counts['rejections'], counts['people'],
+                             REASONS[reason])
+
+    def clear(self) -> None:
+        """Clears the counts for the next session"""
+
+        self.counts = {reason: {} for reason in REASONS}
+        self.archived = {reason: {'rejections': 0, 'people': 0} for reason in REASONS}
+        self._limits.clear()
+
+
+if __name__ == '__main__':
+    pass
@@ -16,31 +16,141 @@ peekingduck run
 
 # pylint: disable=logging-format-interpolation
 
+import logging
 from math import pi
-from typing import Any, Mapping, Optional
+from typing import Any, Mapping, Optional, Sequence, Tuple
 
+import numpy as np
 from peekingduck.pipeline.nodes.abstract_node import AbstractNode
 
+from custom_nodes.dabble.diagnostics import Diagnostics
+from custom_nodes.dabble.state import ArchiveHook, PersonState, StateStore
 from custom_nodes.dabble.utils import (
-    Coord,
+    ANGLE_LEFT_HIP,
+    ANGLE_RIGHT_HIP,
     ERROR_OUTPUT,
     KP_LEFT_ELBOW,
     KP_LEFT_SHOULDER,
     KP_LEFT_WRIST,
-    KP_LEFT_HIP,
     KP_RIGHT_ELBOW,
     KP_RIGHT_SHOULDER,
     KP_RIGHT_WRIST,
-    KP_RIGHT_HIP,
-    angle_between_vectors_in_rad,
-    obtain_keypoint
+    NO_JOINT_ANGLES,
+    NO_KEYPOINTS
 )
 
 
-class Node(AbstractNode):
+class Stretch:
+    """Implements the state machine of the lat stretch for every tracked person"""
 
     _SETUP, _REST, _LEAN = range(3)
 
+    def __init__(
+            self,
+            logger: logging.Logger,
+            ttl: float = 60.0,
+            max_people: int = 64,
+            archive: Optional[ArchiveHook] = None,
+            diagnostics: Optional[Diagnostics] = None
+    ) -> None:
+        """Initialises the state machine
+
+        Parameters
+        ----------
+        logger : logging.Logger
+            Logger of the Node hosting the state machine
+        ttl : float, default=60.0
+            Number of seconds a person can go unseen before their state is evicted
+        max_people : int, default=64
+            Maximum number of people to keep the state of
+        archive : callable, optional
+            Hook called with the ID and final state of each person before they are evicted
+        diagnostics : Diagnostics, optional
+            Counts the rejected poses of every person; defaults to its own diagnostics on the given logger
+        """
+
+        self.logger = logger
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics(logger)
+
+        # Implement trackers
+        self.people = StateStore(pi / 2, ttl, max_people, archive)
+
+    def is_leaning(
+            self,
+            all_ids: Sequence[Any],
+            keypoints: np.ndarray,
+            joint_angles: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+
+        # Obtain the angles between each shoulder to hip and the other hip
+        left_angles = joint_angles[:, ANGLE_LEFT_HIP]
+        right_angles = joint_angles[:, ANGLE_RIGHT_HIP]
+        defined = (left_angles != ERROR_OUTPUT) & (right_angles != ERROR_OUTPUT)
+
+        # Needs debugging
+        self.diagnostics.reject('hip_angle_error', all_ids, ~defined, logging.WARNING)
+
+        # Sanity check for posture
+        # Check that the arms are raised
+        left_shoulder_y = keypoints[:, KP_LEFT_SHOULDER, 1]
+        right_shoulder_y = keypoints[:, KP_RIGHT_SHOULDER, 1]
+        raised = (keypoints[:, KP_LEFT_ELBOW, 1] <= left_shoulder_y) & \
+            (keypoints[:, KP_LEFT_WRIST, 1] <= left_shoulder_y) & \
+            (keypoints[:, KP_RIGHT_ELBOW, 1] <= right_shoulder_y) & \
+            (keypoints[:, KP_RIGHT_WRIST, 1] <= right_shoulder_y)
+        self.diagnostics.reject('arm_position', all_ids, ~raised)
+
+        # Check if either side has crossed the threshold for leaning
+        sway_threshold = 25 * pi / 180  # 25 deg
+        rest_threshold = 5 * pi / 180  # 5 deg
+        angles = np.maximum(np.abs(right_angles - pi / 2), np.abs(left_angles - pi / 2))
+        angle_diffs = np.abs(left_angles - right_angles)
+        return defined & raised, angle_diffs >= sway_threshold, angle_diffs <= rest_threshold, angles
+
+    def update(
+            self,
+            all_ids: Sequence[Any],
+            all_keypoints: np.ndarray,
+            joint_angles: np.ndarray
+    ) -> None:
+        """Updates the trackers with the poses detected in the current frame
+
+        Parameters
+        ----------
+        all_ids : sequence
+            Tracking IDs of the detected poses
+        all_keypoints : numpy.ndarray
+            Absolute keypoints of the detected poses, of shape (N, 17, 2)
+        joint_angles : numpy.ndarray
+            Joint angles of the detected poses, of shape (N, K)
+        """
+
+        # Compute the postures of every person at once
+        valid, leaning, resting, angles = self.is_leaning(all_ids, all_keypoints, joint_angles)
+
+        # Handle the detection of each person
+        for i, curr_id in enumerate(all_ids):
+
+            # Update the relevant IDs
+            person = self.people.get(curr_id)
+            if not valid[i]:
+                continue
+            curr_pos = person.curr_pos
+            if curr_pos != self._SETUP:
+                person.max_angle = max(person.max_angle, float(angles[i]))
+                person.min_angle = min(person.min_angle, float(angles[i]))
+            if curr_pos == self._REST and leaning[i]:
+                person.curr_pos = self._LEAN
+            elif curr_pos != self._REST and resting[i]:
+                person.reps += curr_pos == self._LEAN
+                person.curr_pos = self._REST
+
+        # Evict the people that have left
+        self.people.evict()
+
+
+class Node(AbstractNode):
+
     def __init__(
             self,
             config: Optional[Mapping[str, Any]] = None,
@@ -61,97 +171,19 @@ class Node(AbstractNode):
 
         super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
 
-        # Implement trackers
-        self.curr_pos = {}
-        self.max_angle = {}
-        self.min_angle = {}
-        self.reps = {}
+        # Implement the state machine
+        self.diagnostics = Diagnostics(self.logger, self.log_interval)
+        self.stretch = Stretch(self.logger, self.state_ttl, self.max_people, self.archive, self.diagnostics)
 
-    def is_leaning(
+    def archive(
             self,
-            id: Any,
-            left_elbow: Optional[Coord],
-            left_shoulder: Optional[Coord],
-            left_wrist: Optional[Coord],
-            left_hip: Optional[Coord],
-            right_elbow: Optional[Coord],
-            right_shoulder: Optional[Coord],
-            right_wrist: Optional[Coord],
-            right_hip: Optional[Coord]
-    ) -> bool:
-
-        # Check if keypoints are defined
-        if left_shoulder is None or \
-                left_hip is None or \
-                right_shoulder is None or \
-                right_hip is None:
-            return False
-
-        # Initialize coordinates
-        left_shoulder_x, left_shoulder_y = left_shoulder
-        right_shoulder_x, right_shoulder_y = right_shoulder
-        left_hip_x, left_hip_y = left_hip
-        right_hip_x, right_hip_y = right_hip
-
-        # Calculate relevant vectors
-        left_shoulder_hip_vec = (
-            left_shoulder_x - left_hip_x,
-            left_shoulder_y - left_hip_y
-        )
-        right_shoulder_hip_vec = (
-            right_shoulder_x - right_hip_x,
-            right_shoulder_y - right_hip_y
-        )
-        left_right_hip_vec = (
-            right_hip_x - left_hip_x,
-            right_hip_y - left_hip_y
-        )
-        right_left_hip_vec = (
-            left_hip_x - right_hip_x,
-            left_hip_y - right_hip_y
-        )
-
-        # Calculate the angle between left shoulder to left hip
-        left_angle = angle_between_vectors_in_rad(
-            *left_shoulder_hip_vec,
-            *left_right_hip_vec
-        )
-        # Calculate the angle between right shoulder to right hip
-        right_angle = angle_between_vectors_in_rad(
-            *right_shoulder_hip_vec,
-            *right_left_hip_vec
-        )
-        if left_angle == ERROR_OUTPUT or right_angle == ERROR_OUTPUT:
-            # Needs debugging
-            self.logger.warning(
-                'Either one or both the calculated angles has returned an error.' +
-                f'\nAngle calculated between left shoulder to left hip {left_shoulder_hip_vec} ' +
-                f'and left hip to right hip {left_right_hip_vec} is {left_angle} radians.' +
-                f'\nAngle calculated between right shoulder to right hip {right_shoulder_hip_vec} ' +
-                f'and right hip to left hip {right_left_hip_vec} is {right_angle} radians.'
-            )
-
-        # Sanity check for posture
-        # Check that the arms are raised, if defined
-        if (left_elbow and left_elbow[1] > left_shoulder_y) or \
-                (left_wrist and left_wrist[1] > left_shoulder_y) or \
-                (right_elbow and right_elbow[1] > right_shoulder_y) or \
-                (right_wrist and right_wrist[1] > right_shoulder_y):
-            self.logger.info(
-                'Either left or right arm is not in a valid position.' +
-                f'\nleft_elbow: {left_elbow}, left_wrist: {left_wrist}, right_elbow: {right_elbow}, right_wrist: {right_wrist}'
-            )
-            return False
+            curr_id: Any,
+            person: PersonState
+    ) -> None:
+        """Logs the final repetitions of a person before their state is evicted, and archives their rejections"""
 
-        # Check if either side has crossed the threshold for leaning
-        sway_threshold = 25 * pi / 180  # 25 deg
-        rest_threshold = 5 * pi / 180  # 5 deg
-        if self.curr_pos[id] != self._SETUP:
-            angle = max(abs(right_angle - pi / 2), abs(left_angle - pi / 2))
-            self.max_angle[id] = max(self.max_angle[id], angle)
-            self.min_angle[id] = min(self.min_angle[id], angle)
-        angle_diff = abs(left_angle - right_angle)
-        return angle_diff >= sway_threshold if self.curr_pos[id] == self._REST else angle_diff <= rest_threshold
+        self.logger.info('Person %s left after %d repetitions.', curr_id, person.reps)
+        self.diagnostics.archive(curr_id)
 
     def run(
             self,
@@ -164,9 +196,10 @@ class Node(AbstractNode):
         inputs : dict
             Dictionary with the following keys:
 
-            - 'img' - given image to be displayed
-            - 'keypoints' - keypoints from PoseNet model
-            - 'obj_attrs' - to obtain tracking IDs from PoseNet model
+            - 'abs_keypoints' - absolute keypoints from the pose_features Node
+            - 'joint_angles' - joint angles from the pose_features Node
+            - 'obj_attrs' - to obtain tracking IDs
+            - 'pipeline_end' - whether the pipeline has ended, to log the rejected poses of the run
 
         Returns
         -------
@@ -178,67 +211,38 @@ class Node(AbstractNode):
             - 'reps' - number of repetitions of current run
         """
 
+        # Log the rejected poses of the run once the pipeline has ended, without analysing any more frames
+        if inputs.get('pipeline_end', False):
+            self.diagnostics.log_summary()
+            return {
+                'max_angle': self.stretch.people.max_angle,
+                'min_angle': self.stretch.people.min_angle,
+                'reps': self.stretch.people.reps
+            }
+
         # Initialise error message
         error_msg = 'The input dictionary does not contain the {} key.'
 
         # Check if required inputs are in pipeline
-        if 'img' not in inputs:
-            # There must be an image to display
-            self.logger.error(error_msg.format("'img'"))
-            return {
-                'max_angle': {},
-                'min_angle': {},
-                'reps': {}
-            }
-        for key in ('keypoints', 'obj_attrs'):
+        for key in ('abs_keypoints', 'joint_angles', 'obj_attrs'):
             if key not in inputs:
                 # One or more metadata inputs are missing
                 self.logger.warning(error_msg.format(f"'{key}'"))
 
         # Get required inputs from pipeline
-        height, width, *_ = inputs['img'].shape
         all_ids = inputs.get('obj_attrs', {}).get('ids', [])
-        all_keypoints = inputs.get('keypoints', [])
+        all_keypoints = inputs.get('abs_keypoints', NO_KEYPOINTS)
+        joint_angles = inputs.get('joint_angles', NO_JOINT_ANGLES)
+        num_poses = min(len(all_ids), len(all_keypoints), len(joint_angles))
+        all_ids, all_keypoints, joint_angles = all_ids[:num_poses], all_keypoints[:num_poses], joint_angles[:num_poses]
 
-        # Handle the detection of each person
-        for curr_id, keypoints in zip(all_ids, all_keypoints):
-
-            # Store and display PoseNet keypoints
-            keypoint_list = [
-                obtain_keypoint(
-                    *keypoint.tolist(),
-                    img_width=width,
-                    img_height=height
-                ) \
-                for keypoint in keypoints
-            ]
-            relevant_keypoints = (
-                keypoint_list[KP_LEFT_ELBOW],
-                keypoint_list[KP_LEFT_SHOULDER],
-                keypoint_list[KP_LEFT_WRIST],
-                keypoint_list[KP_LEFT_HIP],
-                keypoint_list[KP_RIGHT_ELBOW],
-                keypoint_list[KP_RIGHT_SHOULDER],
-                keypoint_list[KP_RIGHT_WRIST],
-                keypoint_list[KP_RIGHT_HIP]
-            )
-
-            # Update the relevant IDs
-            if curr_id not in self.curr_pos:
-                self.curr_pos[curr_id] = self._SETUP
-                self.max_angle[curr_id] = 0
-                self.min_angle[curr_id] = pi / 2
-                self.reps[curr_id] = 0
-            if self.curr_pos[curr_id] == self._REST and self.is_leaning(curr_id, *relevant_keypoints):
-                self.curr_pos[curr_id] = self._LEAN
-            elif self.curr_pos[curr_id] != self._REST and self.is_leaning(curr_id, *relevant_keypoints):
-                self.reps[curr_id] += self.curr_pos[curr_id] == self._LEAN
-                self.curr_pos[curr_id] = self._REST
+        # Update the state machine of every person
+        self.stretch.update(all_ids, all_keypoints, joint_angles)
 
         return {
-            'max_angle': self.max_angle,
-            'min_angle': self.min_angle,
-            'reps': self.reps
+            'max_angle': self.stretch.people.max_angle,
+            'min_angle': self.stretch.people.min_angle,
+            'reps': self.stretch.people.reps
         }
 
 
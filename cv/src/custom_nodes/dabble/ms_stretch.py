@@ -16,26 +16,124 @@ peekingduck run
 
 # pylint: disable=logging-format-interpolation
 
+import logging
 from math import pi
-from typing import Any, Mapping, Optional
+from typing import Any, Mapping, Optional, Sequence, Tuple
 
+import numpy as np
 from peekingduck.pipeline.nodes.abstract_node import AbstractNode
 
+from custom_nodes.dabble.diagnostics import Diagnostics
+from custom_nodes.dabble.state import ArchiveHook, PersonState, StateStore
 from custom_nodes.dabble.utils import (
-    Coord,
+    ANGLE_LEFT_NECK,
+    ANGLE_RIGHT_NECK,
     ERROR_OUTPUT,
-    KP_NOSE,
-    KP_LEFT_SHOULDER,
-    KP_RIGHT_SHOULDER,
-    angle_between_vectors_in_rad,
-    obtain_keypoint
+    NO_JOINT_ANGLES,
+    NO_KEYPOINTS
 )
 
 
-class Node(AbstractNode):
+class Stretch:
+    """Implements the state machine of the middle scalene stretch for every tracked person"""
 
     _SETUP, _REST, _TILT = range(3)
 
+    def __init__(
+            self,
+            logger: logging.Logger,
+            ttl: float = 60.0,
+            max_people: int = 64,
+            archive: Optional[ArchiveHook] = None,
+            diagnostics: Optional[Diagnostics] = None
+    ) -> None:
+        """Initialises the state machine
+
+        Parameters
+        ----------
+        logger : logging.Logger
+            Logger of the Node hosting the state machine
+        ttl : float, default=60.0
+            Number of seconds a person can go unseen before their state is evicted
+        max_people : int, default=64
+            Maximum number of people to keep the state of
+        archive : callable, optional
+            Hook called with the ID and final state of each person before they are evicted
+        diagnostics : Diagnostics, optional
+            Counts the rejected poses of every person; defaults to its own diagnostics on the given logger
+        """
+
+        self.logger = logger
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics(logger)
+
+        # Implement trackers
+        self.people = StateStore(pi / 2, ttl, max_people, archive)
+
+    def is_tilting(
+            self,
+            all_ids: Sequence[Any],
+            joint_angles: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+
+        # Obtain the angles between each shoulder to the nose and the other shoulder
+        left_angles = joint_angles[:, ANGLE_LEFT_NECK]
+        right_angles = joint_angles[:, ANGLE_RIGHT_NECK]
+        valid = (left_angles != ERROR_OUTPUT) & (right_angles != ERROR_OUTPUT)
+
+        # Needs debugging
+        self.diagnostics.reject('neck_angle_error', all_ids, ~valid, logging.WARNING)
+
+        # Check if either side has crossed the threshold for resting/tilting
+        tilt_threshold = 25 * pi / 180  # 25 deg
+        rest_threshold = 5 * pi / 180  # 5 deg
+        angles = np.maximum(right_angles, left_angles)
+        angle_diffs = np.abs(left_angles - right_angles)
+        return valid, angle_diffs >= tilt_threshold, angle_diffs <= rest_threshold, angles
+
+    def update(
+            self,
+            all_ids: Sequence[Any],
+            all_keypoints: np.ndarray,
+            joint_angles: np.ndarray
+    ) -> None:
+        """Updates the trackers with the poses detected in the current frame
+
+        Parameters
+        ----------
+        all_ids : sequence
+            Tracking IDs of the detected poses
+        all_keypoints : numpy.ndarray
+            Absolute keypoints of the detected poses, of shape (N, 17, 2)
+        joint_angles : numpy.ndarray
+            Joint angles of the detected poses, of shape (N, K)
+        """
+
+        # Compute the tilts of every person at once
+        valid, tilting, resting, angles = self.is_tilting(all_ids, joint_angles)
+
+        # Handle the detection of each person
+        for i, curr_id in enumerate(all_ids):
+
+            # Update the relevant IDs
+            person = self.people.get(curr_id)
+            if not valid[i]:
+                continue
+            curr_pos = person.curr_pos
+            if curr_pos != self._SETUP:
+                person.max_angle = max(person.max_angle, float(angles[i]))
+                person.min_angle = min(person.min_angle, float(angles[i]))
+            if curr_pos == self._REST and tilting[i]:
+                person.curr_pos = self._TILT
+            elif curr_pos != self._REST and resting[i]:
+                person.reps += curr_pos == self._TILT
+                person.curr_pos = self._REST
+
+        # Evict the people that have left
+        self.people.evict()
+
+
+class Node(AbstractNode):
+
     def __init__(
             self,
             config: Optional[Mapping[str, Any]] = None,
@@ -56,78 +154,19 @@ class Node(AbstractNode):
 
         super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
 
-        # Implement trackers
-        self.curr_pos = {}
-        self.max_angle = {}
-        self.min_angle = {}
-        self.reps = {}
+        # Implement the state machine
+        self.diagnostics = Diagnostics(self.logger, self.log_interval)
+        self.stretch = Stretch(self.logger, self.state_ttl, self.max_people, self.archive, self.diagnostics)
 
-    def is_tilting(
+    def archive(
             self,
-            id: Any,
-            nose: Optional[Coord],
-            left_shoulder: Optional[Coord],
-            right_shoulder: Optional[Coord]
-    ) -> bool:
-
-        # Check if keypoints are defined
-        if left_shoulder is None or \
-                right_shoulder is None or \
-                nose is None:
-            return False
-
-        # Initialize coordinates
-        left_shoulder_x, left_shoulder_y = left_shoulder
-        right_shoulder_x, right_shoulder_y = right_shoulder
-        nose_x, nose_y = nose
-
-        # Calculate relevant vectors
-        left_shoulder_nose_vec = (
-            left_shoulder_x - nose_x,
-            left_shoulder_y - nose_y
-        )
-        right_shoulder_nose_vec = (
-            right_shoulder_x - nose_x,
-            right_shoulder_y - nose_y
-        )
-        left_right_shoulder_vec = (
-            right_shoulder_x - left_shoulder_x,
-            right_shoulder_y - left_shoulder_y
-        )
-        right_left_shoulder_vec = (
-            left_shoulder_x - right_shoulder_x,
-            left_shoulder_y - right_shoulder_y
-        )
-
-        # Calculate the angle between left shoulder to left hip
-        left_angle = angle_between_vectors_in_rad(
-            *left_shoulder_nose_vec,
-            *left_right_shoulder_vec
-        )
-        # Calculate the angle between right shoulder to right hip
-        right_angle = angle_between_vectors_in_rad(
-            *right_shoulder_nose_vec,
-            *right_left_shoulder_vec
-        )
-        if left_angle == ERROR_OUTPUT or right_angle == ERROR_OUTPUT:
-            # Needs debugging
-            self.logger.warning(
-                'Either one or both the calculated angles has returned an error.' +
-                f'\nAngle calculated between left shoulder to nose {left_shoulder_nose_vec} ' +
-                f'and left shoulder to right shoulder {left_right_shoulder_vec} is {left_angle} radians.' +
-                f'\nAngle calculated between right shoulder to nose {right_shoulder_nose_vec} ' +
-                f'and right shoulder to left shoulder {right_left_shoulder_vec} is {right_angle} radians.'
-            ) 
+            curr_id: Any,
+            person: PersonState
+    ) -> None:
+        """Logs the final repetitions of a person before their state is evicted, and archives their rejections"""
 
-        # Check if either side has crossed the threshold for resting/tilting
-        tilt_threshold = 25 * pi / 180  # 25 deg
-        rest_threshold = 5 * pi / 180  # 5 deg
-        if self.curr_pos[id] != self._SETUP:
-            angle = max(right_angle, left_angle)
-            self.max_angle[id] = max(self.max_angle[id], angle)
-            self.min_angle[id] = min(self.min_angle[id], angle)
-        angle_diff = abs(left_angle - right_angle)
-        return angle_diff >= tilt_threshold if self.curr_pos[id] == self._REST else angle_diff <= rest_threshold
+        self.logger.info('Person %s left after %d repetitions.', curr_id, person.reps)
+        self.diagnostics.archive(curr_id)
 
     def run(
             self,
@@ -140,9 +179,9 @@ class Node(AbstractNode):
         inputs : dict
             Dictionary with the following keys:
 
-            - 'img' - given image to be displayed
-            - 'keypoints' - keypoints from PoseNet model
-            - 'obj_attrs' - to obtain tracking IDs from PoseNet model
+            - 'joint_angles' - joint angles from the pose_features Node
+            - 'obj_attrs' - to obtain tracking IDs
+            - 'pipeline_end' - whether the pipeline has ended, to log the rejected poses of the run
 
         Returns
         -------
@@ -154,62 +193,37 @@ class Node(AbstractNode):
             - 'reps' - number of repetitions of current run
         """
 
+        # Log the rejected poses of the run once the pipeline has ended, without analysing any more frames
+        if inputs.get('pipeline_end', False):
+            self.diagnostics.log_summary()
+            return {
+                'max_angle': self.stretch.people.max_angle,
+                'min_angle': self.stretch.people.min_angle,
+                'reps': self.stretch.people.reps
+            }
+
         # Initialise error message
         error_msg = 'The input dictionary does not contain the {} key.'
 
         # Check if required inputs are in pipeline
-        if 'img' not in inputs:
-            # There must be an image to display
-            self.logger.error(error_msg.format("'img'"))
-            return {
-                'max_angle': {},
-                'min_angle': {},
-                'reps': {}
-            }
-        for key in ('keypoints', 'obj_attrs'):
+        for key in ('joint_angles', 'obj_attrs'):
             if key not in inputs:
                 # One or more metadata inputs are missing
                 self.logger.warning(error_msg.format(f"'{key}'"))
 
         # Get required inputs from pipeline
-        height, width, *_ = inputs['img'].shape
         all_ids = inputs.get('obj_attrs', {}).get('ids', [])
-        all_keypoints = inputs.get('keypoints', [])
+        joint_angles = inputs.get('joint_angles', NO_JOINT_ANGLES)
+        num_poses = min(len(all_ids), len(joint_angles))
+        all_ids, joint_angles = all_ids[:num_poses], joint_angles[:num_poses]
 
-        # Handle the detection of each person
-        for curr_id, keypoints in zip(all_ids, all_keypoints):
-
-            # Store and display PoseNet keypoints
-            keypoint_list = [
-                obtain_keypoint(
-                    *keypoint.tolist(),
-                    img_width=width,
-                    img_height=height
-                ) \
-                for keypoint in keypoints
-            ]
-            relevant_keypoints = (
-                keypoint_list[KP_NOSE],
-                keypoint_list[KP_LEFT_SHOULDER],
-                keypoint_list[KP_RIGHT_SHOULDER]
-            )
-
-            # Update the relevant IDs
-            if curr_id not in self.curr_pos:
-                self.curr_pos[curr_id] = self._SETUP
-                self.max_angle[curr_id] = 0
-                self.min_angle[curr_id] = pi / 2
-                self.reps[curr_id] = 0
-            if self.curr_pos[curr_id] == self._REST and self.is_tilting(curr_id, *relevant_keypoints):
-                self.curr_pos[curr_id] = self._TILT
-            elif self.curr_pos[curr_id] != self._REST and self.is_tilting(curr_id, *relevant_keypoints):
-                self.reps[curr_id] += self.curr_pos[curr_id] == self._TILT
-                self.curr_pos[curr_id] = self._REST
+        # Update the state machine of every person
+        self.stretch.update(all_ids, NO_KEYPOINTS, joint_angles)
 
         return {
-            'max_angle': self.max_angle,
-            'min_angle': self.min_angle,
-            'reps': self.reps
+            'max_angle': self.stretch.people.max_angle,
+            'min_angle': self.stretch.people.min_angle,
+            'reps': self.stretch.people.reps
         }
 
 
@@ -0,0 +1,215 @@
+"""Docstring for the multi_stretch.py module
+
+This module implements a custom dabble Node class for analysing a given pose against any of the supported stretches.
+
+The active stretch can be selected at runtime by sending one of the following commands
+as a UDP datagram to the control port on localhost:
+
+- 'arm', 'neck' or 'side' - selects the Y-W, middle scalene or lat stretch respectively
+- 'reset' - clears the trackers of the active stretch
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+# pylint: disable=logging-format-interpolation
+
+import socket
+from typing import Any, Mapping, Optional
+
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.dabble import lat_stretch, ms_stretch, yw_stretch
+from custom_nodes.dabble.diagnostics import Diagnostics
+from custom_nodes.dabble.state import PersonState
+from custom_nodes.dabble.utils import NO_JOINT_ANGLES, NO_KEYPOINTS
+
+
+"""Defines the state machine of each supported stretch"""  # pylint: disable=pointless-string-statement
+EXERCISES = {
+    'arm': yw_stretch.Stretch,
+    'neck': ms_stretch.Stretch,
+    'side': lat_stretch.Stretch
+}
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Implement the state machines of every stretch, sharing the counts of their rejected poses
+        self.diagnostics = Diagnostics(self.logger, self.log_interval)
+        self.stretches = {exercise: stretch(self.logger, self.state_ttl, self.max_people, self.archive,
+                                            self.diagnostics)
+                          for exercise, stretch in EXERCISES.items()}
+        if self.exercise not in EXERCISES:
+            self.logger.error(f"Unknown exercise '{self.exercise}'; defaulting to 'arm'.")
+            self.exercise = 'arm'
+
+        # Implement trackers
+        # Stretches that have analysed a frame since the last reset
+        self.used = set()
+
+        # Open the control channel, if enabled
+        self.control = None
+        if self.control_port:
+            try:
+                self.control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.control.bind(('127.0.0.1', self.control_port))
+                self.control.setblocking(False)
+            except OSError as error:
+                self.logger.error(f'Unable to open the control channel on port {self.control_port}: {error}')
+                self.control = None
+
+    def select(
+            self,
+            exercise: str,
+            reset: bool = False
+    ) -> bool:
+        """Selects the active stretch
+
+        Parameters
+        ----------
+        exercise : str
+            Stretch to select; one of 'arm', 'neck' or 'side'
+        reset : bool, default=False
+            Whether to clear the trackers of the selected stretch
+
+        Returns
+        -------
+        bool
+            Whether the stretch was selected.
+        """
+
+        if exercise not in EXERCISES:
+            self.logger.warning(f"Ignoring unknown exercise '{exercise}'.")
+            return False
+        if reset:
+            self.stretches[exercise].people.clear()
+        if exercise != self.exercise:
+            self.logger.info(f"Switching from exercise '{self.exercise}' to '{exercise}'.")
+            self.exercise = exercise
+        return True
+
+    def reset(self) -> None:
+        """Clears the trackers of every stretch and the counts of their rejected poses, as for a new session"""
+
+        for stretch in self.stretches.values():
+            stretch.people.clear()
+        self.diagnostics.clear()
+        self.used.clear()
+
+    def archive(
+            self,
+            curr_id: Any,
+            person: PersonState
+    ) -> None:
+        """Logs the final repetitions of a person before their state is evicted, and archives their rejections"""
+
+        self.logger.info('Person %s left after %d repetitions.', curr_id, person.reps)
+        self.diagnostics.archive(curr_id)
+
+    def _poll_control(self) -> None:
+
+        # Handle every pending command without blocking the pipeline
+        while self.control is not None:
+            try:
+                command = self.control.recv(64).decode('utf-8', errors='replace').strip().lower()
+            except BlockingIOError:
+                return
+            except OSError as error:
+                self.logger.error(f'Closing the control channel after an error: {error}')
+                self.control.close()
+                self.control = None
+                return
+            if command == 'reset':
+                self.select(self.exercise, reset=True)
+            else:
+                self.select(command)
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Returns the dictionary of the active stretch for each given pose
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'abs_keypoints' - absolute keypoints from the pose_features Node
+            - 'joint_angles' - joint angles from the pose_features Node
+            - 'obj_attrs' - to obtain tracking IDs
+
+        Returns
+        -------
+        dict
+            Dictionary with the following keys:
+
+            - 'exercise' - the active stretch
+            - 'max_angle' - maximum obtained angle from current run
+            - 'min_angle' - minimum obtained angle from current run
+            - 'reps' - number of repetitions of current run
+        """
+
+        # Handle any commands sent since the last frame
+        self._poll_control()
+
+        # Initialise error message
+        error_msg = 'The input dictionary does not contain the {} key.'
+
+        # Check if required inputs are in pipeline
+        for key in ('abs_keypoints', 'joint_angles', 'obj_attrs'):
+            if key not in inputs:
+                # One or more metadata inputs are missing
+                self.logger.warning(error_msg.format(f"'{key}'"))
+
+        # Get required inputs from pipeline
+        all_ids = inputs.get('obj_attrs', {}).get('ids', [])
+        all_keypoints = inputs.get('abs_keypoints', NO_KEYPOINTS)
+        joint_angles = inputs.get('joint_angles', NO_JOINT_ANGLES)
+        num_poses = min(len(all_ids), len(all_keypoints), len(joint_angles))
+        all_ids, all_keypoints, joint_angles = all_ids[:num_poses], all_keypoints[:num_poses], joint_angles[:num_poses]
+
+        # Update the state machine of the active stretch only
+        stretch = self.stretches[self.exercise]
+        self.used.add(self.exercise)
+        stretch.update(all_ids, all_keypoints, joint_angles)
+
+        return {
+            'exercise': self.exercise,
+            'max_angle': stretch.people.max_angle,
+            'min_angle': stretch.people.min_angle,
+            'reps': stretch.people.reps
+        }
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,105 @@
+"""Docstring for the pose_features.py module
+
+This module implements a custom dabble Node class for computing the pose features of every person once per frame.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+from typing import Any, Mapping, Optional
+
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.dabble.utils import (
+    obtain_bboxes,
+    obtain_joint_angles,
+    obtain_keypoints,
+    obtain_limb_vectors
+)
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Returns the absolute keypoints, limb vectors and joint angles of each given pose
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'img' - given image, to obtain its dimensions
+            - 'bboxes' - bounding boxes from PoseNet model
+            - 'keypoints' - keypoints from PoseNet model
+
+        Returns
+        -------
+        dict
+            Dictionary with the following keys:
+
+            - 'abs_bboxes' - bounding boxes in pixels, of shape (N, 4)
+            - 'abs_keypoints' - keypoints in pixels, of shape (N, 17, 2)
+            - 'limb_vectors' - limb vectors as defined by `LIMB_VECTORS`, of shape (N, L, 2)
+            - 'joint_angles' - joint angles as defined by `JOINT_ANGLES`, of shape (N, K)
+        """
+
+        # Initialise error message
+        error_msg = 'The input dictionary does not contain the {} key.'
+
+        # Check if required inputs are in pipeline
+        if 'img' not in inputs:
+            # There must be an image to obtain its dimensions
+            self.logger.error(error_msg.format("'img'"))
+            height = width = 0
+        else:
+            height, width, *_ = inputs['img'].shape
+        for key in ('bboxes', 'keypoints'):
+            if key not in inputs:
+                # One or more metadata inputs are missing
+                self.logger.warning(error_msg.format(f"'{key}'"))
+
+        # Compute the pose features of every person at once
+        abs_keypoints = obtain_keypoints(inputs.get('keypoints', []), width, height)
+        limb_vectors = obtain_limb_vectors(abs_keypoints)
+
+        return {
+            'abs_bboxes': obtain_bboxes(inputs.get('bboxes', []), width, height),
+            'abs_keypoints': abs_keypoints,
+            'limb_vectors': limb_vectors,
+            'joint_angles': obtain_joint_angles(limb_vectors)
+        }
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,167 @@
+"""Docstring for the pose_tracking.py module
+
+This module implements a custom dabble Node class for tracking the poses detected by PoseNet across frames.
+
+Each pose is matched to the tracked pose of the previous frames with the highest overlap of bounding boxes,
+such that a separate object detector and tracker are not required.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+from typing import Any, Mapping, Optional
+
+import numpy as np
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.dabble.utils import iou_matrix
+
+
+class Tracker:
+    """Assigns stable IDs to bounding boxes by greedily matching them on their IoU"""
+
+    def __init__(
+            self,
+            iou_threshold: float,
+            max_lost: int
+    ) -> None:
+        """Initialises the tracker
+
+        Parameters
+        ----------
+        iou_threshold : float
+            Minimum IoU for a bounding box to be matched to a track
+        max_lost : int
+            Number of consecutive frames a track can go unmatched before it is dropped
+        """
+
+        self.iou_threshold = iou_threshold
+        self.max_lost = max_lost
+
+        # Implement trackers
+        self.next_id = 0
+        self.ids = np.empty(0, dtype=int)
+        self.bboxes = np.empty((0, 4))
+        self.lost = np.empty(0, dtype=int)
+
+    def update(
+            self,
+            bboxes: np.ndarray
+    ) -> np.ndarray:
+        """Matches the bounding boxes of the current frame to the existing tracks
+
+        Parameters
+        ----------
+        bboxes : numpy.ndarray
+            Bounding boxes of shape (N, 4) detected in the current frame
+
+        Returns
+        -------
+        numpy.ndarray
+            Tracking IDs of shape (N,) of the given bounding boxes.
+        """
+
+        bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        num_tracks, num_bboxes = len(self.ids), len(bboxes)
+        ids = np.full(num_bboxes, -1, dtype=int)
+        matched = np.zeros(num_tracks, dtype=bool)
+
+        # Greedily match the pairs with the highest IoU first
+        if num_tracks and num_bboxes:
+            ious = iou_matrix(self.bboxes, bboxes)
+            for index in np.argsort(ious, axis=None)[::-1]:
+                track, bbox = divmod(int(index), num_bboxes)
+                if ious[track, bbox] < self.iou_threshold:
+                    break
+                if matched[track] or ids[bbox] >= 0:
+                    continue
+                matched[track] = True
+                ids[bbox] = self.ids[track]
+                self.bboxes[track] = bboxes[bbox]
+
+        # Age the unmatched tracks and drop the ones that have been lost for too long
+        self.lost = np.where(matched, 0, self.lost + 1)
+        keep = self.lost <= self.max_lost
+        self.ids, self.bboxes, self.lost = self.ids[keep], self.bboxes[keep], self.lost[keep]
+
+        # Start new tracks for the unmatched bounding boxes
+        unmatched = ids < 0
+        new_ids = np.arange(self.next_id, self.next_id + np.count_nonzero(unmatched))
+        self.next_id += len(new_ids)
+        ids[unmatched] = new_ids
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.bboxes = np.concatenate([self.bboxes, bboxes[unmatched]])
+        self.lost = np.concatenate([self.lost, np.zeros(len(new_ids), dtype=int)])
+
+        return ids
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Implement the tracker
+        self.tracker = Tracker(self.iou_threshold, self.max_lost)
+
+    def reset(self) -> None:
+        """Drops every track and restarts the tracking IDs, as for a new session"""
+
+        self.tracker = Tracker(self.iou_threshold, self.max_lost)
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Returns the tracking ID of each given pose
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'bboxes' - bounding boxes from PoseNet model
+
+        Returns
+        -------
+        dict
+            Dictionary with the following keys:
+
+            - 'obj_attrs' - dictionary with the tracking IDs under the 'ids' key
+        """
+
+        # Check if required inputs are in pipeline
+        if 'bboxes' not in inputs:
+            # One or more metadata inputs are missing
+            self.logger.warning("The input dictionary does not contain the 'bboxes' key.")
+
+        return {'obj_attrs': {'ids': self.tracker.update(inputs.get('bboxes', [])).tolist()}}
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,153 @@
+"""Docstring for the dabble/state.py script
+
+This script implements the bounded per-person state store shared by the stretch state machines.
+
+People are evicted once they have not been seen for `ttl` seconds, or when more than `max_people`
+are tracked, starting from the least recently seen person. The people seen since the previous eviction,
+i.e. on the current frame, are never evicted, so a crowded frame can briefly hold more than `max_people`.
+Before a person is evicted, their final state is passed to the archive hook, if any.
+
+Usage
+-----
+This script is not meant to be used independently.
+"""
+
+from collections import OrderedDict
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+
+
+class PersonState:
+    """Stores the state of the stretch of a single tracked person"""
+
+    __slots__ = ('curr_pos', 'max_angle', 'min_angle', 'reps', 'last_seen')
+
+    def __init__(
+            self,
+            min_angle: float,
+            last_seen: float
+    ) -> None:
+
+        self.curr_pos = 0
+        self.max_angle = 0.0
+        self.min_angle = min_angle
+        self.reps = 0
+        self.last_seen = last_seen
+
+    def __repr__(self) -> str:
+        return f'PersonState(curr_pos={self.curr_pos}, max_angle={self.max_angle:.3f}, ' \
+               f'min_angle={self.min_angle:.3f}, reps={self.reps})'
+
+
+"""Type-hinting alias for the archive hook of the store
+
+It is called with the ID and final state of each evicted person.
+"""  # pylint: disable=pointless-string-statement
+ArchiveHook = Callable[[Any, PersonState], None]
+
+
+class StateStore:
+    """Stores the state of every tracked person, evicting the people not seen for a while"""
+
+    def __init__(
+            self,
+            initial_min_angle: float,
+            ttl: float = 60.0,
+            max_people: int = 64,
+            archive: Optional[ArchiveHook] = None,
+            clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Initialises the state store
+
+        Parameters
+        ----------
+        initial_min_angle : float
+            Initial minimum angle of each new person, in radians
+        ttl : float, default=60.0
+            Number of seconds a person can go unseen before they are evicted
+        max_people : int, default=64
+            Maximum number of people to store; the least recently seen are evicted first
+        archive : callable, optional
+            Hook called with the ID and final state of each person before they are evicted
+        clock : callable, default=time.monotonic
+            Function returning the current time in seconds
+        """
+
+        self.initial_min_angle = initial_min_angle
+        self.ttl = ttl
+        self.max_people = max_people
+        self.archive = archive
+        self.clock = clock
+
+        # Order the people from the least to the most recently seen
+        self._people: 'OrderedDict[Any, PersonState]' = OrderedDict()
+        self._seen: Set[Any] = set()
+
+    def __len__(self) -> int:
+        return len(self._people)
+
+    def __contains__(self, curr_id: Any) -> bool:
+        return curr_id in self._people
+
+    def __iter__(self) -> Iterator[Tuple[Any, PersonState]]:
+        return iter(self._people.items())
+
+    def get(
+            self,
+            curr_id: Any
+    ) -> PersonState:
+        """Returns the state of the given person, creating it if the person is new, and marks them as seen"""
+
+        now = self.clock()
+        self._seen.add(curr_id)
+        person = self._people.get(curr_id)
+        if person is None:
+            person = self._people[curr_id] = PersonState(self.initial_min_angle, now)
+        else:
+            person.last_seen = now
+            self._people.move_to_end(curr_id)
+        return person
+
+    def evict(self) -> None:
+        """Evicts the people that have not been seen for too long, or that exceed the capacity of the store
+
+        Only the people not seen since the previous call are evicted, so this should be called once per frame.
+        """
+
+        expiry = self.clock() - self.ttl
+        while self._people:
+            curr_id, person = next(iter(self._people.items()))
+            if curr_id in self._seen or (person.last_seen >= expiry and len(self._people) <= self.max_people):
+                break
+            del self._people[curr_id]
+            if self.archive is not None:
+                self.archive(curr_id, person)
+        self._seen.clear()
+
+    def clear(self) -> None:
+        """Archives and evicts every person"""
+
+        people, self._people = self._people, OrderedDict()
+        self._seen.clear()
+        if self.archive is not None:
+            for curr_id, person in people.items():
+                self.archive(curr_id, person)
+
+    @property
+    def max_angle(self) -> Dict[Any, float]:
+        """Maximum obtained angle of each stored person"""
+        return {curr_id: person.max_angle for curr_id, person in self._people.items()}
+
+    @property
+    def min_angle(self) -> Dict[Any, float]:
+        """Minimum obtained angle of each stored person"""
+        return {curr_id: person.min_angle for curr_id, person in self._people.items()}
+
+    @property
+    def reps(self) -> Dict[Any, int]:
+        """Number of repetitions of each stored person"""
+        return {curr_id: person.reps for curr_id, person in self._people.items()}
+
+
+if __name__ == '__main__':
+    pass
@@ -12,7 +12,9 @@ This script is not meant to be used independently.
 
 from math import acos, sqrt
 import logging
-from typing import Tuple
+from typing import Sequence, Tuple
+
+import numpy as np
 
 
 """Defines the logger for this script"""  # pylint: disable=pointless-string-statement
@@ -55,6 +57,68 @@ ERROR_OUTPUT = -1
 ) = range(17)
 
 
+"""Defines the list of limb vectors used by the stretch Nodes
+
+Each limb vector is given as a ``(head, tail)`` pair of keypoints,
+such that the vector points from the tail keypoint to the head keypoint.
+"""
+LIMB_VECTORS = (
+    (KP_LEFT_SHOULDER, KP_LEFT_ELBOW),
+    (KP_LEFT_WRIST, KP_LEFT_ELBOW),
+    (KP_RIGHT_SHOULDER, KP_RIGHT_ELBOW),
+    (KP_RIGHT_WRIST, KP_RIGHT_ELBOW),
+    (KP_LEFT_SHOULDER, KP_NOSE),
+    (KP_RIGHT_SHOULDER, KP_NOSE),
+    (KP_RIGHT_SHOULDER, KP_LEFT_SHOULDER),
+    (KP_LEFT_SHOULDER, KP_RIGHT_SHOULDER),
+    (KP_LEFT_SHOULDER, KP_LEFT_HIP),
+    (KP_RIGHT_SHOULDER, KP_RIGHT_HIP),
+    (KP_RIGHT_HIP, KP_LEFT_HIP),
+    (KP_LEFT_HIP, KP_RIGHT_HIP)
+)
+(
+    VEC_LEFT_ELBOW_SHOULDER,
+    VEC_LEFT_ELBOW_WRIST,
+    VEC_RIGHT_ELBOW_SHOULDER,
+    VEC_RIGHT_ELBOW_WRIST,
+    VEC_NOSE_LEFT_SHOULDER,
+    VEC_NOSE_RIGHT_SHOULDER,
+    VEC_LEFT_RIGHT_SHOULDER,
+    VEC_RIGHT_LEFT_SHOULDER,
+    VEC_LEFT_HIP_SHOULDER,
+    VEC_RIGHT_HIP_SHOULDER,
+    VEC_LEFT_RIGHT_HIP,
+    VEC_RIGHT_LEFT_HIP
+) = range(len(LIMB_VECTORS))
+
+
+"""Defines the list of joint angles used by the stretch Nodes
+
+Each joint angle is the (smaller) angle between a pair of limb vectors in `LIMB_VECTORS`.
+"""
+JOINT_ANGLES = (
+    (VEC_LEFT_ELBOW_SHOULDER, VEC_LEFT_ELBOW_WRIST),
+    (VEC_RIGHT_ELBOW_SHOULDER, VEC_RIGHT_ELBOW_WRIST),
+    (VEC_NOSE_LEFT_SHOULDER, VEC_LEFT_RIGHT_SHOULDER),
+    (VEC_NOSE_RIGHT_SHOULDER, VEC_RIGHT_LEFT_SHOULDER),
+    (VEC_LEFT_HIP_SHOULDER, VEC_LEFT_RIGHT_HIP),
+    (VEC_RIGHT_HIP_SHOULDER, VEC_RIGHT_LEFT_HIP)
+)
+(
+    ANGLE_LEFT_ELBOW,
+    ANGLE_RIGHT_ELBOW,
+    ANGLE_LEFT_NECK,
+    ANGLE_RIGHT_NECK,
+    ANGLE_LEFT_HIP,
+    ANGLE_RIGHT_HIP
+) = range(len(JOINT_ANGLES))
+
+
+"""Defines the pose features of a frame without any detected poses"""
+NO_KEYPOINTS = np.empty((0, KP_RIGHT_FOOT + 1, 2), dtype=int)
+NO_JOINT_ANGLES = np.empty((0, len(JOINT_ANGLES)))
+
+
 def obtain_keypoint(
         rel_x: float,
         rel_y: float,
@@ -160,8 +224,8 @@ def angle_between_vectors_in_rad(
     # Check for zero vectors
     if x1 == y1 == 0 or x2 == y2 == 0:
         _logger.error(
-            f'One or more zero vectors v1 = ({x1}, {y1}) and ' +
-            f'v2 = ({x2}, {y2}) were passed into angle_between_vectors_in_rad().'
+            'One or more zero vectors v1 = (%s, %s) and v2 = (%s, %s) were passed into angle_between_vectors_in_rad().',
+            x1, y1, x2, y2
         )
         return ERROR_OUTPUT
 
@@ -174,14 +238,194 @@ def angle_between_vectors_in_rad(
     # Check if the cosine value is within acos domain of [-1, 1]
     if abs(cos_value) > 1:
         _logger.error(
-            f'angle_between_vectors_in_rad() obtained cosine value {cos_value} ' +
-            'that is not within acos domain [-1, 1]. ' +
-            f'v1 · v2 = {dot_prod}, ||v1|| = {v1_magnitude}, ||v2|| = {v2_magnitude}'
+            'angle_between_vectors_in_rad() obtained cosine value %s that is not within acos domain [-1, 1]. '
+            'v1 · v2 = %s, ||v1|| = %s, ||v2|| = %s',
+            cos_value, dot_prod, v1_magnitude, v2_magnitude
         )
         return ERROR_OUTPUT
 
     return acos(cos_value)
 
 
+def obtain_keypoints(
+        keypoints,
+        img_width: int,
+        img_height: int
+) -> np.ndarray:
+    """Obtains the coordinates of all detected PoseNet keypoints on a given image
+
+    This is the vectorised counterpart of `obtain_keypoint`.
+
+    Parameters
+    ----------
+    keypoints : array_like
+        Relative keypoints of shape \\( (N, 17, 2) \\) as returned by the PoseNet model
+    img_width : int
+        Width of the image in pixels
+    img_height : int
+        Height of the image in pixels
+
+    Returns
+    -------
+    numpy.ndarray
+        Absolute keypoints of shape \\( (N, 17, 2) \\) on the image.
+    """
+
+    keypoints = np.asarray(keypoints, dtype=float).reshape(-1, KP_RIGHT_FOOT + 1, 2)
+    return np.rint(keypoints * (img_width, img_height)).astype(int)
+
+
+def obtain_bboxes(
+        bboxes,
+        img_width: int,
+        img_height: int
+) -> np.ndarray:
+    """Obtains the coordinates of all detected bounding boxes on a given image
+
+    Parameters
+    ----------
+    bboxes : array_like
+        Relative bounding boxes of shape \\( (N, 4) \\) in \\( (x_{1}, y_{1}, x_{2}, y_{2}) \\) format
+    img_width : int
+        Width of the image in pixels
+    img_height : int
+        Height of the image in pixels
+
+    Returns
+    -------
+    numpy.ndarray
+        Absolute bounding boxes of shape \\( (N, 4) \\) on the image.
+    """
+
+    bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+    return np.rint(bboxes * (img_width, img_height, img_width, img_height)).astype(int)
+
+
+def iou_matrix(
+        bboxes1: np.ndarray,
+        bboxes2: np.ndarray
+) -> np.ndarray:
+    """Obtains the intersection over union (IoU) of every pair of bounding boxes
+
+    Parameters
+    ----------
+    bboxes1 : numpy.ndarray
+        Bounding boxes of shape \\( (M, 4) \\) in \\( (x_{1}, y_{1}, x_{2}, y_{2}) \\) format
+    bboxes2 : numpy.ndarray
+        Bounding boxes of shape \\( (N, 4) \\) in the same format as `bboxes1`
+
+    Returns
+    -------
+    numpy.ndarray
+        IoU of shape \\( (M, N) \\), where entry \\( (i, j) \\) is the IoU of
+        the \\( i \\)-th box of `bboxes1` and the \\( j \\)-th box of `bboxes2`.
+        Pairs of empty boxes have an IoU of \\( 0 \\).
+    """
+
+    bboxes1 = np.asarray(bboxes1, dtype=float).reshape(-1, 1, 4)
+    bboxes2 = np.asarray(bboxes2, dtype=float).reshape(1, -1, 4)
+
+    # Compute the areas of the intersections and unions
+    top_left = np.maximum(bboxes1[..., :2], bboxes2[..., :2])
+    bottom_right = np.minimum(bboxes1[..., 2:], bboxes2[..., 2:])
+    intersections = np.prod(np.clip(bottom_right - top_left, 0, None), axis=-1)
+    areas1 = (bboxes1[..., 2] - bboxes1[..., 0]) * (bboxes1[..., 3] - bboxes1[..., 1])
+    areas2 = (bboxes2[..., 2] - bboxes2[..., 0]) * (bboxes2[..., 3] - bboxes2[..., 1])
+    unions = areas1 + areas2 - intersections
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(unions > 0, intersections / unions, 0)
+
+
+def obtain_limb_vectors(
+        abs_keypoints: np.ndarray,
+        limb_vectors: Sequence[Tuple[int, int]] = LIMB_VECTORS
+) -> np.ndarray:
+    """Obtains the limb vectors of every detected pose
+
+    Parameters
+    ----------
+    abs_keypoints : numpy.ndarray
+        Absolute keypoints of shape \\( (N, 17, 2) \\), see `obtain_keypoints`
+    limb_vectors : sequence of tuples of ints, default=`LIMB_VECTORS`
+        ``(head, tail)`` pairs of keypoints defining each limb vector
+
+    Returns
+    -------
+    numpy.ndarray
+        Limb vectors of shape \\( (N, L, 2) \\), where \\( L \\) is the number of limb vectors.
+    """
+
+    heads, tails = np.asarray(limb_vectors, dtype=int).reshape(-1, 2).T
+    return abs_keypoints[:, heads] - abs_keypoints[:, tails]
+
+
+def angles_between_vectors_in_rad(
+        v1: np.ndarray,
+        v2: np.ndarray
+) -> np.ndarray:
+    """Obtains the (smaller) angles between two arrays of vectors in radians
+
+    This is the vectorised counterpart of `angle_between_vectors_in_rad`.
+
+    Parameters
+    ----------
+    v1 : numpy.ndarray
+        Array of vectors \\( \\overrightarrow{ V_{1} } \\) of shape \\( (..., 2) \\)
+    v2 : numpy.ndarray
+        Array of vectors \\( \\overrightarrow{ V_{2} } \\) of the same shape as `v1`
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of angles of shape \\( (...) \\).
+
+        Angles are masked with ``ERROR_OUTPUT`` for the same cases
+        as `angle_between_vectors_in_rad`, without logging each case.
+    """
+
+    v1 = np.asarray(v1, dtype=float)
+    v2 = np.asarray(v2, dtype=float)
+
+    # Compute the cosine values, masking zero vectors
+    dot_prod = (v1 * v2).sum(axis=-1)
+    magnitudes = np.sqrt((v1 * v1).sum(axis=-1)) * np.sqrt((v2 * v2).sum(axis=-1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_values = dot_prod / magnitudes
+
+    # Mask cosine values that are not within acos domain of [-1, 1]
+    valid = (magnitudes != 0) & (np.abs(cos_values) <= 1)
+    return np.where(valid, np.arccos(np.where(valid, cos_values, 0)), ERROR_OUTPUT)
+
+
+def obtain_joint_angles(
+        limb_vectors: np.ndarray,
+        joint_angles: Sequence[Tuple[int, int]] = JOINT_ANGLES
+) -> np.ndarray:
+    """Obtains the joint angles of every detected pose in radians
+
+    Parameters
+    ----------
+    limb_vectors : numpy.ndarray
+        Limb vectors of shape \\( (N, L, 2) \\), see `obtain_limb_vectors`
+    joint_angles : sequence of tuples of ints, default=`JOINT_ANGLES`
+        Pairs of limb vectors defining each joint angle
+
+    Returns
+    -------
+    numpy.ndarray
+        Joint angles of shape \\( (N, K) \\), where \\( K \\) is the number of joint angles.
+        Invalid angles are masked with ``ERROR_OUTPUT``.
+
+    Examples
+    --------
+    >>> keypoints = obtain_keypoints(np.random.rand(5, 17, 2), img_width=1920, img_height=1080)
+    >>> obtain_joint_angles(obtain_limb_vectors(keypoints)).shape
+    (5, 6)
+    """
+
+    first, second = np.asarray(joint_angles, dtype=int).reshape(-1, 2).T
+    return angles_between_vectors_in_rad(limb_vectors[:, first], limb_vectors[:, second])
+
+
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -16,13 +16,18 @@ peekingduck run
 
 # pylint: disable=logging-format-interpolation
 
+import logging
 from math import pi
-from typing import Any, Mapping, Optional, Tuple
+from typing import Any, Mapping, Optional, Sequence, Tuple
 
+import numpy as np
 from peekingduck.pipeline.nodes.abstract_node import AbstractNode
 
+from custom_nodes.dabble.diagnostics import Diagnostics
+from custom_nodes.dabble.state import ArchiveHook, PersonState, StateStore
 from custom_nodes.dabble.utils import (
-    Coord,
+    ANGLE_LEFT_ELBOW,
+    ANGLE_RIGHT_ELBOW,
     ERROR_OUTPUT,
     KP_LEFT_ELBOW,
     KP_LEFT_SHOULDER,
@@ -30,198 +35,201 @@ from custom_nodes.dabble.utils import (
     KP_RIGHT_ELBOW,
     KP_RIGHT_SHOULDER,
     KP_RIGHT_WRIST,
-    angle_between_vectors_in_rad,
-    obtain_keypoint
+    NO_JOINT_ANGLES,
+    NO_KEYPOINTS
 )
 
 
-class Node(AbstractNode):
+class Stretch:
+    """Implements the state machine of the Y-W stretch for every tracked person"""
 
     _SETUP, _W, _Y = range(3)
 
     def __init__(
             self,
-            config: Optional[Mapping[str, Any]] = None,
-            **kwargs
+            logger: logging.Logger,
+            ttl: float = 60.0,
+            max_people: int = 64,
+            archive: Optional[ArchiveHook] = None,
+            diagnostics: Optional[Diagnostics] = None
     ) -> None:
-        """Initialises the custom Node class
+        """Initialises the state machine
 
         Parameters
         ----------
-        config : dict, optional
-            Node custom configuration
-
-        Other Parameters
-        ----------------
-        **kwargs
-            Keyword arguments for instantiating the AbstractNode parent class
+        logger : logging.Logger
+            Logger of the Node hosting the state machine
+        ttl : float, default=60.0
+            Number of seconds a person can go unseen before their state is evicted
+        max_people : int, default=64
+            Maximum number of people to keep the state of
+        archive : callable, optional
+            Hook called with the ID and final state of each person before they are evicted
+        diagnostics : Diagnostics, optional
+            Counts the rejected poses of every person; defaults to its own diagnostics on the given logger
         """
 
-        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+        self.logger = logger
+        self.diagnostics = diagnostics if diagnostics is not None else Diagnostics(logger)
 
         # Implement trackers
-        self.curr_pos = {}
-        self.max_angle = {}
-        self.min_angle = {}
-        self.reps = {}
+        self.people = StateStore(pi, ttl, max_people, archive)
 
     def _helper(
             self,
-            left_shoulder: Optional[Coord],
-            left_elbow: Optional[Coord],
-            left_wrist: Optional[Coord],
-            right_shoulder: Optional[Coord],
-            right_elbow: Optional[Coord],
-            right_wrist: Optional[Coord]
-    ) -> Tuple[float, float]:
-        
-        # Check if keypoints are defined
-        if left_shoulder is None or \
-                left_elbow is None or \
-                left_wrist is None or \
-                right_shoulder is None or \
-                right_elbow is None or \
-                right_wrist is None:
-            return ERROR_OUTPUT, ERROR_OUTPUT
+            all_ids: Sequence[Any],
+            joint_angles: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
 
-        # Obtain coordinates
-        left_shoulder_x, left_shoulder_y = left_shoulder
-        right_shoulder_x, right_shoulder_y = right_shoulder
-        left_elbow_x, left_elbow_y = left_elbow
-        right_elbow_x, right_elbow_y = right_elbow
-        left_wrist_x, left_wrist_y = left_wrist
-        right_wrist_x, right_wrist_y = right_wrist
-
-        # Calculate relevant vectors
-        left_shoulder_elbow_vec = (
-            left_shoulder_x - left_elbow_x,
-            left_shoulder_y - left_elbow_y
-        )
-        left_wrist_elbow_vec = (
-            left_wrist_x - left_elbow_x,
-            left_wrist_y - left_elbow_y
-        )
-        right_shoulder_elbow_vec = (
-            right_shoulder_x - right_elbow_x,
-            right_shoulder_y - right_elbow_y
-        )
-        right_wrist_elbow_vec = (
-            right_wrist_x - right_elbow_x,
-            right_wrist_y - right_elbow_y
-        )
-
-        # Calculate angle made between the left shoulder, left elbow, and left wrist
-        left_angle = angle_between_vectors_in_rad(
-            *left_shoulder_elbow_vec,
-            *left_wrist_elbow_vec
-        )
-        # Calculate angle made between the right shoulder, right elbow, and right wrist
-        right_angle = angle_between_vectors_in_rad(
-            *right_shoulder_elbow_vec,
-            *right_wrist_elbow_vec
-        )
-        if left_angle == ERROR_OUTPUT or right_angle == ERROR_OUTPUT:
-            # Needs debugging
-            self.logger.warning(
-                'Either one or both the calculated angles has returned an error.' +
-                f'\nAngle calculated between left shoulder to left elbow {left_shoulder_elbow_vec} ' +
-                f'and left wrist to left elbow {left_wrist_elbow_vec} is {left_angle} radians.' +
-                f'\nAngle calculated between right shoulder to right elbow {right_shoulder_elbow_vec} ' +
-                f'and right wrist to right elbow {right_wrist_elbow_vec} is {right_angle} radians.'
-            )
-
-        return left_angle, right_angle
+        # Obtain the angles made between each shoulder, elbow, and wrist
+        left_angles = joint_angles[:, ANGLE_LEFT_ELBOW]
+        right_angles = joint_angles[:, ANGLE_RIGHT_ELBOW]
+        defined = (left_angles != ERROR_OUTPUT) & (right_angles != ERROR_OUTPUT)
+
+        # Needs debugging
+        self.diagnostics.reject('elbow_angle_error', all_ids, ~defined, logging.WARNING)
+
+        return left_angles, right_angles, defined
 
     def is_y_pose(
             self,
-            id: Any,
-            left_shoulder: Optional[Coord],
-            left_elbow: Optional[Coord],
-            left_wrist: Optional[Coord],
-            right_shoulder: Optional[Coord],
-            right_elbow: Optional[Coord],
-            right_wrist: Optional[Coord]
-    ) -> bool:
-
-        # Sanity check for input
-        left_angle, right_angle = self._helper(left_shoulder, left_elbow, left_wrist, right_shoulder, right_elbow, right_wrist)
-        if left_angle == ERROR_OUTPUT or right_angle == ERROR_OUTPUT:
-            return False
-        
+            keypoints: np.ndarray,
+            left_angles: np.ndarray,
+            right_angles: np.ndarray,
+            defined: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
         # Obtain coordinates
-        left_shoulder_x, left_shoulder_y = left_shoulder
-        right_shoulder_x, right_shoulder_y = right_shoulder
-        left_elbow_x, left_elbow_y = left_elbow
-        right_elbow_x, right_elbow_y = right_elbow
-        left_wrist_x, left_wrist_y = left_wrist
-        right_wrist_x, right_wrist_y = right_wrist
+        left_shoulder_x, left_shoulder_y = keypoints[:, KP_LEFT_SHOULDER].T
+        right_shoulder_x, right_shoulder_y = keypoints[:, KP_RIGHT_SHOULDER].T
+        left_elbow_x, left_elbow_y = keypoints[:, KP_LEFT_ELBOW].T
+        right_elbow_x, right_elbow_y = keypoints[:, KP_RIGHT_ELBOW].T
+        left_wrist_x, left_wrist_y = keypoints[:, KP_LEFT_WRIST].T
+        right_wrist_x, right_wrist_y = keypoints[:, KP_RIGHT_WRIST].T
 
         # Sanity check for posture
-        left_valid = left_shoulder_x <= left_elbow_x <= left_wrist_x and left_wrist_y <= left_elbow_y <= left_shoulder_y
-        right_valid = right_wrist_x <= right_elbow_x <= right_shoulder_x and right_wrist_y <= right_elbow_y <= right_shoulder_y
-        if not (left_valid and right_valid):
-            self.logger.info(
-                'Either left or right arm is not in a valid position.' +
-                f'\nleft_valid: {left_valid}, right_valid: {right_valid}'
-            )
-            return False
-        
+        left_valid = (left_shoulder_x <= left_elbow_x) & (left_elbow_x <= left_wrist_x) & \
+            (left_wrist_y <= left_elbow_y) & (left_elbow_y <= left_shoulder_y)
+        right_valid = (right_wrist_x <= right_elbow_x) & (right_elbow_x <= right_shoulder_x) & \
+            (right_wrist_y <= right_elbow_y) & (right_elbow_y <= right_shoulder_y)
+        valid = defined & left_valid & right_valid
+
         threshold = 150 * pi / 180  # 150 deg
-        if self.curr_pos[id] != self._SETUP:
-            ave_angle = (left_angle + right_angle) / 2
-            self.max_angle[id] = max(self.max_angle[id], ave_angle)
-            self.min_angle[id] = min(self.min_angle[id], ave_angle)
-        return left_angle >= threshold and right_angle >= threshold
+        ave_angles = (left_angles + right_angles) / 2
+        return valid, (left_angles >= threshold) & (right_angles >= threshold), ave_angles
 
     def is_w_pose(
             self,
-            id: Any,
-            left_shoulder: Optional[Coord],
-            left_elbow: Optional[Coord],
-            left_wrist: Optional[Coord],
-            right_shoulder: Optional[Coord],
-            right_elbow: Optional[Coord],
-            right_wrist: Optional[Coord]
-    ) -> bool:
-
-        # Check if keypoints are defined
-        if left_shoulder is None or \
-                left_elbow is None or \
-                left_wrist is None or \
-                right_shoulder is None or \
-                right_elbow is None or \
-                right_wrist is None:
-            return False
-
-        # Sanity check for input
-        left_angle, right_angle = self._helper(left_shoulder, left_elbow, left_wrist, right_shoulder, right_elbow, right_wrist)
-        if left_angle == ERROR_OUTPUT or right_angle == ERROR_OUTPUT:
-            return False
-        
+            keypoints: np.ndarray,
+            left_angles: np.ndarray,
+            right_angles: np.ndarray,
+            defined: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
         # Obtain coordinates
-        left_shoulder_x, _ = left_shoulder
-        right_shoulder_x, _ = right_shoulder
-        left_elbow_x, left_elbow_y = left_elbow
-        right_elbow_x, right_elbow_y = right_elbow
-        left_wrist_x, left_wrist_y = left_wrist
-        right_wrist_x, right_wrist_y = right_wrist
+        left_shoulder_x = keypoints[:, KP_LEFT_SHOULDER, 0]
+        right_shoulder_x = keypoints[:, KP_RIGHT_SHOULDER, 0]
+        left_elbow_x, left_elbow_y = keypoints[:, KP_LEFT_ELBOW].T
+        right_elbow_x, right_elbow_y = keypoints[:, KP_RIGHT_ELBOW].T
+        left_wrist_x, left_wrist_y = keypoints[:, KP_LEFT_WRIST].T
+        right_wrist_x, right_wrist_y = keypoints[:, KP_RIGHT_WRIST].T
 
         # Sanity check for posture
-        left_valid = left_shoulder_x <= left_elbow_x <= left_wrist_x and left_wrist_y <= left_elbow_y
-        right_valid = right_wrist_x <= right_elbow_x <= right_shoulder_x and right_wrist_y <= right_elbow_y
-        if not (left_valid and right_valid):
-            self.logger.info(
-                'Either left or right arm is not in a valid position.' +
-                f'\nleft_valid: {left_valid}, right_valid: {right_valid}'
-            )
-            return False
+        left_valid = (left_shoulder_x <= left_elbow_x) & (left_elbow_x <= left_wrist_x) & \
+            (left_wrist_y <= left_elbow_y)
+        right_valid = (right_wrist_x <= right_elbow_x) & (right_elbow_x <= right_shoulder_x) & \
+            (right_wrist_y <= right_elbow_y)
+        valid = defined & left_valid & right_valid
 
         threshold = 120 * pi / 180  # 120 deg
-        if self.curr_pos[id] != self._SETUP:
-            ave_angle = (left_angle + right_angle) / 2
-            self.max_angle[id] = max(self.max_angle[id], ave_angle)
-            self.min_angle[id] = min(self.min_angle[id], ave_angle)
-        return left_angle <= threshold and right_angle <= threshold
+        ave_angles = (left_angles + right_angles) / 2
+        return valid, (left_angles <= threshold) & (right_angles <= threshold), ave_angles
+
+    def update(
+            self,
+            all_ids: Sequence[Any],
+            all_keypoints: np.ndarray,
+            joint_angles: np.ndarray
+    ) -> None:
+        """Updates the trackers with the poses detected in the current frame
+
+        Parameters
+        ----------
+        all_ids : sequence
+            Tracking IDs of the detected poses
+        all_keypoints : numpy.ndarray
+            Absolute keypoints of the detected poses, of shape (N, 17, 2)
+        joint_angles : numpy.ndarray
+            Joint angles of the detected poses, of shape (N, K)
+        """
+
+        # Compute the postures of every person at once
+        angles = self._helper(all_ids, joint_angles)
+        y_valid, y_reached, y_angles = self.is_y_pose(all_keypoints, *angles)
+        w_valid, w_reached, w_angles = self.is_w_pose(all_keypoints, *angles)
+
+        # Handle the detection of each person, noting the people whose arms are not in position
+        defined = angles[2]
+        misplaced = np.zeros(len(all_ids), dtype=bool)
+        for i, curr_id in enumerate(all_ids):
+
+            # Update the relevant IDs
+            person = self.people.get(curr_id)
+            curr_pos = person.curr_pos
+            valid, reached, angle = (y_valid[i], y_reached[i], y_angles[i]) if curr_pos == self._W else \
+                (w_valid[i], w_reached[i], w_angles[i])
+            if not valid:
+                misplaced[i] = defined[i]
+                continue
+            if curr_pos != self._SETUP:
+                person.max_angle = max(person.max_angle, float(angle))
+                person.min_angle = min(person.min_angle, float(angle))
+            if curr_pos == self._W and reached:
+                person.curr_pos = self._Y
+            elif curr_pos != self._W and reached:
+                person.reps += curr_pos == self._Y
+                person.curr_pos = self._W
+        self.diagnostics.reject('arm_position', all_ids, misplaced)
+
+        # Evict the people that have left
+        self.people.evict()
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Implement the state machine
+        self.diagnostics = Diagnostics(self.logger, self.log_interval)
+        self.stretch = Stretch(self.logger, self.state_ttl, self.max_people, self.archive, self.diagnostics)
+
+    def archive(
+            self,
+            curr_id: Any,
+            person: PersonState
+    ) -> None:
+        """Logs the final repetitions of a person before their state is evicted, and archives their rejections"""
+
+        self.logger.info('Person %s left after %d repetitions.', curr_id, person.reps)
+        self.diagnostics.archive(curr_id)
 
     def run(
             self,
@@ -234,9 +242,10 @@ class Node(AbstractNode):
         inputs : dict
             Dictionary with the following keys:
 
-            - 'img' - given image to be displayed
-            - 'keypoints' - keypoints from PoseNet model
-            - 'obj_attrs' - to obtain tracking IDs from PoseNet model
+            - 'abs_keypoints' - absolute keypoints from the pose_features Node
+            - 'joint_angles' - joint angles from the pose_features Node
+            - 'obj_attrs' - to obtain tracking IDs
+            - 'pipeline_end' - whether the pipeline has ended, to log the rejected poses of the run
 
         Returns
         -------
@@ -248,65 +257,38 @@ class Node(AbstractNode):
             - 'reps' - number of repetitions of current run
         """
 
+        # Log the rejected poses of the run once the pipeline has ended, without analysing any more frames
+        if inputs.get('pipeline_end', False):
+            self.diagnostics.log_summary()
+            return {
+                'max_angle': self.stretch.people.max_angle,
+                'min_angle': self.stretch.people.min_angle,
+                'reps': self.stretch.people.reps
+            }
+
         # Initialise error message
         error_msg = 'The input dictionary does not contain the {} key.'
 
         # Check if required inputs are in pipeline
-        if 'img' not in inputs:
-            # There must be an image to display
-            self.logger.error(error_msg.format("'img'"))
-            return {
-                'max_angle': {},
-                'min_angle': {},
-                'reps': {}
-            }
-        for key in ('keypoints', 'obj_attrs'):
+        for key in ('abs_keypoints', 'joint_angles', 'obj_attrs'):
             if key not in inputs:
                 # One or more metadata inputs are missing
                 self.logger.warning(error_msg.format(f"'{key}'"))
 
         # Get required inputs from pipeline
-        height, width, *_ = inputs['img'].shape
         all_ids = inputs.get('obj_attrs', {}).get('ids', [])
-        all_keypoints = inputs.get('keypoints', [])
-
-        # Handle the detection of each person
-        for curr_id, keypoints in zip(all_ids, all_keypoints):
-
-            # Store and display PoseNet keypoints
-            keypoint_list = [
-                obtain_keypoint(
-                    *keypoint.tolist(),
-                    img_width=width,
-                    img_height=height
-                ) \
-                for keypoint in keypoints
-            ]
-            relevant_keypoints = (
-                keypoint_list[KP_LEFT_SHOULDER],
-                keypoint_list[KP_LEFT_ELBOW],
-                keypoint_list[KP_LEFT_WRIST],
-                keypoint_list[KP_RIGHT_SHOULDER],
-                keypoint_list[KP_RIGHT_ELBOW],
-                keypoint_list[KP_RIGHT_WRIST]
-            )
+        all_keypoints = inputs.get('abs_keypoints', NO_KEYPOINTS)
+        joint_angles = inputs.get('joint_angles', NO_JOINT_ANGLES)
+        num_poses = min(len(all_ids), len(all_keypoints), len(joint_angles))
+        all_ids, all_keypoints, joint_angles = all_ids[:num_poses], all_keypoints[:num_poses], joint_angles[:num_poses]
 
-            # Update the relevant IDs
-            if curr_id not in self.curr_pos:
-                self.curr_pos[curr_id] = self._SETUP
-                self.max_angle[curr_id] = 0
-                self.min_angle[curr_id] = pi
-                self.reps[curr_id] = 0
-            if self.curr_pos[curr_id] == self._W and self.is_y_pose(curr_id, *relevant_keypoints):
-                self.curr_pos[curr_id] = self._Y
-            elif self.curr_pos[curr_id] != self._W and self.is_w_pose(curr_id, *relevant_keypoints):
-                self.reps[curr_id] += self.curr_pos[curr_id] == self._Y
-                self.curr_pos[curr_id] = self._W
+        # Update the state machine of every person
+        self.stretch.update(all_ids, all_keypoints, joint_angles)
 
         return {
-            'max_angle': self.max_angle,
-            'min_angle': self.min_angle,
-            'reps': self.reps
+            'max_angle': self.stretch.people.max_angle,
+            'min_angle': self.stretch.people.min_angle,
+            'reps': self.stretch.people.reps
         }
 
 
@@ -0,0 +1,95 @@
+"""Docstring for the multi_stats.py module
+
+This module implements a custom draw Node class for handling the statistics of the active stretch
+of the multi_stretch dabble Node.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+# pylint: disable=invalid-name, logging-format-interpolation
+
+from math import pi
+from typing import Any, Mapping, Optional
+
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.draw.utils import DrawList, display_stats
+
+
+"""Defines the range of motion of each supported stretch in radians"""  # pylint: disable=pointless-string-statement
+ANGLE_RANGES = {
+    'arm': pi,
+    'neck': pi / 2,
+    'side': pi / 2
+}
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping:
+
+        # Initialise error message
+        error_msg = 'The input dictionary does not contain the {} key.'
+
+        # Check if required inputs are in pipeline
+        if 'img' not in inputs:
+            # There must be an image to display
+            self.logger.error(error_msg.format("'img'"))
+            return {}
+        for key in ('abs_bboxes', 'obj_attrs'):
+            if key not in inputs:
+                # One or more metadata inputs are missing
+                self.logger.warning(error_msg.format(f"'{key}'"))
+
+        # Get required inputs from pipeline
+        img = inputs['img']
+        all_ids = inputs.get('obj_attrs', {}).get('ids', [])
+        bboxes = inputs.get('abs_bboxes', [])
+        max_angles = inputs.get('max_angle', {})
+        min_angles = inputs.get('min_angle', {})
+        reps = inputs.get('reps', {})
+        angle_range = ANGLE_RANGES.get(inputs.get('exercise'), pi / 2)
+
+        # Display and calculate the score of each person, or leave the text to be drawn by the overlay Node
+        draw_list = None if self.draw else DrawList()
+        scores = display_stats(img, all_ids, bboxes, max_angles, min_angles, reps, angle_range, draw_list=draw_list)
+
+        if draw_list is None:
+            return {'scores': scores}
+        return {'scores': scores, 'stats_overlay': draw_list}
+
+
+if __name__ == '__main__':
+    pass
\ No newline at end of file
@@ -0,0 +1,250 @@
+"""Docstring for the overlay.py module
+
+This module implements a custom draw Node class for drawing every overlay of the frame in a single pass.
+
+The Node takes the place of the draw.bbox, draw.tag, draw.poses and draw.legend Nodes of PeekingDuck,
+and of the drawing done by the stats Nodes when their `draw` config is set to False. The bounding boxes,
+tags, poses, legend and statistics of the frame are collected into one `DrawList`, in the order the separate
+Nodes would have drawn them, and rendered onto the frame at once, so that the frame looks the same:
+
+- the outlines of the bounding boxes and the lines of the poses are drawn in one OpenCV call per colour
+- the keypoints lying outside the frame, such as those that were not detected, are skipped
+- the legend box is shaded within its own bounds, instead of blending a copy of the whole frame
+- the tags and statistics are blended from the text sprite cache of the draw/utils.py script
+
+With the `headless` config set to True, as in the headless mode of the worker, nothing is drawn
+unless the frames are being viewed through the frame_stream Node.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+# pylint: disable=invalid-name, logging-format-interpolation
+
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.draw.utils import DrawList
+from custom_nodes.output.utils import FrameHub
+
+
+"""Define the drawing properties of the PeekingDuck draw Nodes"""  # pylint: disable=pointless-string-statement
+
+"""Defines the BGR colours of the bounding boxes of each label"""  # pylint: disable=pointless-string-statement
+_PALETTE = [(156, 223, 244), (241, 232, 164), (77, 103, 255), (188, 118, 119), (96, 109, 167)]
+
+"""Defines the BGR colours of the pose connections and keypoints"""  # pylint: disable=pointless-string-statement
+_CONNECTION_COLOUR = (156, 223, 244)
+_KEYPOINT_COLOUR = (77, 103, 255)
+
+"""Defines the radius of the keypoints in pixels"""  # pylint: disable=pointless-string-statement
+_KEYPOINT_RADIUS = 5
+
+"""Defines the left edge of the legend box in pixels"""  # pylint: disable=pointless-string-statement
+_LEGEND_LEFT_X = 15
+
+_FONT_FACE = cv2.FONT_HERSHEY_SIMPLEX  # pylint: disable=no-member
+
+
+def _project(
+        points: Any,
+        image_size: Tuple[int, int]
+) -> np.ndarray:
+
+    # Project the relative points onto the image as PeekingDuck does, rounding in single precision
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    return np.round(points * np.array(image_size, dtype=np.float32)).astype(int)
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Require the data types shown in the legend, so that PeekingDuck checks that preceding Nodes output them
+        self.input = self.input + [key for key in self.legend if key not in self.input]
+        self.draw_list = DrawList()
+        self.tag_keys = [[key.strip() for key in tag.split('->')] for tag in self.tags]
+        self.tag_colour = tuple(self.tag_colour)
+        self.item_height = cv2.getTextSize(  # pylint: disable=no-member
+            '', _FONT_FACE, self.legend_font['size'], self.legend_font['thickness'])[0][1]
+
+        # Implement trackers
+        # The legend box only ever widens, as in draw.legend, so that it does not flicker with the frame rate
+        self.legend_width = 0
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping:
+        """Draws every overlay of the frame onto the image
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'img' - image to draw on
+            - 'bboxes', 'bbox_labels' - bounding boxes, with their labels if `show_labels` is True
+            - 'obj_attrs' - attributes to tag each bounding box with, as selected by `tags`
+            - 'keypoints', 'keypoint_conns' - poses, if `show_poses` is True
+            - the data types selected by `legend`
+            - 'stats_overlay' - draw list of a stats Node with its `draw` config set to False
+
+        Returns
+        -------
+        dict
+            Dictionary with the following keys:
+
+            - 'img' - image with the overlays drawn onto it in place
+        """
+
+        # Initialise error message
+        error_msg = 'The input dictionary does not contain the {} key.'
+
+        # Check if required inputs are in pipeline
+        if 'img' not in inputs:
+            # There must be an image to draw on
+            self.logger.error(error_msg.format("'img'"))
+            return {}
+        if self.headless and not FrameHub.is_viewed():
+            # Nobody is looking at the frames
+            return {}
+        for key in self.legend:
+            if key not in inputs:
+                raise KeyError(f"'{key}' was selected for the legend, but is not a valid data type "
+                               'from preceding Nodes.')
+
+        # Collect the overlays in the order the separate draw Nodes would draw them, then draw them at once
+        img = inputs['img']
+        image_size = (img.shape[1], img.shape[0])
+        draw_list = self.draw_list
+        draw_list.clear()
+        bboxes = np.asarray(inputs.get('bboxes', []))
+        if len(bboxes):
+            corners = _project(bboxes, image_size).reshape(-1, 2, 2)
+            self._add_bboxes(corners, inputs.get('bbox_labels', []))
+            if self.tag_keys:
+                self._add_tags(corners, inputs.get('obj_attrs', {}))
+        if self.show_poses and len(inputs.get('keypoints', [])):
+            self._add_poses(inputs['keypoints'], inputs.get('keypoint_conns', []), image_size)
+        if self.legend:
+            self._add_legend(inputs, image_size[1])
+        if 'stats_overlay' in inputs:
+            draw_list.extend(inputs['stats_overlay'])
+        draw_list.render(img)
+
+        return {'img': img}
+
+    def _add_bboxes(
+            self,
+            corners: np.ndarray,
+            labels: Sequence[str]
+    ) -> None:
+
+        # Colour the bounding boxes of each label alike, as draw.bbox does
+        colour_index = {label: index for index, label in enumerate(set(labels))}
+        for i, ((x1, y1), (x2, y2)) in enumerate(corners.tolist()):
+            colour = _PALETTE[colour_index[labels[i]] % len(_PALETTE)] if len(labels) else _PALETTE[0]
+            self.draw_list.rectangle((x1, y1), (x2, y2), colour, 3)
+            if self.show_labels:
+                label = labels[i][:1].capitalize() + labels[i][1:]
+                (text_width, text_height), baseline = cv2.getTextSize(  # pylint: disable=no-member
+                    labels[i], _FONT_FACE, 1, 2)
+                self.draw_list.rectangle((x1, y1), (x1 + text_width, y1 - text_height - baseline), colour, -1)
+                self.draw_list.text(x1, y1 - 6, label, (0, 0, 0), line_type=cv2.LINE_AA)  # pylint: disable=no-member
+
+    def _add_tags(
+            self,
+            corners: np.ndarray,
+            obj_attrs: Mapping[str, Any]
+    ) -> None:
+
+        # Join the selected attributes of each object into its tag
+        attrs: List[List[Any]] = []
+        for keys in self.tag_keys:
+            attr: Any = obj_attrs
+            for key in keys:
+                attr = attr[key]
+            attrs.append(attr)
+
+        # Centre each tag above its bounding box, as draw.tag does
+        for ((x1, y1), (x2, _)), tag in zip(corners.tolist(), (', '.join(map(str, obj)) for obj in zip(*attrs))):
+            (text_width, _), baseline = cv2.getTextSize(tag, _FONT_FACE, 1, 2)  # pylint: disable=no-member
+            self.draw_list.text(x1 + int((x2 - x1 - text_width) / 2), y1 - baseline, tag, self.tag_colour,
+                                font_thickness=3)
+
+    def _add_poses(
+            self,
+            keypoints: np.ndarray,
+            keypoint_conns: Sequence[Any],
+            image_size: Tuple[int, int]
+    ) -> None:
+
+        # Draw the connections of each person before their keypoints, as draw.poses does
+        all_keypoints = _project(keypoints, image_size).reshape(len(keypoints), -1, 2)
+        for person_keypoints, connections in zip(all_keypoints, keypoint_conns):
+            if connections is not None and len(connections):
+                self.draw_list.lines(_project(connections, image_size), _CONNECTION_COLOUR, 2)
+            self.draw_list.circles(person_keypoints, _KEYPOINT_RADIUS, _KEYPOINT_COLOUR)
+
+    def _add_legend(
+            self,
+            inputs: Mapping[str, Any],
+            image_height: int
+    ) -> None:
+
+        # Format each item as draw.legend does, with floats in 2 decimal places
+        texts = []
+        for item in self.legend:
+            value = inputs[item]
+            if not isinstance(value, (int, float, str)):
+                raise TypeError(f"The legend only draws values of type 'int', 'float' or 'str'. The value: {value} "
+                                f'of the data type: {item} is of type: {type(value)}.')
+            texts.append(f'{item.upper()}: {value:.2f}' if isinstance(value, float) else f'{item.upper()}: {value}')
+
+        # Size and place the legend box, then shade it behind the text
+        font_size, font_thickness = self.legend_font['size'], self.legend_font['thickness']
+        item_height, item_padding = self.item_height, self.item_height // 2
+        self.legend_width = max(self.legend_width, max(cv2.getTextSize(  # pylint: disable=no-member
+            text, _FONT_FACE, font_size, font_thickness)[0][0] for text in texts) + 2 * item_padding)
+        legend_height = (item_height + item_padding) * len(texts)
+        start_y = item_padding if self.legend_position == 'top' else image_height - item_padding - legend_height
+        self.draw_list.shade((_LEGEND_LEFT_X, start_y - item_padding),
+                             (_LEGEND_LEFT_X + self.legend_width, start_y + legend_height), self.legend_opacity)
+        for i, text in enumerate(texts):
+            self.draw_list.text(_LEGEND_LEFT_X + item_padding, start_y + item_height + i * (item_height + item_padding),
+                                text, (255, 255, 255), font_scale=font_size, font_thickness=font_thickness,
+                                line_type=cv2.LINE_AA)  # pylint: disable=no-member
+
+
+if __name__ == '__main__':
+    pass
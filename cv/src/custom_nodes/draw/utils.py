@@ -3,6 +3,17 @@
 This script contains constants and other miscellaneous functions
 for the rest of the scripts in the draw module to use.
 
+Text is rasterised by OpenCV only once per distinct label, into a sprite that is kept in a least-recently-used
+cache keyed by the text, colour and font. Every later display of the same label blends the cached sprite
+into its slice of the image, copying the strokes through a mask when they are opaque, or alpha-blending the slice
+when OpenCV antialiases them, so the labels that rarely change cost no font rendering. Labels crossing the edges
+of the image are drawn directly, as OpenCV clips their strokes differently.
+
+The overlays of a frame can also be collected into a `DrawList` in drawing order, and rendered onto the frame
+in a single pass by the overlay Node. Consecutive outlines and lines of the same colour and thickness are drawn
+in one OpenCV call, primitives lying outside the frame are skipped, and translucent boxes are blended only within
+their own bounds rather than over a copy of the whole frame.
+
 Usage
 -----
 This script is not meant to be used independently.
@@ -10,13 +21,12 @@ This script is not meant to be used independently.
 
 # pylint: disable=invalid-name, logging-format-interpolation
 
-from typing import Tuple
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
 
 import cv2
-
-
-"""Type-hinting alias for coordinates"""  # pylint: disable=pointless-string-statement
-Coord = Tuple[int, int]
+import numpy as np
 
 
 """Define font properties for display purposes"""  # pylint: disable=pointless-string-statement
@@ -31,6 +41,294 @@ _FONT_SCALE = 1
 _FONT_THICKNESS = 2
 
 
+"""Defines the maximum number of text sprites kept in the cache"""  # pylint: disable=pointless-string-statement
+_SPRITE_CACHE_SIZE = 512
+
+
+"""Type-hinting alias for the key of a text sprite
+
+It holds the text, colour, font face, font scale and font thickness.
+"""  # pylint: disable=pointless-string-statement
+SpriteKey = Tuple[str, Tuple[int, int, int], int, float, int]
+
+
+class TextSprite:
+    """Holds a rasterised label in its colour, with its opacity and its offset from the text origin"""
+
+    __slots__ = ('key', 'dx', 'dy', 'bgr', 'mask', 'premultiplied', 'transparency')
+
+    def __init__(
+            self,
+            key: SpriteKey
+    ) -> None:
+        """Rasterises the label of the given key
+
+        Parameters
+        ----------
+        key : tuple
+            Text, BGR colour, font face, font scale and font thickness of the label
+        """
+
+        self.key = key
+        text, font_colour, font_face, font_scale, font_thickness = key
+        (width, height), baseline = cv2.getTextSize(  # pylint: disable=no-member
+            text, font_face, font_scale, font_thickness
+        )
+
+        # Render the label onto a blank canvas with room all around for the strokes, as some glyphs
+        # such as brackets reach beyond the size measured by OpenCV
+        pad = height + font_thickness
+        alpha = np.zeros((height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8)
+        cv2.putText(  # pylint: disable=no-member
+            img=alpha,
+            text=text,
+            org=(pad, pad + height),
+            fontFace=font_face,
+            fontScale=font_scale,
+            color=255,
+            thickness=font_thickness
+        )
+
+        # Keep only the rows and columns that were drawn on
+        rows, cols = np.flatnonzero(alpha.any(axis=1)), np.flatnonzero(alpha.any(axis=0))
+        if not len(rows):
+            rows = cols = np.zeros(1, dtype=int)
+        alpha = alpha[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        self.dx, self.dy = int(cols[0]) - pad, int(rows[0]) - pad - height
+
+        # Opaque strokes are copied through a mask; antialiased strokes are blended over the whole slice
+        # as img * (255 - alpha) / 255 + colour * alpha / 255, with the colour term premultiplied here
+        self.bgr = np.empty((*alpha.shape, 3), dtype=np.uint8)
+        self.bgr[:] = font_colour
+        self.mask = np.where(alpha == 255, np.uint8(255), np.uint8(0))
+        self.premultiplied = self.transparency = None
+        if np.any((alpha > 0) & (alpha < 255)):
+            self.premultiplied = np.rint(alpha[..., None] * (self.bgr / 255)).astype(np.uint8)
+            self.transparency = np.repeat(255 - alpha[..., None], 3, axis=2)
+
+    def blend(
+            self,
+            img: np.ndarray,
+            abs_x: int,
+            abs_y: int
+    ) -> None:
+        """Blends the label into the image with its text origin at the given coordinate"""
+
+        height, width = self.mask.shape
+        x1, y1 = abs_x + self.dx, abs_y + self.dy
+        img_x1, img_y1 = max(x1, 0), max(y1, 0)
+        img_x2, img_y2 = min(x1 + width, img.shape[1]), min(y1 + height, img.shape[0])
+        if img_x1 >= img_x2 or img_y1 >= img_y2:
+            return
+
+        # OpenCV clips the strokes of labels crossing the edges of the image differently, so draw those directly
+        if img_x2 - img_x1 < width or img_y2 - img_y1 < height:
+            text, font_colour, font_face, font_scale, font_thickness = self.key
+            cv2.putText(  # pylint: disable=no-member
+                img, text, (abs_x, abs_y), font_face, font_scale, font_colour, font_thickness
+            )
+            return
+        region = img[y1:y1 + height, x1:x1 + width]
+        if self.transparency is None:
+            cv2.copyTo(self.bgr, self.mask, region)  # pylint: disable=no-member
+            return
+        faded = cv2.multiply(region, self.transparency, scale=1 / 255)  # pylint: disable=no-member
+        cv2.add(faded, self.premultiplied, dst=region)  # pylint: disable=no-member
+
+
+class SpriteCache:
+    """Keeps the most recently displayed text sprites, evicting the least recently displayed first"""
+
+    def __init__(
+            self,
+            max_size: int = _SPRITE_CACHE_SIZE
+    ) -> None:
+        """Initialises the cache
+
+        Parameters
+        ----------
+        max_size : int, default=`_SPRITE_CACHE_SIZE`
+            Maximum number of sprites to keep
+        """
+
+        self.max_size = max_size
+
+        # Implement trackers
+        self._sprites: 'OrderedDict[SpriteKey, TextSprite]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._sprites)
+
+    def get(
+            self,
+            key: SpriteKey
+    ) -> TextSprite:
+        """Returns the sprite of the given key, rasterising it if it is not cached"""
+
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self._sprites.move_to_end(key)
+            return sprite
+
+        self.misses += 1
+        sprite = self._sprites[key] = TextSprite(key)
+        if len(self._sprites) > self.max_size:
+            self._sprites.popitem(last=False)
+        return sprite
+
+
+"""Defines the text sprite cache shared by the draw Nodes"""  # pylint: disable=pointless-string-statement
+sprite_cache = SpriteCache()
+
+
+class DrawList:
+    """Collects the overlay primitives of a frame in drawing order, to be rendered onto the frame in a single pass"""
+
+    def __init__(self) -> None:
+        """Initialises an empty draw list"""
+
+        # Implement trackers
+        # Each item holds the kind, colour and thickness of its primitives, and the shapes drawn the same way
+        self.items: List[Tuple[str, Tuple[int, int, int], int, List[Any]]] = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _add(
+            self,
+            kind: str,
+            colour: Sequence[int],
+            thickness: int,
+            shapes: Sequence[Any]
+    ) -> None:
+
+        # Merge the primitives into the previous item if both are drawn the same way, keeping the drawing order
+        colour = tuple(int(channel) for channel in colour)
+        if self.items and self.items[-1][:3] == (kind, colour, thickness):
+            self.items[-1][3].extend(shapes)
+        else:
+            self.items.append((kind, colour, thickness, list(shapes)))  # type: ignore
+
+    def rectangle(
+            self,
+            top_left: Sequence[int],
+            bottom_right: Sequence[int],
+            colour: Sequence[int],
+            thickness: int
+    ) -> None:
+        """Adds a rectangle, filled if the thickness is negative, as drawn by `cv2.rectangle()`"""
+
+        (x1, y1), (x2, y2) = top_left, bottom_right
+        corners = np.array(((x1, y1), (x2, y1), (x2, y2), (x1, y2)), dtype=np.int32)
+        self._add('polygons', colour, thickness, [corners])
+
+    def lines(
+            self,
+            segments: np.ndarray,
+            colour: Sequence[int],
+            thickness: int
+    ) -> None:
+        """Adds lines between the start and end points of shape (N, 2, 2), as drawn by `cv2.line()`"""
+
+        self._add('lines', colour, thickness, list(np.asarray(segments, dtype=np.int32).reshape(-1, 2, 2)))
+
+    def circles(
+            self,
+            centres: np.ndarray,
+            radius: int,
+            colour: Sequence[int],
+            thickness: int = -1
+    ) -> None:
+        """Adds circles around the centres of shape (N, 2), filled by default, as drawn by `cv2.circle()`"""
+
+        centres = np.asarray(centres).reshape(-1, 2).tolist()
+        self._add('circles', colour, thickness, [(x, y, radius) for x, y in centres])
+
+    def text(
+            self,
+            abs_x: int,
+            abs_y: int,
+            text: str,
+            font_colour: Sequence[int],
+            *,
+            font_face: int = _FONT_FACE,
+            font_scale: float = _FONT_SCALE,
+            font_thickness: int = _FONT_THICKNESS,
+            line_type: int = cv2.LINE_8  # pylint: disable=no-member
+    ) -> None:
+        """Adds text with its origin at the given coordinate, as drawn by `cv2.putText()`
+
+        Text drawn without antialiasing is blended from the text sprite cache, see `display_text()`.
+        """
+
+        self._add('text', font_colour, font_thickness, [(abs_x, abs_y, text, font_face, font_scale, line_type)])
+
+    def shade(
+            self,
+            top_left: Sequence[int],
+            bottom_right: Sequence[int],
+            opacity: float
+    ) -> None:
+        """Adds a translucent black box, as blended by `cv2.addWeighted()` with the image with the box filled in"""
+
+        self._add('shades', (0, 0, 0), -1, [(*top_left, *bottom_right, opacity)])
+
+    def extend(
+            self,
+            other: 'DrawList'
+    ) -> None:
+        """Adds the primitives of another draw list after those of this draw list"""
+
+        for kind, colour, thickness, shapes in other.items:
+            self._add(kind, colour, thickness, shapes)
+
+    def clear(self) -> None:
+        """Removes every primitive, to collect the next frame"""
+
+        self.items.clear()
+
+    def render(
+            self,
+            img: np.ndarray
+    ) -> None:
+        """Draws every primitive onto the image in the order they were added
+
+        Parameters
+        ----------
+        img : numpy.ndarray
+            The image to draw on, in place
+        """
+
+        height, width = img.shape[:2]
+        for kind, colour, thickness, shapes in self.items:
+            if kind == 'polygons' and thickness < 0:
+                for corners in shapes:
+                    cv2.fillConvexPoly(img, corners, colour)  # pylint: disable=no-member
+            elif kind in ('polygons', 'lines'):
+                cv2.polylines(img, shapes, kind == 'polygons', colour, thickness)  # pylint: disable=no-member
+            elif kind == 'circles':
+                for x, y, radius in shapes:
+                    # Skip the circles that lie wholly outside the image, such as those of undetected keypoints
+                    if -radius <= x < width + radius and -radius <= y < height + radius:
+                        cv2.circle(img, (x, y), radius, colour, thickness)  # pylint: disable=no-member
+            elif kind == 'text':
+                for abs_x, abs_y, text, font_face, font_scale, line_type in shapes:
+                    if line_type == cv2.LINE_8:  # pylint: disable=no-member
+                        sprite_cache.get((text, colour, font_face, font_scale, thickness)).blend(img, abs_x, abs_y)
+                    else:
+                        cv2.putText(img, text, (abs_x, abs_y), font_face, font_scale,  # pylint: disable=no-member
+                                    colour, thickness, line_type)
+            else:
+                for x1, y1, x2, y2, opacity in shapes:
+                    # Only the pixels within the box are changed by the blend, so only they are blended
+                    region = img[max(min(y1, y2), 0):max(y1, y2) + 1, max(min(x1, x2), 0):max(x1, x2) + 1]
+                    if region.size:
+                        cv2.addWeighted(region, 1 - opacity, region, 0, 0, dst=region)  # pylint: disable=no-member
+
+
 def display_text(
         img,
         abs_x: int,
@@ -70,44 +368,69 @@ def display_text(
         Relative thickness of the text to display
     """
 
-    cv2.putText(  # pylint: disable=no-member
-        img=img,
-        text=text,
-        org=(abs_x, abs_y),
-        fontFace=font_face,
-        fontScale=font_scale,
-        color=font_colour,
-        thickness=font_thickness
-    )
-
-
-def obtain_keypoint(
-        rel_x: float,
-        rel_y: float,
-        img_width: int,
-        img_height: int
-) -> Coord:
-    """Obtains the coordinates of a detected PoseNet keypoint on a given image
+    sprite = sprite_cache.get((text, tuple(font_colour), font_face, font_scale, font_thickness))
+    sprite.blend(img, abs_x, abs_y)
+
+
+def display_stats(
+        img,
+        all_ids: Sequence[Any],
+        bboxes: Sequence[Sequence[int]],
+        max_angles: Mapping[Any, float],
+        min_angles: Mapping[Any, float],
+        reps: Mapping[Any, int],
+        angle_range: float,
+        draw_list: Optional[DrawList] = None
+) -> Dict[Any, int]:
+    """Displays the score and repetitions of each person above their bounding box
 
     Parameters
     ----------
-    rel_x : float
-        Relative horizontal position of the coordinate; \\( 0 \\le x_{rel} \\le 1 \\)
-    rel_y : float
-        Relative vertical position of the coordinate; \\( 0 \\le y_{rel} \\le 1 \\)
-    img_width : int
-        Width of the image in pixels
-    img_height : int
-        Height of the image in pixels
+    img
+        The image to display
+    all_ids : sequence
+        Tracking IDs of the detected people
+    bboxes : sequence
+        Absolute bounding boxes of the detected people in \\( (x_{1}, y_{1}, x_{2}, y_{2}) \\) format
+    max_angles : dict
+        Maximum obtained angle of each person
+    min_angles : dict
+        Minimum obtained angle of each person
+    reps : dict
+        Number of repetitions of each person
+    angle_range : float
+        Range of motion of the stretch in radians, corresponding to a score of 100%
+    draw_list : `DrawList`, optional
+        Draw list to add the text to, to be rendered later, instead of displaying it on the image
 
     Returns
     -------
-    `Coord`
-        Absolute coordinate \\( (x_{abs}, y_{abs}) \\) on the image;
-        \\( 0 \\le x_{abs} \\le width \\) and \\( 0 \\le y_{abs} \\le height \\).
+    dict
+        Score of each detected person.
     """
 
-    return round(rel_x * img_width), round(rel_y * img_height)
+    # Handle the detection of each person
+    draw = partial(display_text, img) if draw_list is None else draw_list.text
+    scores = {}
+    line_height = round(30 * _FONT_SCALE)  # height of each 'line' in pixels; 30 is arbitrary
+    for curr_id, bbox in zip(all_ids, bboxes):
+
+        # Obtain bounding box information
+        x1, _, x2, y = bbox
+        x = (x1 + x2) >> 1
+
+        # Calculate the score
+        max_angle = max_angles.get(curr_id, 0)
+        min_angle = min_angles.get(curr_id, angle_range)
+        score = max(min(max_angle - min_angle, angle_range), 0) / angle_range
+        scores[curr_id] = round(score * reps.get(curr_id, 0) * 10)
+
+        # Output the score
+        message = '-' if max_angle < min_angle else f'{(score * 100):0.2f}%'
+        draw(x, y - 2 * line_height, f'Score: {message}', (0, round(255 * score), round(255 * (1 - score))))
+        draw(x, y - line_height, f'Reps: {reps.get(curr_id, -1)}', (255, 255, 255))
+
+    return scores
 
 
 if __name__ == '__main__':
@@ -21,7 +21,7 @@ from typing import Any, Mapping, Optional
 
 from peekingduck.pipeline.nodes.abstract_node import AbstractNode
 
-from custom_nodes.draw.utils import _FONT_SCALE, display_text, obtain_keypoint
+from custom_nodes.draw.utils import DrawList, display_stats
 
 
 class Node(AbstractNode):
@@ -59,44 +59,26 @@ class Node(AbstractNode):
             # There must be an image to display
             self.logger.error(error_msg.format("'img'"))
             return {}
-        for key in ('bboxes', 'obj_attrs'):
+        for key in ('abs_bboxes', 'obj_attrs'):
             if key not in inputs:
                 # One or more metadata inputs are missing
                 self.logger.warning(error_msg.format(f"'{key}'"))
 
         # Get required inputs from pipeline
         img = inputs['img']
-        img_height, img_width, *_ = img.shape
         all_ids = inputs.get('obj_attrs', {}).get('ids', [])
-        bboxes = inputs.get('bboxes', [])
+        bboxes = inputs.get('abs_bboxes', [])
         max_angles = inputs.get('max_angle', {})
         min_angles = inputs.get('min_angle', {})
         reps = inputs.get('reps', {})
 
-        # Handle the detection of each person
-        scores = {}
-        line_height = round(30 * _FONT_SCALE)  # height of each 'line' in pixels; 30 is arbitrary
-        for curr_id, bbox in zip(all_ids, bboxes):
-
-            # Obtain bounding box information
-            x1, y1, x2, y2 = bbox
-            x1, _ = obtain_keypoint(x1, y1, img_width, img_height)
-            x2, y = obtain_keypoint(x2, y2, img_width, img_height)
-            x = (x1 + x2) >> 1
-
-            # Calculate the score
-            max_angle = max_angles.get(curr_id, 0)
-            min_angle = min_angles.get(curr_id, pi)
-            score = max(min(max_angle - min_angle, pi), 0) / pi
-            scores[curr_id] = round(score * reps.get(curr_id, 0) * 10)
-
-            # Output the score
-            message = '-' if max_angle < min_angle else f'{(score * 100):0.2f}%'
-            display_text(img, x, y - 2 * line_height, f'Score: {message}',
-                         (0, round(255 * score), round(255 * (1 - score))))
-            display_text(img, x, y - line_height, f'Reps: {reps.get(curr_id, -1)}', (255, 255, 255))
-
-        return {'scores': scores}
+        # Display and calculate the score of each person, or leave the text to be drawn by the overlay Node
+        draw_list = None if self.draw else DrawList()
+        scores = display_stats(img, all_ids, bboxes, max_angles, min_angles, reps, angle_range=pi, draw_list=draw_list)
+
+        if draw_list is None:
+            return {'scores': scores}
+        return {'scores': scores, 'stats_overlay': draw_list}
 
 
 if __name__ == '__main__':
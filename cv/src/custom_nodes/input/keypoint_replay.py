@@ -0,0 +1,134 @@
+"""Docstring for the keypoint_replay.py module
+
+This module implements a custom input Node class for replaying a recording of the keypoint_recorder Node
+straight into the dabble Nodes, without a camera or any model.
+
+The chunks of the recording are loaded and dequantized one at a time, and the recorded poses and
+tracking IDs of one frame are output per run, with a blank image of the recorded shape.
+The frames are replayed as fast as the downstream Nodes can analyse them, unless `fps` is set.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run --config_path replay_pipeline_config.yml
+```
+"""
+
+# pylint: disable=logging-format-interpolation
+
+import glob
+import os
+import time
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple
+
+import numpy as np
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.output.utils import CHUNK_NAME, split_chunk
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        self.chunk_paths = sorted(glob.glob(os.path.join(self.path, CHUNK_NAME.replace('{:06d}', '*'))))
+        if not self.chunk_paths:
+            self.logger.error(f'No recording found at {self.path}.')
+        self.logger.info(f'Replaying {len(self.chunk_paths)} chunks from {self.path}.')
+
+        # Implement trackers
+        self.frames = self._frames()
+        self.images: Dict[Tuple[int, int], np.ndarray] = {}
+        self.next_frame_at = time.perf_counter()
+
+    def _frames(self) -> Iterator[Dict[str, Any]]:
+        for chunk_path in self.chunk_paths:
+            with np.load(chunk_path) as chunk:
+                arrays = split_chunk(chunk)
+            offsets = arrays['offsets']
+            for i, (frame_index, img_shape) in enumerate(zip(arrays['frame_index'].tolist(),
+                                                              arrays['img_shape'].tolist())):
+                start, end = offsets[i], offsets[i + 1]
+                yield {
+                    'img': self._blank(*img_shape),
+                    'bboxes': arrays['bboxes'][start:end],
+                    'keypoints': arrays['keypoints'][start:end],
+                    'obj_attrs': {'ids': arrays['ids'][start:end].tolist()},
+                    'frame_index': frame_index,
+                    'pipeline_end': False
+                }
+
+    def _blank(self, height: int, width: int) -> np.ndarray:
+
+        # Reuse one blank image per shape, as only the shape of the image is needed by the dabble Nodes
+        if (height, width) not in self.images:
+            self.images[(height, width)] = np.zeros((height, width, 3), dtype=np.uint8)
+        return self.images[(height, width)]
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Returns the recorded inputs of the dabble Nodes on the next frame
+
+        Parameters
+        ----------
+        inputs : dict
+            Empty dictionary.
+
+        Returns
+        -------
+        dict
+            Dictionary with the following keys:
+
+            - 'img' - blank image of the recorded shape
+            - 'bboxes' - recorded relative bounding boxes of each pose
+            - 'keypoints' - recorded relative keypoints of each pose
+            - 'obj_attrs' - dictionary with the recorded tracking IDs under the 'ids' key
+            - 'frame_index' - index of the frame since the start of the recording
+            - 'pipeline_end' - whether every recorded frame has been replayed
+        """
+
+        # Pace the replay, if required
+        if self.fps:
+            time.sleep(max(self.next_frame_at - time.perf_counter(), 0))
+            self.next_frame_at = max(self.next_frame_at, time.perf_counter() - 1) + 1 / self.fps
+
+        outputs = next(self.frames, None)
+        if outputs is None:
+            return {
+                'img': self._blank(1, 1),
+                'bboxes': np.empty((0, 4)),
+                'keypoints': np.empty((0, 17, 2)),
+                'obj_attrs': {'ids': []},
+                'frame_index': -1,
+                'pipeline_end': True
+            }
+        return outputs
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,167 @@
+"""Docstring for the crop_posenet.py module
+
+This module implements a custom model Node class for estimating poses top-down on person crops.
+
+The PoseNet model is run on the full frame only to (re)detect people. On the other frames, each person
+is cropped around their bounding box from the previous frame, the crop is estimated by a PoseNet model
+with a smaller input resolution, and the keypoints are mapped back to coordinates relative to the full frame.
+The outputs are identical in format to those of model.posenet, so the downstream Nodes need not be changed.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+from typing import Any, Dict, List, Mapping, Optional
+
+import numpy as np
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+from peekingduck.pipeline.nodes.model import posenet
+
+from custom_nodes.dabble.utils import iou_matrix
+from custom_nodes.model.utils import map_to_frame, no_poses, obtain_crop_region
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Load one PoseNet model for the full frame, and a smaller one for the person crops
+        self.frame_model = posenet.Node(
+            model_type=self.model_type,
+            resolution=self.frame_resolution,
+            score_threshold=self.score_threshold
+        )
+        self.crop_model = posenet.Node(
+            model_type=self.model_type,
+            resolution=self.crop_resolution,
+            max_pose_detection=1,
+            score_threshold=self.score_threshold
+        )
+
+        # Implement trackers
+        self.bboxes = np.empty((0, 4))
+        self.frames_since_detection = 0
+
+    def reset(self) -> None:
+        """Forgets the people of the previous frame, so that the next frame is estimated in full"""
+
+        self.bboxes = np.empty((0, 4))
+        self.frames_since_detection = 0
+
+    def _run_crops(
+            self,
+            img: np.ndarray
+    ) -> Optional[Dict[str, Any]]:
+
+        img_height, img_width = img.shape[:2]
+        bboxes: List[np.ndarray] = []
+        keypoints: List[np.ndarray] = []
+        keypoint_scores: List[np.ndarray] = []
+        keypoint_conns: List[np.ndarray] = []
+        for bbox in self.bboxes:
+            region = obtain_crop_region(bbox, img_width, img_height, self.margin)
+            x1, y1, x2, y2 = region
+            if x2 <= x1 or y2 <= y1:
+                continue
+            outputs = self.crop_model.run({'img': img[y1:y2, x1:x2]})
+            if not len(outputs['keypoints']):
+                continue
+
+            # Keep only the most confident pose, in case another person is partially in the crop
+            best = int(np.argmax(np.mean(outputs['keypoint_scores'], axis=1)))
+            bboxes.append(map_to_frame(np.reshape(outputs['bboxes'][best], (2, 2)), region,
+                                       img_width, img_height).ravel())
+            keypoints.append(map_to_frame(outputs['keypoints'][best], region, img_width, img_height))
+            keypoint_scores.append(outputs['keypoint_scores'][best])
+            keypoint_conns.append(map_to_frame(outputs['keypoint_conns'][best], region, img_width, img_height))
+
+        # Re-detect people on the full frame if everyone was lost
+        if not bboxes:
+            return None
+
+        # Drop the poses found twice by overlapping crops
+        bboxes_arr = np.array(bboxes)
+        ious = np.triu(iou_matrix(bboxes_arr, bboxes_arr), k=1)
+        keep = ~(ious >= self.duplicate_iou_threshold).any(axis=0)
+        conns = np.empty(np.count_nonzero(keep), dtype=object)
+        conns[:] = [conn for conn, kept in zip(keypoint_conns, keep) if kept]
+        return {
+            'bboxes': bboxes_arr[keep],
+            'keypoints': np.array(keypoints)[keep],
+            'keypoint_scores': np.array(keypoint_scores)[keep],
+            'keypoint_conns': conns,
+            'bbox_labels': ['Person'] * len(conns)
+        }
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Returns the poses detected in the given image
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'img' - given image to estimate poses on
+
+        Returns
+        -------
+        dict
+            Dictionary with the same keys as model.posenet:
+
+            - 'bboxes' - relative bounding boxes of each pose, of shape (N, 4)
+            - 'keypoints' - relative keypoints of each pose, of shape (N, 17, 2)
+            - 'keypoint_scores' - confidence scores of each keypoint, of shape (N, 17)
+            - 'keypoint_conns' - relative coordinates of the connections between keypoints of each pose
+            - 'bbox_labels' - 'Person' label of each pose
+        """
+
+        # Check if required inputs are in pipeline
+        if 'img' not in inputs:
+            # One or more metadata inputs are missing
+            self.logger.warning("The input dictionary does not contain the 'img' key.")
+            return no_poses()
+
+        # Estimate the poses on the person crops, if any, unless it is time to look for new people
+        outputs = None
+        self.frames_since_detection += 1
+        if len(self.bboxes) and self.frames_since_detection < self.redetect_interval:
+            outputs = self._run_crops(inputs['img'])
+        if outputs is None:
+            outputs = self.frame_model.run({'img': inputs['img']})
+            self.frames_since_detection = 0
+
+        self.bboxes = np.asarray(outputs['bboxes'], dtype=float).reshape(-1, 4)
+        return outputs
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,181 @@
+"""Docstring for the keyframe_posenet.py module
+
+This module implements a custom model Node class for estimating poses on keyframes only.
+
+Pose estimation is run every `keyframe_interval` frames, or earlier if the image has changed noticeably
+since the last keyframe. On the frames in between, the keypoints of each person are extrapolated from
+their last two keyframes, so that the downstream Nodes still receive poses on every frame.
+The keyframe interval and the fraction of frames that poses were estimated on are output for the legend,
+and recorded in the metrics if the metrics Node is in the pipeline.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+from typing import Any, Dict, Mapping, Optional
+
+import numpy as np
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.dabble.pose_tracking import Tracker
+from custom_nodes.model import crop_posenet
+from custom_nodes.model.utils import no_poses, obtain_pose_outputs
+from custom_nodes.output.utils import MetricsBlock
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Load the pose estimation model run on the keyframes, configured by the pose_model config only
+        self.model = crop_posenet.Node(self.pose_model, pkd_base_dir=kwargs.get('pkd_base_dir'))
+        self.tracker = Tracker(self.iou_threshold, max_lost=0)
+
+        # Implement trackers
+        self.frame = 0
+        self.num_keyframes = 0
+        self.last_keyframe = -1
+        self.thumbnail: Optional[np.ndarray] = None
+        self.keypoints: Dict[int, np.ndarray] = {}
+        self.velocities: Dict[int, np.ndarray] = {}
+        self.keypoint_scores: Dict[int, np.ndarray] = {}
+
+    def reset(self) -> None:
+        """Forgets the last keyframes and the people tracked on them, so that the next frame is a keyframe"""
+
+        self.model.reset()
+        self.tracker = Tracker(self.iou_threshold, max_lost=0)
+        self.frame = 0
+        self.num_keyframes = 0
+        self.last_keyframe = -1
+        self.thumbnail = None
+        self.keypoints.clear()
+        self.velocities.clear()
+        self.keypoint_scores.clear()
+
+    def _is_keyframe(
+            self,
+            thumbnail: np.ndarray
+    ) -> bool:
+
+        if self.thumbnail is None or self.frame - self.last_keyframe >= self.keyframe_interval:
+            return True
+
+        # Run the model early if the image has changed noticeably since the last keyframe
+        return float(np.mean(np.abs(thumbnail - self.thumbnail))) > self.motion_threshold
+
+    def _update_keyframe(
+            self,
+            outputs: Mapping[str, Any]
+    ) -> None:
+
+        keypoints = np.asarray(outputs['keypoints'], dtype=float).reshape(-1, 17, 2)
+        elapsed = self.frame - self.last_keyframe
+        velocities, last_keypoints, keypoint_scores = {}, {}, {}
+        for curr_id, pose, scores in zip(self.tracker.update(outputs['bboxes']).tolist(), keypoints,
+                                         outputs['keypoint_scores']):
+
+            # Only extrapolate the keypoints detected in both of the last two keyframes
+            velocity = np.zeros_like(pose)
+            if curr_id in self.keypoints:
+                prev_pose = self.keypoints[curr_id]
+                detected = ((pose != -1) & (prev_pose != -1)).all(axis=1)
+                velocity[detected] = (pose[detected] - prev_pose[detected]) / elapsed
+            velocities[curr_id] = velocity
+            last_keypoints[curr_id] = pose
+            keypoint_scores[curr_id] = scores
+
+        self.keypoints, self.velocities, self.keypoint_scores = last_keypoints, velocities, keypoint_scores
+        self.last_keyframe = self.frame
+        self.num_keyframes += 1
+
+    def _extrapolate(self) -> Dict[str, Any]:
+
+        if not self.keypoints:
+            return no_poses()
+
+        elapsed = self.frame - self.last_keyframe
+        keypoints = np.array([
+            np.where(pose == -1, -1, np.clip(pose + self.velocities[curr_id] * elapsed, 0, 1))
+            for curr_id, pose in self.keypoints.items()
+        ])
+        return obtain_pose_outputs(keypoints, np.array(list(self.keypoint_scores.values())))
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Returns the poses estimated on keyframes, or extrapolated in between keyframes
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'img' - given image to estimate poses on
+
+        Returns
+        -------
+        dict
+            Dictionary with the same keys as model.posenet, and the following keys:
+
+            - 'keyframe_interval' - maximum number of frames between keyframes
+            - 'keyframe_ratio' - fraction of frames so far that pose estimation was run on
+        """
+
+        # Check if required inputs are in pipeline
+        if 'img' not in inputs:
+            # One or more metadata inputs are missing
+            self.logger.warning("The input dictionary does not contain the 'img' key.")
+            return no_poses()
+
+        # Compare a downsampled greyscale copy of the image to detect motion cheaply
+        img = inputs['img']
+        thumbnail = img[::self.motion_stride, ::self.motion_stride].mean(axis=2, dtype=np.float32)
+        if self._is_keyframe(thumbnail):
+            outputs = dict(self.model.run({'img': img}))
+            self._update_keyframe(outputs)
+            self.thumbnail = thumbnail
+        else:
+            outputs = dict(self._extrapolate())
+        self.frame += 1
+
+        outputs['keyframe_interval'] = self.keyframe_interval
+        outputs['keyframe_ratio'] = round(self.num_keyframes / self.frame, 2)
+
+        # Report both in the metrics too if the metrics Node is in the pipeline
+        metrics = MetricsBlock.active
+        if metrics is not None:
+            metrics.keyframe_interval[0] = self.keyframe_interval
+            metrics.keyframe_ratio[0] = self.num_keyframes / self.frame
+        return outputs
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,123 @@
+"""Docstring for the remote_posenet.py module
+
+This module implements a custom model Node class for estimating poses on a shared pose server.
+
+Instead of loading its own PoseNet model, the Node downscales each frame to the tile size of the
+pose server and sends it over a local TCP connection. The server batches the frames of several streams
+into a single model call, see pose_server.py, and sends back the poses found on this frame.
+The outputs are identical in format to those of model.posenet, so the downstream Nodes need not be changed.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Start the pose server, then navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+# pylint: disable=logging-format-interpolation
+
+import socket
+import time
+from typing import Any, Mapping, Optional
+
+import cv2
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.model.utils import POSE_HOST, no_poses, obtain_pose_outputs, recv_poses, send_frame
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Implement trackers
+        self.sock: Optional[socket.socket] = None
+        self.retry_at = 0.0
+
+    def _connect(self) -> Optional[socket.socket]:
+
+        # Only retry an unreachable server every `retry_interval` seconds, so the pipeline keeps running meanwhile
+        if self.sock is None and time.monotonic() >= self.retry_at:
+            try:
+                self.sock = socket.create_connection((POSE_HOST, self.port), timeout=self.timeout)
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.logger.info(f'Connected to the pose server on port {self.port}.')
+            except OSError as error:
+                self.logger.warning(f'Unable to reach the pose server on port {self.port}: {error}')
+                self.retry_at = time.monotonic() + self.retry_interval
+        return self.sock
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping[str, Any]:
+        """Returns the poses estimated by the pose server on the given image
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'img' - given image to estimate poses on
+
+        Returns
+        -------
+        dict
+            Dictionary with the same keys as model.posenet:
+
+            - 'bboxes' - relative bounding boxes of each pose, of shape (N, 4)
+            - 'keypoints' - relative keypoints of each pose, of shape (N, 17, 2)
+            - 'keypoint_scores' - confidence scores of each keypoint, of shape (N, 17)
+            - 'keypoint_conns' - relative coordinates of the connections between keypoints of each pose
+            - 'bbox_labels' - 'Person' label of each pose
+        """
+
+        # Check if required inputs are in pipeline
+        if 'img' not in inputs:
+            # One or more metadata inputs are missing
+            self.logger.warning("The input dictionary does not contain the 'img' key.")
+            return no_poses()
+
+        sock = self._connect()
+        if sock is None:
+            return no_poses()
+
+        # Keypoints are relative to the frame, so they are unaffected by the downscaling
+        img = cv2.resize(inputs['img'], (self.tile['width'], self.tile['height']), interpolation=cv2.INTER_AREA)
+        try:
+            send_frame(sock, img)
+            keypoints, keypoint_scores = recv_poses(sock)
+        except OSError as error:
+            self.logger.warning(f'Lost the connection to the pose server: {error}')
+            sock.close()
+            self.sock = None
+            return no_poses()
+
+        return obtain_pose_outputs(keypoints, keypoint_scores)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,290 @@
+"""Docstring for the model/utils.py script
+
+This script contains constants and other miscellaneous functions
+for the rest of the scripts in the model module to use.
+
+Usage
+-----
+This script is not meant to be used independently.
+"""
+
+# pylint: disable=invalid-name
+
+import socket
+import struct
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+"""Type-hinting alias for an absolute crop region (x1, y1, x2, y2)"""  # pylint: disable=pointless-string-statement
+Region = Tuple[int, int, int, int]
+
+
+"""Defines the pairs of keypoints connected when drawing a pose"""  # pylint: disable=pointless-string-statement
+SKELETON = (
+    (15, 13), (13, 11), (16, 14), (14, 12), (11, 12),
+    (5, 11), (6, 12), (5, 6), (5, 7), (6, 8),
+    (7, 9), (8, 10), (1, 2), (0, 1), (0, 2), (1, 3),
+    (2, 4), (3, 5), (4, 6)
+)
+
+
+"""Defines the localhost address of the pose server, see pose_server.py"""  # pylint: disable=pointless-string-statement
+POSE_HOST = '127.0.0.1'
+POSE_PORT = 9253
+
+
+"""Defines the headers of the messages of the pose server
+
+Frame requests start with (height, width), and pose replies with the number of poses.
+"""  # pylint: disable=pointless-string-statement
+FRAME_HEADER = struct.Struct('<HH')
+POSES_HEADER = struct.Struct('<H')
+
+
+def no_poses() -> Dict[str, Any]:
+    """Returns the outputs of the PoseNet model for a frame without any detected poses
+
+    A new dictionary is returned on every call, as the outputs are merged into the data of the pipeline,
+    where the following Nodes may modify them in place.
+    """
+
+    return {
+        'bboxes': np.empty((0, 4)),
+        'keypoints': np.empty((0, 17, 2)),
+        'keypoint_scores': np.empty((0, 17)),
+        'keypoint_conns': np.empty((0,), dtype=object),
+        'bbox_labels': []
+    }
+
+
+def obtain_crop_region(
+        bbox,
+        img_width: int,
+        img_height: int,
+        margin: float
+) -> Region:
+    """Obtains the square region of an image to crop around a relative bounding box
+
+    Parameters
+    ----------
+    bbox : array_like
+        Relative bounding box \\( (x_{1}, y_{1}, x_{2}, y_{2}) \\) to crop around
+    img_width : int
+        Width of the image in pixels
+    img_height : int
+        Height of the image in pixels
+    margin : float
+        Padding to add on every side of the bounding box, relative to its longer side
+
+    Returns
+    -------
+    `Region`
+        Absolute region \\( (x_{1}, y_{1}, x_{2}, y_{2}) \\) of the image to crop,
+        clipped to the borders of the image.
+    """
+
+    x1, y1, x2, y2 = np.asarray(bbox, dtype=float) * (img_width, img_height, img_width, img_height)
+    half_side = max(x2 - x1, y2 - y1) * (0.5 + margin)
+    centre_x, centre_y = (x1 + x2) / 2, (y1 + y2) / 2
+    return (
+        max(int(centre_x - half_side), 0),
+        max(int(centre_y - half_side), 0),
+        min(int(np.ceil(centre_x + half_side)), img_width),
+        min(int(np.ceil(centre_y + half_side)), img_height)
+    )
+
+
+def obtain_pose_outputs(
+        keypoints: np.ndarray,
+        keypoint_scores: np.ndarray
+) -> Dict[str, Any]:
+    """Obtains the outputs of the PoseNet model from the given relative keypoints, as done by PoseNet
+
+    Parameters
+    ----------
+    keypoints : numpy.ndarray
+        Relative keypoints of shape \\( (N, 17, 2) \\), with \\( -1 \\) for undetected keypoints
+    keypoint_scores : numpy.ndarray
+        Confidence scores of shape \\( (N, 17) \\) of the keypoints
+
+    Returns
+    -------
+    dict
+        Dictionary with the same keys as `no_poses()`, where the bounding box of each pose
+        borders its detected keypoints.
+    """
+
+    bboxes = np.zeros((len(keypoints), 4))
+    keypoint_conns = np.empty(len(keypoints), dtype=object)
+    for i, pose in enumerate(keypoints):
+        detected = (pose != -1).all(axis=1)
+        if detected.any():
+            bboxes[i] = *pose[detected].min(axis=0), *pose[detected].max(axis=0)
+        keypoint_conns[i] = np.array([(pose[start], pose[end]) for start, end in SKELETON
+                                      if detected[start] and detected[end]])
+    return {
+        'bboxes': bboxes,
+        'keypoints': keypoints,
+        'keypoint_scores': keypoint_scores,
+        'keypoint_conns': keypoint_conns,
+        'bbox_labels': ['Person'] * len(keypoints)
+    }
+
+
+def map_to_frame(
+        rel_coords: np.ndarray,
+        region: Region,
+        img_width: int,
+        img_height: int
+) -> np.ndarray:
+    """Maps coordinates relative to a cropped region back to coordinates relative to the full image
+
+    Parameters
+    ----------
+    rel_coords : numpy.ndarray
+        Coordinates of shape \\( (..., 2) \\) relative to the cropped region;
+        coordinates of \\( -1 \\) mark undetected keypoints and are left as is
+    region : `Region`
+        Absolute region \\( (x_{1}, y_{1}, x_{2}, y_{2}) \\) of the crop, see `obtain_crop_region`
+    img_width : int
+        Width of the image in pixels
+    img_height : int
+        Height of the image in pixels
+
+    Returns
+    -------
+    numpy.ndarray
+        Coordinates of shape \\( (..., 2) \\) relative to the full image.
+    """
+
+    x1, y1, x2, y2 = region
+    rel_coords = np.asarray(rel_coords, dtype=float)
+    mapped = (rel_coords * (x2 - x1, y2 - y1) + (x1, y1)) / (img_width, img_height)
+    return np.where(rel_coords == -1, -1, mapped)
+
+
+def _recv_exact(
+        sock: socket.socket,
+        num_bytes: int
+) -> bytes:
+
+    buffer = bytearray(num_bytes)
+    view = memoryview(buffer)
+    received = 0
+    while received < num_bytes:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError('connection closed by the peer')
+        received += count
+    return bytes(buffer)
+
+
+def send_frame(
+        sock: socket.socket,
+        img: np.ndarray
+) -> None:
+    """Sends a BGR image of shape \\( (H, W, 3) \\) to the pose server"""
+
+    sock.sendall(FRAME_HEADER.pack(*img.shape[:2]) + np.ascontiguousarray(img, dtype=np.uint8).tobytes())
+
+
+def recv_frame(sock: socket.socket) -> np.ndarray:
+    """Receives a BGR image sent by `send_frame()`
+
+    Raises
+    ------
+    ConnectionError
+        If the connection is closed before the whole image is received.
+    """
+
+    height, width = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    return np.frombuffer(_recv_exact(sock, height * width * 3), dtype=np.uint8).reshape(height, width, 3)
+
+
+def send_poses(
+        sock: socket.socket,
+        keypoints: np.ndarray,
+        keypoint_scores: np.ndarray
+) -> None:
+    """Sends the relative keypoints \\( (N, 17, 2) \\) and their scores \\( (N, 17) \\) back to a pose client"""
+
+    sock.sendall(POSES_HEADER.pack(len(keypoints)) + np.asarray(keypoints, dtype='<f4').tobytes()
+                 + np.asarray(keypoint_scores, dtype='<f4').tobytes())
+
+
+def recv_poses(sock: socket.socket) -> Tuple[np.ndarray, np.ndarray]:
+    """Receives the keypoints and keypoint scores sent by `send_poses()`
+
+    Raises
+    ------
+    ConnectionError
+        If the connection is closed before all the poses are received.
+    """
+
+    (num_poses,) = POSES_HEADER.unpack(_recv_exact(sock, POSES_HEADER.size))
+    data = _recv_exact(sock, num_poses * 17 * 3 * 4)
+    keypoints = np.frombuffer(data, dtype='<f4', count=num_poses * 17 * 2).reshape(num_poses, 17, 2)
+    keypoint_scores = np.frombuffer(data, dtype='<f4', offset=num_poses * 17 * 2 * 4).reshape(num_poses, 17)
+    return keypoints.astype(float), keypoint_scores.astype(float)
+
+
+def obtain_mosaic_grid(num_tiles: int) -> Tuple[int, int]:
+    """Obtains the number of (rows, columns) of the most square grid with at least the given number of tiles"""
+
+    cols = int(np.ceil(np.sqrt(num_tiles)))
+    return int(np.ceil(num_tiles / cols)), cols
+
+
+def split_mosaic_poses(
+        keypoints: np.ndarray,
+        keypoint_scores: np.ndarray,
+        rows: int,
+        cols: int,
+        num_tiles: int
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Splits the poses estimated on a mosaic of tiles into the poses of each tile
+
+    Each pose is assigned to the tile containing the median of its detected keypoints, and any
+    of its keypoints spilling over into a neighbouring tile are marked as undetected.
+
+    Parameters
+    ----------
+    keypoints : numpy.ndarray
+        Keypoints of shape \\( (N, 17, 2) \\) relative to the mosaic, with \\( -1 \\) for undetected keypoints
+    keypoint_scores : numpy.ndarray
+        Confidence scores of shape \\( (N, 17) \\) of the keypoints
+    rows : int
+        Number of rows of tiles in the mosaic
+    cols : int
+        Number of columns of tiles in the mosaic
+    num_tiles : int
+        Number of tiles filled in row-major order, starting from the top-left tile
+
+    Returns
+    -------
+    list
+        Keypoints relative to the tile, and keypoint scores, of the poses of each filled tile.
+    """
+
+    poses: List[Tuple[List[np.ndarray], List[np.ndarray]]] = [([], []) for _ in range(num_tiles)]
+    for pose, scores in zip(keypoints, keypoint_scores):
+        detected = (pose != -1).all(axis=1)
+        if not detected.any():
+            continue
+        grid_coords = pose * (cols, rows)
+        col, row = np.clip(np.floor(np.median(grid_coords[detected], axis=0)), 0, (cols - 1, rows - 1)).astype(int)
+        tile = row * cols + col
+        if tile >= num_tiles:
+            continue
+        tile_coords = grid_coords - (col, row)
+        inside = detected & ((tile_coords >= 0) & (tile_coords <= 1)).all(axis=1)
+        poses[tile][0].append(np.where(inside[:, None], tile_coords, -1))
+        poses[tile][1].append(np.where(inside, scores, 0))
+    return [(np.array(tile_keypoints).reshape(-1, 17, 2), np.array(tile_scores).reshape(-1, 17))
+            for tile_keypoints, tile_scores in poses]
+
+
+if __name__ == '__main__':
+    pass
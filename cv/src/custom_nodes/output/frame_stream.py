@@ -0,0 +1,169 @@
+"""Docstring for the frame_stream.py module
+
+This module implements a custom output Node class for streaming the annotated frames of the pipeline
+to the web app, as an MJPEG stream served over HTTP from the '/frames' route of the configured port.
+
+Frames are only resized and encoded while at least one viewer is connected, and each frame is encoded once
+and shared by every viewer through a `FrameHub`, see the output/utils.py script. A viewer that cannot keep up
+skips to the latest frame, so a slow viewer never holds up the pipeline or the other viewers.
+The stream can be shown by an `<img>` element, as done by the stretchCam.js component of the web app
+when its `NEXT_PUBLIC_FRAME_SERVER` environment variable points at the Node.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+# pylint: disable=logging-format-interpolation
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+from typing import Any, Mapping, Optional
+from urllib.parse import urlparse
+
+import cv2
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.output.utils import FrameHub
+
+
+# Define constants
+BOUNDARY = b'frame'
+
+"""Defines the seconds without a new frame after which the latest frame is sent again
+
+It keeps the viewers of a paused pipeline connected, and detects the viewers that have disconnected meanwhile.
+"""  # pylint: disable=pointless-string-statement
+KEEPALIVE_INTERVAL = 15.0
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        self.hub = FrameHub()
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)]  # pylint: disable=no-member
+
+        # Serve the stream on its own threads, so that the viewers never wait on the pipeline or each other
+        self.server = None
+        try:
+            self.server = _Server((self.host, self.port), _Handler)
+        except OSError as error:
+            self.logger.error(f'Unable to serve the frames on port {self.port}: {error}')
+            return
+        self.server.hub = self.hub
+        self.server.logger = self.logger
+        threading.Thread(target=self.server.serve_forever, name='frame-stream', daemon=True).start()
+        self.logger.info(f'Streaming the frames on http://{self.host}:{self.port}/frames while they are viewed.')
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping:
+        """Encodes the given frame for the viewers of the stream, if there are any
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'img' - annotated image to stream
+
+        Returns
+        -------
+        dict
+            Empty dictionary.
+        """
+
+        if not self.hub.viewers:
+            return {}
+
+        # Only ever scale the frames down, keeping their aspect ratio
+        img = inputs['img']
+        if 0 < self.width < img.shape[1]:
+            size = (self.width, round(img.shape[0] * self.width / img.shape[1]))
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)  # pylint: disable=no-member
+        success, jpeg = cv2.imencode('.jpg', img, self.params)  # pylint: disable=no-member
+        if success:
+            self.hub.publish(jpeg.tobytes())
+
+        return {}
+
+
+class _Server(ThreadingHTTPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+    hub: Any = None
+    logger: logging.Logger = logging.getLogger(__name__)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    # Drop the viewers that stop reading, instead of keeping their threads blocked
+    timeout = 10.0
+    server: _Server
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        if urlparse(self.path).path != '/frames':
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', f"multipart/x-mixed-replace; boundary={BOUNDARY.decode('ascii')}")
+        self.send_header('Cache-Control', 'no-cache, no-store')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        # Send the latest frame whenever it is replaced, skipping any frame replaced while the last was sent
+        hub = self.server.hub
+        try:
+            with hub.subscribe():
+                version = hub.version
+                while True:
+                    version, frame = hub.wait(version, KEEPALIVE_INTERVAL)
+                    if frame is None:
+                        # Write to the viewer even without a new frame, so that a disconnected viewer raises,
+                        # sending the latest frame again or, before the first frame, a line of the preamble
+                        frame = hub.frame
+                        if frame is None:
+                            self.wfile.write(b'\r\n')
+                            continue
+                    self.wfile.write(b'--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n%s\r\n'
+                                     % (BOUNDARY, len(frame), frame))
+        except OSError:
+            # The viewer has disconnected
+            pass
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        self.server.logger.debug(format, *args)
+
+
+if __name__ == '__main__':
+    pass
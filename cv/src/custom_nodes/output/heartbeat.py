@@ -0,0 +1,102 @@
+"""Docstring for the heartbeat.py module
+
+This module implements a custom output Node class for reporting the frame rate of the pipeline
+to a supervising process, such as the multi-camera orchestrator.
+
+Every `interval` seconds, a JSON datagram with the name of the stream, the process ID and the number of frames
+processed since the last heartbeat is sent over UDP to the configured port on localhost.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+# pylint: disable=logging-format-interpolation
+
+import json
+import os
+import socket
+import time
+from typing import Any, Mapping, Optional
+
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Implement trackers
+        self.frames = 0
+        self.last_sent = time.monotonic()
+
+        # Open the socket to send the heartbeats with, if enabled
+        self.sock = None
+        if self.port:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping:
+        """Counts the given frame, and sends a heartbeat if it is due
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'img' - given image, only to count the frames
+
+        Returns
+        -------
+        dict
+            Empty dictionary.
+        """
+
+        if self.sock is None:
+            return {}
+
+        self.frames += 1
+        now = time.monotonic()
+        if now - self.last_sent >= self.interval:
+            heartbeat = {'stream': str(self.stream), 'pid': os.getpid(),
+                         'frames': self.frames, 'seconds': now - self.last_sent}
+            try:
+                self.sock.sendto(json.dumps(heartbeat).encode('utf-8'), ('127.0.0.1', self.port))
+            except OSError as error:
+                self.logger.debug(f'Unable to send heartbeat: {error}')
+            self.frames = 0
+            self.last_sent = now
+
+        return {}
+
+
+if __name__ == '__main__':
+    pass
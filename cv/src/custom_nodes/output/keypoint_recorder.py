@@ -0,0 +1,143 @@
+"""Docstring for the keypoint_recorder.py module
+
+This module implements a custom output Node class for recording the inputs of the dabble Nodes,
+such that a session can be analysed again without the camera or the models, see input/keypoint_replay.py.
+
+The relative keypoints and bounding boxes, tracking IDs and image shape of every frame are buffered in memory,
+and saved every `chunk_frames` frames as a chunk of int16-quantized NumPy arrays, see the output/utils.py script.
+Every run is recorded into its own directory under `path`, named after its start time and process ID.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+# pylint: disable=logging-format-interpolation
+
+import os
+import time
+from typing import Any, List, Mapping, Optional
+
+import numpy as np
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.output.utils import CHUNK_NAME, quantize
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        # Implement trackers
+        self.recording_path = os.path.join(self.path, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        self.frame_index = 0
+        self.num_chunks = 0
+        self.img_shapes: List[Any] = []
+        self.counts: List[int] = []
+        self.ids: List[Any] = []
+        self.keypoints: List[np.ndarray] = []
+        self.bboxes: List[np.ndarray] = []
+
+    def _save(self) -> None:
+
+        if not self.counts:
+            return
+        chunk_path = os.path.join(self.recording_path, CHUNK_NAME.format(self.num_chunks))
+        try:
+            os.makedirs(self.recording_path, exist_ok=True)
+            np.savez(
+                chunk_path,
+                frame_index=np.arange(self.frame_index - len(self.counts), self.frame_index, dtype='<i8'),
+                img_shape=np.array(self.img_shapes, dtype='<u2'),
+                counts=np.array(self.counts, dtype='<u2'),
+                ids=np.array(self.ids, dtype='<i4'),
+                keypoints=quantize(np.concatenate(self.keypoints).reshape(-1, 17, 2)),
+                bboxes=quantize(np.concatenate(self.bboxes).reshape(-1, 4))
+            )
+        except OSError as error:
+            self.logger.error(f'Unable to save {len(self.counts)} frames to {chunk_path}: {error}')
+        self.num_chunks += 1
+        for buffer in (self.img_shapes, self.counts, self.ids, self.keypoints, self.bboxes):
+            buffer.clear()
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping:
+        """Buffers the inputs of the dabble Nodes on the given frame, and saves them once a chunk is full
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'img' - given image, only to record its shape
+            - 'bboxes' - relative bounding boxes of each pose from the pose model Node
+            - 'keypoints' - relative keypoints of each pose from the pose model Node
+            - 'obj_attrs' - dictionary with the tracking IDs under the 'ids' key
+            - 'pipeline_end' - whether the pipeline has ended, to save the last chunk
+
+        Returns
+        -------
+        dict
+            Empty dictionary.
+        """
+
+        if inputs.get('pipeline_end', False):
+            self._save()
+            return {}
+
+        # Check if required inputs are in pipeline
+        error_msg = 'The input dictionary does not contain the {} key.'
+        for key in ('img', 'bboxes', 'keypoints', 'obj_attrs'):
+            if key not in inputs:
+                # One or more metadata inputs are missing
+                self.logger.error(error_msg.format(f"'{key}'"))
+                return {}
+
+        # Pad or trim the tracking IDs to one per pose, so the per-person arrays stay aligned
+        ids = list(inputs['obj_attrs'].get('ids', []))
+        num_poses = len(inputs['keypoints'])
+        if len(ids) != num_poses:
+            self.logger.warning(f'Recording {num_poses} poses with {len(ids)} tracking IDs.')
+            ids = (ids + [-1] * num_poses)[:num_poses]
+
+        self.img_shapes.append(inputs['img'].shape[:2])
+        self.counts.append(len(ids))
+        self.ids.extend(ids)
+        self.keypoints.append(np.asarray(inputs['keypoints'], dtype=float))
+        self.bboxes.append(np.asarray(inputs['bboxes'], dtype=float))
+        self.frame_index += 1
+        if len(self.counts) >= self.chunk_frames:
+            self._save()
+
+        return {}
+
+
+if __name__ == '__main__':
+    pass
@@ -1,7 +1,136 @@
-from typing import Any, Mapping, Optional
+"""Docstring for the local_save.py module
 
+This module implements a custom output Node class for saving the score of each person to a local file.
+
+Scores are kept in memory, and only the scores that have changed since the last flush are appended
+to the file in batches by a background writer thread, such that the pipeline never waits on the disk.
+Each score update is saved as a fixed-width binary `SCORE_RECORD`, see the output/utils.py script.
+The pending scores are saved when the pipeline ends, which the run_pipeline.py script of the root directory
+also ensures when its process is terminated.
+
+The changed scores of every frame are also published immediately as a UDP datagram of records
+to the score server on localhost, such that it does not need to poll the file.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+"""
+
+# pylint: disable=logging-format-interpolation
+
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import numpy as np
 from peekingduck.pipeline.nodes.abstract_node import AbstractNode
 
+from custom_nodes.output.utils import SCORE_HOST, SCORE_RECORD, MetricsBlock, obtain_records
+
+
+"""Defines the supported durability policies of each flush"""  # pylint: disable=pointless-string-statement
+DURABILITY = ('os', 'fsync')
+
+
+class ScoreWriter(threading.Thread):
+    """Appends the pending score updates to a file in batches, on a background thread"""
+
+    def __init__(
+            self,
+            path: str,
+            session: int,
+            flush_interval: float,
+            durability: str,
+            logger: Any
+    ) -> None:
+        """Initialises the writer thread
+
+        Parameters
+        ----------
+        path : str
+            Path of the file to append the scores to
+        session : int
+            Identifies the pipeline run that saved the scores
+        flush_interval : float
+            Number of seconds between flushes
+        durability : str
+            'os' to leave the written scores to the operating system to persist,
+            or 'fsync' to force them to disk on every flush
+        logger : logging.Logger
+            Logger of the Node hosting the writer
+        """
+
+        super().__init__(name='score-writer', daemon=True)
+        self.path = path
+        self.session = session
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.logger = logger
+
+        # Implement trackers
+        self._lock = threading.Lock()
+        self._pending: Dict[Any, Tuple[float, int, int]] = {}
+        self._buffer = np.zeros(64, dtype=SCORE_RECORD)
+        self._stopped = threading.Event()
+
+    def put(
+            self,
+            updates: Mapping[Any, Tuple[float, int, int]]
+    ) -> None:
+        """Queues the given (timestamp, score, reps) updates, replacing the pending updates of the same IDs"""
+
+        with self._lock:
+            self._pending.update(updates)
+
+    def flush(self) -> None:
+        """Appends the pending score updates to the file"""
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        # Fill the records into the reusable buffer, growing it if needed
+        if len(pending) > len(self._buffer):
+            self._buffer = np.zeros(max(len(pending), 2 * len(self._buffer)), dtype=SCORE_RECORD)
+        records = obtain_records(self.session, pending, self._buffer)
+
+        # The file is reopened on every flush in case it has been rotated by the reader
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'ab') as file:
+                file.write(records.data)
+                if self.durability == 'fsync':
+                    file.flush()
+                    os.fsync(file.fileno())
+        except OSError as error:
+            self.logger.error(f'Unable to save {len(pending)} scores to {self.path}: {error}')
+
+        # Record the write latency if the metrics Node is in the pipeline; only this thread writes it
+        metrics = MetricsBlock.active
+        if metrics is not None:
+            MetricsBlock.observe(metrics.score_writes, time.perf_counter() - start)
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def stop(self) -> None:
+        """Flushes the pending score updates and stops the thread"""
+
+        self._stopped.set()
+        self.join()
+
 
 class Node(AbstractNode):
 
@@ -10,24 +139,112 @@ class Node(AbstractNode):
             config: Optional[Mapping[str, Any]] = None,
             **kwargs
     ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
 
         super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
 
+        if self.durability not in DURABILITY:
+            self.logger.error(f"Unknown durability '{self.durability}'; defaulting to 'os'.")
+            self.durability = 'os'
+
+        # Implement trackers
+        self.scores: Dict[Any, Tuple[int, int]] = {}
+        self.session = 0
+        self.writer: Optional[ScoreWriter] = None
+
+        # Open the socket to publish the scores with, if enabled
+        self.publisher = None
+        if self.publish_port:
+            self.publisher = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.publisher.setblocking(False)
+
+    def reset(self) -> None:
+        """Saves the pending scores and forgets every score, so that the next frame starts a new session"""
+
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        self.scores.clear()
+
+    def _publish(
+            self,
+            records: np.ndarray
+    ) -> None:
+
+        # Split the records into datagrams that fit into a single UDP packet
+        max_records = 65507 // SCORE_RECORD.itemsize
+        for start in range(0, len(records), max_records):
+            try:
+                self.publisher.sendto(records[start:start + max_records].tobytes(), (SCORE_HOST, self.publish_port))
+            except OSError as error:
+                # The score server may not be running, so the scores are only saved to the file
+                self.logger.debug(f'Unable to publish {len(records)} scores: {error}')
+                return
+
     def run(
             self,
             inputs: Mapping[str, Any]
     ) -> Mapping:
-        
-        # Obtain the scores of each person detected
+        """Queues the scores that have changed since the last frame to be saved, and publishes them
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'scores' - score of each person from the stats Node
+            - 'reps' - repetitions of each person from the stretch Node
+            - 'pipeline_end' - whether the pipeline has ended, to save the remaining scores
+
+        Returns
+        -------
+        dict
+            Empty dictionary.
+        """
+
+        # Start the writer on the first frame of every session, identifying its scores with its start time;
+        # sessions started within the same second, as after a reset of the worker, still get their own ID
+        if self.writer is None:
+            self.session = max(int(time.time()), self.session + 1) & 0xFFFFFFFF
+            self.writer = ScoreWriter(self.path, self.session, self.flush_interval, self.durability, self.logger)
+            self.writer.start()
+
+        # Only queue and publish the scores that have changed
+        timestamp = time.time()
+        reps = inputs.get('reps', {})
         scores = inputs.get('scores', {})
+        changed = {}
+        for curr_id, score in scores.items():
+            update = (score, reps.get(curr_id, 0))
+            if self.scores.get(curr_id) != update:
+                self.scores[curr_id] = update
+                changed[curr_id] = (timestamp, *update)
+
+        # Forget the people that are no longer scored, such as those evicted from the state of the stretch Node
+        if len(self.scores) > len(scores):
+            self.scores = {curr_id: update for curr_id, update in self.scores.items() if curr_id in scores}
+        if changed:
+            self.writer.put(changed)
+            if self.publisher is not None:
+                self._publish(obtain_records(self.session, changed))
+
+        # Save the remaining scores once the pipeline has ended
+        if inputs.get('pipeline_end', False):
+            self.reset()
 
-        # Store the scores in a temporary file
-        with open('../tmp.txt', 'a+') as file:
-            for curr_id, score in scores.items():
-                file.write(f'{curr_id}:{score}\n')
-        
         return {}
 
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    pass
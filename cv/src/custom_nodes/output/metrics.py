@@ -0,0 +1,157 @@
+"""Docstring for the metrics.py module
+
+This module implements a custom output Node class for exporting the health and throughput of the pipeline
+while it is running, to be scraped in the Prometheus text format from the '/metrics' route of app.py.
+
+The metrics are recorded into a memory-mapped counter block, see `MetricsBlock` in the output/utils.py script,
+without any lock or system call on the frame path:
+
+- the number of frames processed, and the frame rate over the latest `interval` seconds
+- the number of frames of a `source_fps` source that were missed while the pipeline was busy
+- the number of people held in the state of the stretch Node, and the repetitions counted
+- the latency of every Node, once `instrument()` is called with the Nodes of the pipeline
+- the latency of every batch of scores appended to the score log by the local_save Node
+- the keyframe interval and the fraction of frames estimated by the keyframe_posenet Node, if any
+
+PeekingDuck gives a Node no access to the other Nodes of its pipeline, so the latency of every Node is only
+recorded when the pipeline is run by the worker, by main.py, by the orchestrator or by the run_pipeline.py script
+of the root directory, which all call `instrument()`; under a plain `peekingduck run`, only the other metrics are.
+
+Usage
+-----
+This module should be part of a package that follows the file structure as specified by the
+[PeekingDuck documentation](https://peekingduck.readthedocs.io/en/stable/tutorials/03_custom_nodes.html).
+
+Navigate to the root directory of the package and run the following line on the terminal:
+
+```
+peekingduck run
+```
+
+or, to also record the latency of every Node, run the following line from the root directory instead:
+
+```
+python run_pipeline.py
+```
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from peekingduck.pipeline.nodes.abstract_node import AbstractNode
+
+from custom_nodes.output.utils import MetricsBlock
+
+
+class Node(AbstractNode):
+
+    def __init__(
+            self,
+            config: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> None:
+        """Initialises the custom Node class
+
+        Parameters
+        ----------
+        config : dict, optional
+            Node custom configuration
+
+        Other Parameters
+        ----------------
+        **kwargs
+            Keyword arguments for instantiating the AbstractNode parent class
+        """
+
+        super().__init__(config, node_path=__name__, **kwargs)  # type: ignore
+
+        self.metrics = MetricsBlock(self.path, str(self.stream))
+
+        # Implement trackers
+        self.reps: Dict[Any, int] = {}
+        self.last_frame: Optional[float] = None
+        self.interval_start = time.perf_counter()
+        self.interval_frames = 0
+
+    def reset(self) -> None:
+        """Forgets the repetitions of every person, as the tracking IDs restart with a new session"""
+
+        self.reps.clear()
+        self.last_frame = None
+
+    def instrument(
+            self,
+            nodes: List[Any]
+    ) -> None:
+        """Wraps the `run()` method of every given Node to record its latency, up to `MAX_NODES` of them
+
+        Parameters
+        ----------
+        nodes : list
+            Nodes of the pipeline, in order
+        """
+
+        self.metrics.register_nodes([node.node_name for node in nodes])
+        for histogram, node in zip(self.metrics.node_latency, nodes):
+            node.run = self._wrap(histogram, node.run)
+
+    @staticmethod
+    def _wrap(histogram: Any, run: Callable[[Mapping[str, Any]], Mapping[str, Any]]):
+
+        def timed_run(inputs: Mapping[str, Any]) -> Mapping[str, Any]:
+            start = time.perf_counter()
+            try:
+                return run(inputs)
+            finally:
+                MetricsBlock.observe(histogram, time.perf_counter() - start)
+
+        return timed_run
+
+    def run(
+            self,
+            inputs: Mapping[str, Any]
+    ) -> Mapping:
+        """Records the metrics of the given frame
+
+        Parameters
+        ----------
+        inputs : dict
+            Dictionary with the following keys:
+
+            - 'reps' - repetitions of each person held in the state of the stretch Node
+
+        Returns
+        -------
+        dict
+            Empty dictionary.
+        """
+
+        metrics = self.metrics
+        now = time.perf_counter()
+        metrics.frames[0] += 1
+        metrics.updated[0] = time.time()
+
+        # Count the frames of the source that arrived while the previous frame was processed;
+        # longer gaps are taken as the pipeline being paused, such as between the sessions of the worker
+        if self.last_frame is not None and self.source_fps > 0 and now - self.last_frame < self.pause_seconds:
+            metrics.dropped_frames[0] += max(int((now - self.last_frame) * self.source_fps) - 1, 0)
+        self.last_frame = now
+
+        self.interval_frames += 1
+        if now - self.interval_start >= self.interval:
+            metrics.fps[0] = self.interval_frames / (now - self.interval_start)
+            self.interval_start, self.interval_frames = now, 0
+
+        # Only count the repetitions gained since the last frame, as people leave and join the state
+        reps = inputs.get('reps', {})
+        gained = sum(max(count - self.reps.get(curr_id, 0), 0) for curr_id, count in reps.items())
+        if gained:
+            metrics.reps[0] += gained
+        self.reps = dict(reps)
+        metrics.active_ids[0] = len(reps)
+
+        return {}
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,382 @@
+"""Docstring for the output/utils.py script
+
+This script contains constants and other miscellaneous functions
+for the rest of the scripts in the output module to use.
+
+The score log is a headerless sequence of fixed-width, little-endian `SCORE_RECORD` records,
+such that it can be read without parsing by memory-mapping it as a NumPy array.
+The same records are published live as UDP datagrams to `SCORE_PORT` on localhost.
+
+The pipeline metrics are kept in a memory-mapped file holding a single `METRICS_RECORD` counter block.
+Every field of the block is only ever written by one thread of the pipeline process, and every value
+is an aligned 8-byte word, so the block is updated without any lock, and read by the score server
+by copying the file; a reader may see a histogram mid-update, but never a torn value.
+
+Annotated frames are shared between the frame_stream Node and its viewers through a `FrameHub`, which holds
+only the latest encoded frame: each frame is encoded once for every viewer, and a viewer that is slower than
+the pipeline skips to the latest frame instead of queueing the frames it missed.
+
+Keypoint recordings are directories of `.npz` chunks of consecutive frames, where the relative keypoints
+and bounding boxes of every person are quantized to int16 with `quantize()`, see `RECORDING_ARRAYS`.
+
+Usage
+-----
+This script is not meant to be used independently.
+It does not depend on PeekingDuck, so that it can also be imported by the score server.
+"""
+
+import bisect
+from contextlib import contextmanager
+import os
+import threading
+from typing import Any, ClassVar, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+
+# Define constants
+SCORE_HOST = '127.0.0.1'
+SCORE_PORT = 9252
+
+
+"""Defines a single score update in the score log"""  # pylint: disable=pointless-string-statement
+SCORE_RECORD = np.dtype([
+    ('timestamp', '<f8'),  # Seconds since the epoch
+    ('session', '<u4'),  # Identifies the pipeline run that saved the score
+    ('id', '<i4'),  # Tracking ID of the person
+    ('score', '<i4'),
+    ('reps', '<i4')
+])
+
+
+"""Defines the upper bounds in seconds of the latency histogram buckets"""  # pylint: disable=pointless-string-statement
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+MAX_NODES = 32
+METRICS_VERSION = 2
+
+
+"""Defines a latency histogram
+
+It has one count per bucket of `LATENCY_BUCKETS`, and one for slower observations.
+"""  # pylint: disable=pointless-string-statement
+HISTOGRAM = np.dtype([
+    ('counts', '<u8', (len(LATENCY_BUCKETS) + 1,)),
+    ('sum', '<f8'),  # Seconds
+    ('count', '<u8')
+], align=True)
+
+
+"""Defines the counter block of a pipeline, written by the metrics Node"""  # pylint: disable=pointless-string-statement
+METRICS_RECORD = np.dtype([
+    ('version', '<u8'),
+    ('pid', '<u8'),
+    ('stream', 'S64'),
+    ('updated', '<f8'),  # Seconds since the epoch of the latest frame
+    ('frames', '<u8'),
+    ('dropped_frames', '<u8'),  # Frames of the source missed while the pipeline was busy
+    ('fps', '<f8'),
+    ('active_ids', '<u8'),  # People held in the state of the stretch Node
+    ('reps', '<u8'),
+    ('keyframe_interval', '<u8'),  # Maximum frames between keyframes of the keyframe_posenet Node, 0 without one
+    ('keyframe_ratio', '<f8'),  # Fraction of frames that poses were estimated on
+    ('score_writes', HISTOGRAM),
+    ('num_nodes', '<u8'),
+    ('node_names', 'S64', (MAX_NODES,)),
+    ('node_latency', HISTOGRAM, (MAX_NODES,))
+], align=True)
+
+
+"""Defines the arrays of each chunk of a keypoint recording
+
+P is the total number of people in the F frames of the chunk.
+"""  # pylint: disable=pointless-string-statement
+RECORDING_ARRAYS = {
+    'frame_index': 'Index of each frame since the start of the recording, of shape (F,)',
+    'img_shape': 'Height and width of the image of each frame, of shape (F, 2)',
+    'counts': 'Number of people in each frame, of shape (F,)',
+    'ids': 'Tracking ID of each person, of shape (P,)',
+    'keypoints': 'Quantized relative keypoints of each person, of shape (P, 17, 2)',
+    'bboxes': 'Quantized relative bounding box of each person, of shape (P, 4)'
+}
+RECORDING_SCALE = 1 << 14
+CHUNK_NAME = 'chunk_{:06d}.npz'
+
+
+def obtain_records(
+        session: int,
+        updates: Mapping[Any, Tuple[float, int, int]],
+        out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Obtains the score records of the given score updates
+
+    Parameters
+    ----------
+    session : int
+        Identifies the pipeline run that saved the scores
+    updates : dict
+        Dictionary of (timestamp, score, reps) updates keyed by tracking ID
+    out : numpy.ndarray, optional
+        Buffer of dtype `SCORE_RECORD` to fill the records into, if it is large enough
+
+    Returns
+    -------
+    numpy.ndarray
+        Records of dtype `SCORE_RECORD`, one for each update.
+    """
+
+    if out is None or len(out) < len(updates):
+        out = np.zeros(len(updates), dtype=SCORE_RECORD)
+    records = out[:len(updates)]
+    if updates:
+        records['session'] = session
+        records['id'] = list(updates)
+        records['timestamp'], records['score'], records['reps'] = zip(*updates.values())
+    return records
+
+
+def quantize(rel_coords: Any) -> np.ndarray:
+    """Quantizes relative coordinates to int16, keeping \\( -1 \\) for undetected keypoints exactly
+
+    Coordinates are stored in steps of 1 / `RECORDING_SCALE` of the image, within \\( [-2, 2) \\).
+    """
+
+    scaled = np.rint(np.asarray(rel_coords, dtype=float) * RECORDING_SCALE)
+    return np.clip(scaled, -2 * RECORDING_SCALE, 2 * RECORDING_SCALE - 1).astype('<i2')
+
+
+def dequantize(quantized: np.ndarray) -> np.ndarray:
+    """Restores the relative coordinates quantized by `quantize()`"""
+
+    return quantized.astype(float) / RECORDING_SCALE
+
+
+def split_chunk(chunk: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Dequantizes a chunk of a keypoint recording, adding the 'offsets' of the people of each frame
+
+    The people of frame \\( i \\) of the chunk are at `offsets[i]:offsets[i + 1]` of the per-person arrays.
+    """
+
+    arrays = {key: chunk[key] for key in RECORDING_ARRAYS}
+    arrays['keypoints'] = dequantize(arrays['keypoints'])
+    arrays['bboxes'] = dequantize(arrays['bboxes'])
+    arrays['offsets'] = np.concatenate(([0], np.cumsum(arrays['counts'], dtype=np.int64)))
+    return arrays
+
+
+class MetricsBlock:
+    """Writes the metrics of a pipeline into a memory-mapped `METRICS_RECORD` counter block"""
+
+    # Block of the running pipeline, for the other Nodes of the process to record their metrics into
+    active: ClassVar[Optional['MetricsBlock']] = None
+
+    def __init__(
+            self,
+            path: str,
+            stream: str
+    ) -> None:
+        """Creates the counter block, resetting any block left at the same path by a previous run
+
+        Parameters
+        ----------
+        path : str
+            Path of the memory-mapped file to hold the block
+        stream : str
+            Name of the stream, to tell the blocks of several pipelines apart
+        """
+
+        self.path = path
+        self.block = np.memmap(path, dtype=METRICS_RECORD, mode='w+', shape=(1,))
+        self.block['version'] = METRICS_VERSION
+        self.block['pid'] = os.getpid()
+        self.block['stream'] = stream.encode('utf-8')[:64]
+
+        # Keep a view of every field, so that updating a value does not look the field up
+        self.updated, self.frames, self.dropped_frames, self.fps, self.active_ids, self.reps = (
+            self.block[field] for field in ('updated', 'frames', 'dropped_frames', 'fps', 'active_ids', 'reps')
+        )
+        self.keyframe_interval, self.keyframe_ratio = self.block['keyframe_interval'], self.block['keyframe_ratio']
+        self.score_writes = self.block['score_writes']
+        self.node_latency = self.block['node_latency'][0]
+        MetricsBlock.active = self
+
+    def register_nodes(
+            self,
+            names: List[str]
+    ) -> None:
+        """Names the latency histograms of the given Nodes, in order, up to `MAX_NODES` of them"""
+
+        names = names[:MAX_NODES]
+        self.block['node_names'][0, :len(names)] = [name.encode('utf-8')[:64] for name in names]
+        self.block['num_nodes'] = len(names)
+
+    @staticmethod
+    def observe(
+            histogram: np.ndarray,
+            seconds: float
+    ) -> None:
+        """Adds an observation in seconds to the given `HISTOGRAM`"""
+
+        histogram['counts'][..., bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+
+def read_metrics(path: str) -> Optional[np.ndarray]:
+    """Reads a copy of the counter block at the given path, or None if there is no valid block"""
+
+    try:
+        block = np.fromfile(path, dtype=METRICS_RECORD, count=1)
+    except (OSError, ValueError):
+        return None
+    if len(block) != 1 or block['version'][0] != METRICS_VERSION:
+        return None
+    return block[0]
+
+
+def format_metrics(blocks: List[np.ndarray]) -> str:
+    """Formats the given counter blocks in the Prometheus text exposition format, labelled by stream"""
+
+    families: Dict[str, Tuple[str, str, List[str]]] = {
+        'frames_total': ('counter', 'Frames processed by the pipeline.', []),
+        'dropped_frames_total': ('counter', 'Frames of the source missed while the pipeline was busy.', []),
+        'pipeline_fps': ('gauge', 'Frames processed per second over the latest interval.', []),
+        'active_ids': ('gauge', 'Tracked people held in the state of the stretch Node.', []),
+        'reps_total': ('counter', 'Stretch repetitions counted.', []),
+        'last_frame_timestamp_seconds': ('gauge', 'Time of the latest frame, in seconds since the epoch.', []),
+        'keyframe_interval': ('gauge', 'Maximum number of frames between the keyframes of the pose model.', []),
+        'keyframe_ratio': ('gauge', 'Fraction of frames that poses were estimated on.', []),
+        'node_latency_seconds': ('histogram', 'Time taken by each Node to process a frame.', []),
+        'score_write_latency_seconds': ('histogram', 'Time taken to append a batch of scores to the score log.', [])
+    }
+
+    def add_histogram(name: str, labels: str, histogram: np.ndarray) -> None:
+        samples = families[name][2]
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), np.cumsum(histogram['counts']).tolist()):
+            samples.append(f'stretch925_{name}_bucket{{{labels},le="{bound}"}} {count}')
+        samples.append(f'stretch925_{name}_sum{{{labels}}} {float(histogram["sum"])!r}')
+        samples.append(f'stretch925_{name}_count{{{labels}}} {int(histogram["count"])}')
+
+    for block in blocks:
+        labels = f'stream="{_escape(block["stream"])}"'
+        for name, field in (('frames_total', 'frames'), ('dropped_frames_total', 'dropped_frames'),
+                            ('pipeline_fps', 'fps'), ('active_ids', 'active_ids'), ('reps_total', 'reps'),
+                            ('last_frame_timestamp_seconds', 'updated')):
+            families[name][2].append(f'stretch925_{name}{{{labels}}} {block[field].item()!r}')
+
+        # Only pipelines estimating poses on keyframes have keyframe metrics
+        if block['keyframe_interval']:
+            for name in ('keyframe_interval', 'keyframe_ratio'):
+                families[name][2].append(f'stretch925_{name}{{{labels}}} {block[name].item()!r}')
+        for name, histogram in zip(block['node_names'][:int(block['num_nodes'])], block['node_latency']):
+            add_histogram('node_latency_seconds', f'{labels},node="{_escape(name)}"', histogram)
+        add_histogram('score_write_latency_seconds', labels, block['score_writes'])
+
+    lines = []
+    for name, (metric_type, description, samples) in families.items():
+        lines += [f'# HELP stretch925_{name} {description}', f'# TYPE stretch925_{name} {metric_type}', *samples]
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value: bytes) -> str:
+    return value.decode('utf-8', 'replace').replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def obtain_totals(records: np.ndarray) -> np.ndarray:
+    """Obtains the total score of each session in the given score updates
+
+    The total score of a session is the sum of the maximum score of each person in the session.
+
+    Parameters
+    ----------
+    records : numpy.ndarray
+        Score updates of dtype `SCORE_RECORD`
+
+    Returns
+    -------
+    numpy.ndarray
+        Structured array with the 'session' and 'score' of each session, sorted by session.
+    """
+
+    totals = np.zeros(0, dtype=[('session', '<u4'), ('score', '<i8')])
+    if not len(records):
+        return totals
+
+    # Obtain the maximum score of each person, then sum them up per session
+    order = np.lexsort((records['id'], records['session']))
+    sessions, ids, scores = records['session'][order], records['id'][order], records['score'][order]
+    starts = np.flatnonzero(np.r_[True, (sessions[1:] != sessions[:-1]) | (ids[1:] != ids[:-1])])
+    max_scores = np.maximum.reduceat(scores, starts).astype('<i8')
+    person_sessions = sessions[starts]
+    session_starts = np.flatnonzero(np.r_[True, person_sessions[1:] != person_sessions[:-1]])
+
+    totals.resize(len(session_starts), refcheck=False)
+    totals['session'] = person_sessions[session_starts]
+    totals['score'] = np.add.reduceat(max_scores, session_starts)
+    return totals
+
+
+class FrameHub:
+    """Holds the latest encoded frame of the pipeline, waking the viewers whenever it is replaced"""
+
+    # Hub of the running pipeline, for the draw Nodes of the process to check for viewers
+    active: ClassVar[Optional['FrameHub']] = None
+
+    def __init__(self) -> None:
+
+        # Implement trackers
+        self.condition = threading.Condition()
+        self.version = 0
+        self.frame: Optional[bytes] = None
+        self.viewers = 0
+        FrameHub.active = self
+
+    @classmethod
+    def is_viewed(cls) -> bool:
+        """Checks if anyone is viewing the frames of the running pipeline"""
+
+        return cls.active is not None and cls.active.viewers > 0
+
+    @contextmanager
+    def subscribe(self) -> Iterator[None]:
+        """Counts a viewer for as long as the context is open"""
+
+        with self.condition:
+            self.viewers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.viewers -= 1
+
+    def publish(
+            self,
+            frame: bytes
+    ) -> None:
+        """Replaces the latest frame with the given encoded frame"""
+
+        with self.condition:
+            self.frame = frame
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(
+            self,
+            version: int,
+            timeout: float
+    ) -> Tuple[int, Optional[bytes]]:
+        """Waits until the latest frame is newer than the given version, or until the timeout
+
+        Returns
+        -------
+        tuple
+            The latest version and frame, or the given version and None on timeout.
+        """
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.version != version and self.frame is not None, timeout):
+                return version, None
+            return self.version, self.frame
+
+
+if __name__ == '__main__':
+    pass
@@ -1,7 +1,27 @@
 import argparse
+import json
 import os
+import random
 import re
+import socket
 import subprocess
+import sys
+import time
+
+import worker
+
+
+"""Defines the custom Node prefix of each supported exercise"""  # pylint: disable=pointless-string-statement
+EXERCISES = {'arm': 'yw', 'neck': 'ms', 'side': 'lat'}
+
+"""Defines the UDP port of the multi_stretch control channel"""  # pylint: disable=pointless-string-statement
+CONTROL_PORT = 9250
+
+"""Defines the script running the pipelines
+
+It records the latency of every Node of the pipeline in the metrics.
+"""  # pylint: disable=pointless-string-statement
+PIPELINE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_pipeline.py')
 
 
 def config(filename: str) -> None:
@@ -14,22 +34,96 @@ def config(filename: str) -> None:
         contents = file.read()
 
     # Use regular expression to replace only the specific custom Node lines
-    contents = re.sub(r"custom_nodes\.dabble\..*", f'custom_nodes.dabble.{filename}_stretch', contents)
-    contents = re.sub(r"custom_nodes\.draw\..*", f'custom_nodes.draw.{filename}_stats', contents)
+    contents = re.sub(r"custom_nodes\.dabble\.\w+_stretch", f'custom_nodes.dabble.{filename}_stretch', contents)
+    contents = re.sub(r"custom_nodes\.draw\.\w+_stats", f'custom_nodes.draw.{filename}_stats', contents)
 
     # Write the modified contents back to the yml file
     with open(YML_DIR, 'w', encoding='utf-8') as file:
         file.write(contents)
 
 
+def send_command(command: str, port: int = CONTROL_PORT) -> None:
+    """Sends a command to the control channel of the multi_stretch Node
+
+    Parameters
+    ----------
+    command : str
+        One of 'arm', 'neck', 'side' or 'reset'
+    port : int, default=`CONTROL_PORT`
+        UDP port of the control channel on localhost
+    """
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(command.encode('utf-8'), ('127.0.0.1', port))
+
+
+def break_session(duration: float, num_stretches: int = 3) -> None:
+    """Runs a break session of randomly selected stretches in a single pipeline
+
+    The models are only loaded once; the multi_stretch Node is told to switch
+    to the next stretch through its control channel. If a worker is running,
+    its warm pipeline is used instead of starting a new one.
+
+    Parameters
+    ----------
+    duration : float
+        Duration of each stretch in seconds
+    num_stretches : int, default=3
+        Number of stretches in the session
+    """
+
+    stretches = random.sample(list(EXERCISES), k=min(num_stretches, len(EXERCISES)))
+
+    # Reuse the warm pipeline of a running worker, if any
+    if worker.is_running():
+        try:
+            print(worker.send_command(f'start {stretches[0]}'))
+            for exercise in stretches[1:]:
+                time.sleep(duration)
+                print(worker.send_command(f'exercise {exercise}'))
+            time.sleep(duration)
+        finally:
+            print(worker.send_command('stop'))
+        return
+
+    config('multi')
+    os.chdir('cv')
+    node_config = {'custom_nodes.dabble.multi_stretch': {'exercise': stretches[0]}}
+    with subprocess.Popen([sys.executable, PIPELINE_SCRIPT, "--node_config", json.dumps(node_config)]) as process:
+        try:
+            for exercise in stretches[1:] + [None]:
+                try:
+                    process.wait(timeout=duration)
+                    return  # the pipeline was closed by the user
+                except subprocess.TimeoutExpired:
+                    pass
+                if exercise is not None:
+                    send_command(exercise)
+        finally:
+            process.terminate()
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         prog='Stretch925',
         description='Take a break. Have a stretch.'
     )
-    parser.add_argument("exercise", choices=['arm', 'neck', 'side'])
+    parser.add_argument("exercise", choices=[*EXERCISES, 'break'])
+    parser.add_argument("--duration", type=float, default=60,
+                        help="duration of each stretch of a break session in seconds")
+    parser.add_argument("--videos", help="directory of recorded videos to analyse offline instead of the webcam")
+    parser.add_argument("--workers", type=int, help="number of processes to analyse the recorded videos with")
+    parser.add_argument("--output", help="path of the CSV file to save the results of the recorded videos to")
 
     args = parser.parse_args()
-    config({'arm': 'yw', 'neck': 'ms', 'side': 'lat'}[args.exercise])
-    os.chdir('cv')
-    subprocess.run(["peekingduck", "run"])
+    if args.videos and args.exercise != 'break':
+        import batch  # pylint: disable=import-outside-toplevel
+        batch.write_results(batch.analyse_videos(args.videos, args.exercise, args.workers), args.output)
+    elif args.exercise == 'break':
+        break_session(args.duration)
+    elif worker.is_running():
+        print(worker.send_command(f'start {args.exercise}'))
+    else:
+        config(EXERCISES[args.exercise])
+        os.chdir('cv')
+        subprocess.run([sys.executable, PIPELINE_SCRIPT])
@@ -0,0 +1,533 @@
+"""Docstring for the orchestrator.py module
+
+This module implements an orchestrator that runs several stretch stations from one machine,
+with one supervised PeekingDuck pipeline process per camera or video source.
+
+Each pipeline is given its own generated copy of `cv/pipeline_config.yml`, with its own source,
+control port of the multi_stretch Node, score log and score port of the local_save Node,
+counter block of the metrics Node, and window name.
+The orchestrator then:
+
+- restarts the pipelines that crash, with an exponential backoff
+- receives the scores of each pipeline and routes them into its own session of the score service, if given,
+  from a background thread that backs off while the service cannot be reached, so that it never holds up the others
+- reports the frame rate of each pipeline, from its heartbeat Node, and its CPU usage
+
+With `--pose-server`, the pose model of every pipeline is replaced by the remote_posenet Node,
+so that the poses of all the streams are estimated in batches by a single running pose server.
+
+Usage
+-----
+This file can be run on the terminal from the root directory:
+
+```
+python orchestrator.py --sources 0 1 path/to/video.mp4 --exercise arm --score-service http://127.0.0.1:8000
+```
+
+To share a single pose model between the streams, start `python pose_server.py` first, then:
+
+```
+python orchestrator.py --sources 0 1 2 3 --pose-server
+```
+"""
+
+import argparse
+import json
+import logging
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+import urllib.error
+import urllib.request
+
+import numpy as np
+import yaml
+
+
+# Define constants
+logger = logging.getLogger(__name__)
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CV_DIR = os.path.join(ROOT_DIR, 'cv')
+HEARTBEAT_PORT = 9260
+STREAM_BASE_PORT = 9270
+MAX_BACKOFF = 30.0
+ROUTE_INTERVAL = 0.5
+
+sys.path.insert(0, os.path.join(CV_DIR, 'src'))
+from custom_nodes.model.utils import POSE_PORT  # pylint: disable=wrong-import-position
+from custom_nodes.output.utils import SCORE_HOST, SCORE_RECORD  # pylint: disable=wrong-import-position
+
+
+def _node_name(node: Any) -> str:
+    return node if isinstance(node, str) else next(iter(node))
+
+
+def obtain_pipeline(
+        name: str,
+        source: Any,
+        exercise: str,
+        control_port: int,
+        score_port: int,
+        pose_port: Optional[int] = None
+) -> Dict[str, List[Any]]:
+    """Obtains the pipeline configuration of a single stream from `cv/pipeline_config.yml`
+
+    Parameters
+    ----------
+    name : str
+        Name of the stream
+    source : int or str
+        Webcam index or path to a video file to read from
+    exercise : str
+        Stretch to analyse; one of 'arm', 'neck' or 'side'
+    control_port : int
+        UDP port of the control channel of the multi_stretch Node
+    score_port : int
+        UDP port to publish the scores to
+    pose_port : int, optional
+        TCP port of the pose server to estimate the poses on, instead of the pose model of the pipeline
+
+    Returns
+    -------
+    dict
+        Pipeline configuration with the 'nodes' key.
+    """
+
+    with open(os.path.join(CV_DIR, 'pipeline_config.yml'), 'r', encoding='utf-8') as file:
+        nodes = yaml.safe_load(file)['nodes']
+
+    overrides = {
+        'input.visual': {'source': source},
+        'custom_nodes.dabble.multi_stretch': {'exercise': exercise, 'control_port': control_port},
+        'custom_nodes.output.local_save': {'path': f'../scores-{name}.bin', 'publish_port': score_port},
+        'custom_nodes.output.metrics': {'path': f'../metrics-{name}.bin', 'stream': name},
+        'output.screen': {'window_name': f'Stretch925 - {name}'}
+    }
+    pipeline = []
+    for node in nodes:
+        # Use the multi-exercise Nodes, so that the exercise can be switched through the control channel
+        node_name = _node_name(node)
+        if node_name.startswith('custom_nodes.dabble.') and node_name.endswith('_stretch'):
+            node_name = 'custom_nodes.dabble.multi_stretch'
+        elif node_name.startswith('custom_nodes.draw.') and node_name.endswith('_stats'):
+            node_name = 'custom_nodes.draw.multi_stats'
+        config = dict(node[_node_name(node)] or {}) if isinstance(node, dict) else {}
+
+        # Estimate the poses on the pose server, dropping the metrics of the replaced pose model
+        if pose_port is not None and (node_name == 'model.posenet' or node_name.startswith('custom_nodes.model.')):
+            node_name, config = 'custom_nodes.model.remote_posenet', {'port': pose_port}
+        elif pose_port is not None and node_name == 'draw.legend':
+            config['show'] = [key for key in config.get('show', []) if not key.startswith('keyframe_')]
+        elif pose_port is not None and node_name == 'custom_nodes.draw.overlay':
+            config['legend'] = [key for key in config.get('legend', []) if not key.startswith('keyframe_')]
+        config.update(overrides.get(node_name, {}))
+        pipeline.append({node_name: config} if config else node_name)
+
+    pipeline.append({'custom_nodes.output.heartbeat': {'stream': name, 'port': HEARTBEAT_PORT}})
+    return {'nodes': pipeline}
+
+
+def _cpu_seconds(pid: int) -> Optional[float]:
+
+    # Prefer psutil where it is installed, falling back to procfs on Linux
+    try:
+        import psutil  # pylint: disable=import-outside-toplevel
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    except ImportError:
+        pass
+    except Exception:  # pylint: disable=broad-except
+        return None
+    try:
+        with open(f'/proc/{pid}/stat', 'r', encoding='utf-8') as file:
+            fields = file.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Stream:
+    """Supervises the pipeline process of a single camera or video source"""
+
+    def __init__(
+            self,
+            index: int,
+            source: Any,
+            exercise: str,
+            pose_port: Optional[int] = None
+    ) -> None:
+        """Initialises the stream
+
+        Parameters
+        ----------
+        index : int
+            Index of the stream, to assign its name and ports
+        source : int or str
+            Webcam index or path to a video file to read from
+        exercise : str
+            Stretch to analyse; one of 'arm', 'neck' or 'side'
+        pose_port : int, optional
+            TCP port of the pose server to estimate the poses on, see `obtain_pipeline()`
+        """
+
+        self.name = f'stream{index}'
+        self.source = source
+        self.control_port = STREAM_BASE_PORT + 2 * index
+        self.score_port = STREAM_BASE_PORT + 2 * index + 1
+        self.config_path = os.path.join(CV_DIR, f'.{self.name}_pipeline_config.yml')
+        with open(self.config_path, 'w', encoding='utf-8') as file:
+            yaml.safe_dump(obtain_pipeline(self.name, source, exercise, self.control_port, self.score_port,
+                                           pose_port), file)
+
+        # Implement trackers
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self.restart_at: Optional[float] = None
+        self.finished = False
+        self.scores: Dict[int, int] = {}
+        self.reps: Dict[int, int] = {}
+        self.pending: Dict[int, Dict[str, int]] = {}
+        self.fps = 0.0
+        self.cpu = 0.0
+        self._cpu_sample: Optional[tuple] = None
+
+    def start(self) -> None:
+        """Starts the pipeline process"""
+
+        self.process = subprocess.Popen(  # pylint: disable=consider-using-with
+            [sys.executable, os.path.join(ROOT_DIR, 'run_pipeline.py'), '--config_path', self.config_path],
+            cwd=CV_DIR
+        )
+        self.restart_at = None
+        self._cpu_sample = None
+        logger.info('Started %s on source %r with PID %d.', self.name, self.source, self.process.pid)
+
+    def poll(self, now: float) -> None:
+        """Restarts the pipeline process if it has crashed, or marks the stream as finished if it has ended"""
+
+        if self.finished:
+            return
+        if self.process is None or self.restart_at is not None:
+            if self.restart_at is None or now >= self.restart_at:
+                self.start()
+            return
+
+        returncode = self.process.poll()
+        if returncode is None:
+            self._sample_cpu(now)
+        elif returncode == 0:
+            # The video has ended or the window was closed by the user
+            logger.info('%s has ended.', self.name)
+            self.finished = True
+            self.fps = self.cpu = 0.0
+        else:
+            backoff = min(2 ** self.restarts, MAX_BACKOFF)
+            self.restarts += 1
+            self.restart_at = now + backoff
+            self.fps = self.cpu = 0.0
+            logger.warning('%s crashed with exit code %d; restarting in %.0f seconds.', self.name, returncode, backoff)
+
+    def _sample_cpu(self, now: float) -> None:
+
+        cpu_seconds = _cpu_seconds(self.process.pid)
+        if cpu_seconds is None:
+            return
+        if self._cpu_sample is not None and now > self._cpu_sample[0]:
+            self.cpu = 100 * (cpu_seconds - self._cpu_sample[1]) / (now - self._cpu_sample[0])
+        self._cpu_sample = (now, cpu_seconds)
+
+    def receive_scores(self, records: np.ndarray) -> None:
+        """Keeps the maximum score and latest repetitions of each person in the given `SCORE_RECORD` records"""
+
+        for curr_id, score, reps in zip(records['id'].tolist(), records['score'].tolist(), records['reps'].tolist()):
+            self.scores[curr_id] = max(self.scores.get(curr_id, score), score)
+            self.reps[curr_id] = reps
+            self.pending[curr_id] = {'id': curr_id, 'score': score, 'reps': reps}
+
+    def stop(self) -> None:
+        """Stops the pipeline process and removes its configuration"""
+
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        try:
+            os.remove(self.config_path)
+        except FileNotFoundError:
+            pass
+
+
+class ScoreRouter(threading.Thread):
+    """Routes the scores of every stream into its own session of the score service, on a background thread"""
+
+    def __init__(
+            self,
+            score_service: str,
+            interval: float = ROUTE_INTERVAL
+    ) -> None:
+        """Initialises the router thread
+
+        Parameters
+        ----------
+        score_service : str
+            URL of the score service
+        interval : float, default=`ROUTE_INTERVAL`
+            Number of seconds between two routings of the pending scores
+        """
+
+        super().__init__(name='score-router', daemon=True)
+        self.score_service = score_service
+        self.interval = interval
+
+        # Implement trackers
+        # The pending updates and finished streams are shared with the supervision loop;
+        # the sessions and the backoff are only ever used by this thread
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[int, Dict[str, int]]] = {}
+        self._finished: Set[str] = set()
+        self._stopped = threading.Event()
+        self.sessions: Dict[str, str] = {}
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def put(
+            self,
+            stream: str,
+            updates: Dict[int, Dict[str, int]]
+    ) -> None:
+        """Queues the given score updates of a stream, replacing the pending updates of the same IDs"""
+
+        with self._lock:
+            self._pending.setdefault(stream, {}).update(updates)
+
+    def finish(
+            self,
+            stream: str
+    ) -> None:
+        """Queues the session of a stream to be finished, once its pending updates have been routed"""
+
+        with self._lock:
+            self._finished.add(stream)
+
+    def _request(self, path: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+
+        request = urllib.request.Request(f'{self.score_service}{path}', data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=2) as response:
+                return json.load(response)
+        except (urllib.error.URLError, OSError, ValueError) as error:
+            # Only log the first failure until the service can be reached again
+            log = logger.debug if self.failures else logger.error
+            log('Unable to reach the score service at %s: %s', self.score_service, error)
+            return None
+
+    def _route(self, stream: str, updates: Dict[int, Dict[str, int]], finished: bool) -> bool:
+
+        # Start the session of the stream on its first scores
+        session = self.sessions.get(stream)
+        if session is None and (updates or finished):
+            response = self._request('/sessions', {'session': f'{stream}-{int(time.time())}'})
+            if response is None:
+                return False
+            session = self.sessions[stream] = response['session']
+        if updates and self._request(f'/sessions/{session}/updates', {'updates': list(updates.values())}) is None:
+            return False
+        if finished and session is not None:
+            response = self._request(f'/sessions/{session}/finish', {})
+            if response is None:
+                return False
+            logger.info('%s finished session %s with a score of %d.', stream, session, response['score'])
+            del self.sessions[stream]
+        return True
+
+    def route(self) -> None:
+        """Routes the pending scores of every stream, and finishes the sessions of the finished streams
+
+        While the score service cannot be reached, the scores are kept pending and only retried
+        after an exponential backoff.
+        """
+
+        if time.monotonic() < self.retry_at:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            finished, self._finished = self._finished, set()
+
+        for stream in sorted(set(pending) | finished):
+            if self._route(stream, pending.get(stream, {}), stream in finished):
+                pending.pop(stream, None)
+                finished.discard(stream)
+                continue
+
+            # Keep every unrouted score pending, behind any newer scores of the same people, and back off
+            with self._lock:
+                for name, updates in pending.items():
+                    self._pending[name] = {**updates, **self._pending.get(name, {})}
+                self._finished |= finished
+            backoff = min(2 ** self.failures, MAX_BACKOFF)
+            self.failures += 1
+            self.retry_at = time.monotonic() + backoff
+            return
+
+        if self.failures:
+            logger.info('Reached the score service at %s again.', self.score_service)
+        self.failures = 0
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.route()
+
+    def stop(self) -> None:
+        """Makes a last attempt at routing the pending scores, and stops the thread"""
+
+        self._stopped.set()
+        self.join()
+        self.retry_at = 0.0
+        self.route()
+
+
+class Orchestrator:
+    """Starts and supervises one pipeline process per source, and collects their scores and heartbeats"""
+
+    def __init__(
+            self,
+            sources: List[Any],
+            exercise: str = 'arm',
+            score_service: Optional[str] = None,
+            report_interval: float = 5.0,
+            pose_port: Optional[int] = None
+    ) -> None:
+        """Initialises the orchestrator
+
+        Parameters
+        ----------
+        sources : list
+            Webcam indices or paths to video files, one per stream
+        exercise : str, default='arm'
+            Stretch to analyse on every stream
+        score_service : str, optional
+            URL of the score service to route the scores of each stream into
+        report_interval : float, default=5.0
+            Number of seconds between reports of the frame rate and CPU usage of each stream
+        pose_port : int, optional
+            TCP port of the pose server to estimate the poses of every stream on
+        """
+
+        self.streams = [Stream(index, source, exercise, pose_port) for index, source in enumerate(sources)]
+        self.report_interval = report_interval
+
+        # Route the scores from their own thread, so that the score service never holds up the supervision
+        self.router = ScoreRouter(score_service.rstrip('/')) if score_service else None
+
+        # Listen for the heartbeats and scores of every stream
+        self.selector = selectors.DefaultSelector()
+        self._listen(HEARTBEAT_PORT, None)
+        for stream in self.streams:
+            self._listen(stream.score_port, stream)
+
+    def _listen(self, port: int, stream: Optional[Stream]) -> None:
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((SCORE_HOST, port))
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ, stream)
+
+    def _receive(self, timeout: float) -> None:
+
+        streams = {stream.name: stream for stream in self.streams}
+        for key, _ in self.selector.select(timeout):
+            try:
+                data = key.fileobj.recv(65536)
+            except OSError:
+                continue
+            if key.data is not None:
+                key.data.receive_scores(
+                    np.frombuffer(data, dtype=SCORE_RECORD, count=len(data) // SCORE_RECORD.itemsize))
+                continue
+            try:
+                heartbeat = json.loads(data)
+                stream = streams[heartbeat['stream']]
+                stream.fps = heartbeat['frames'] / heartbeat['seconds']
+            except (ValueError, KeyError, TypeError, ZeroDivisionError):
+                logger.debug('Ignoring malformed heartbeat %r', data)
+
+    def _route_scores(self, stream: Stream, finished: bool = False) -> None:
+
+        # Hand the scores over to the router thread, without waiting on the score service
+        if self.router is not None:
+            if stream.pending:
+                self.router.put(stream.name, stream.pending)
+            if finished:
+                self.router.finish(stream.name)
+        stream.pending = {}
+
+    def report(self) -> str:
+        """Returns a table of the state, frame rate and CPU usage of each stream"""
+
+        lines = [f"{'stream':<10}{'source':<24}{'state':<12}{'restarts':>9}{'fps':>8}{'cpu %':>8}{'score':>8}"]
+        for stream in self.streams:
+            state = 'finished' if stream.finished else 'restarting' if stream.restart_at is not None else 'running'
+            lines.append(f'{stream.name:<10}{str(stream.source)[-23:]:<24}{state:<12}{stream.restarts:>9}'
+                         f'{stream.fps:>8.1f}{stream.cpu:>8.1f}{sum(stream.scores.values()):>8}')
+        return '\n'.join(lines)
+
+    def run(self) -> None:
+        """Supervises the streams until every stream has finished, or until interrupted"""
+
+        last_report = time.monotonic()
+        if self.router is not None:
+            self.router.start()
+        try:
+            while not all(stream.finished for stream in self.streams):
+                self._receive(timeout=1.0)
+                now = time.monotonic()
+                for stream in self.streams:
+                    was_finished = stream.finished
+                    stream.poll(now)
+                    self._route_scores(stream, finished=stream.finished and not was_finished)
+                if now - last_report >= self.report_interval:
+                    print(self.report(), flush=True)
+                    last_report = now
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for stream in self.streams:
+                stream.stop()
+                if not stream.finished:
+                    self._receive(timeout=0)
+                    self._route_scores(stream, finished=True)
+            if self.router is not None:
+                self.router.stop()
+            self.selector.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Stretch925 orchestrator',
+        description='Run one supervised stretch station per camera or video source.'
+    )
+    parser.add_argument('--sources', nargs='+', default=['0'], help='webcam indices or paths to video files')
+    parser.add_argument('--exercise', choices=['arm', 'neck', 'side'], default='arm')
+    parser.add_argument('--score-service', help='URL of the score service to route the scores into')
+    parser.add_argument('--report-interval', type=float, default=5.0,
+                        help='number of seconds between reports of the frame rate and CPU usage of each stream')
+    parser.add_argument('--pose-server', type=int, nargs='?', const=POSE_PORT, metavar='PORT',
+                        help='estimate the poses on the running pose server, on the given port if not the default')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    Orchestrator(
+        [int(source) if source.isdigit() else os.path.abspath(source) for source in args.sources],
+        exercise=args.exercise,
+        score_service=args.score_service,
+        report_interval=args.report_interval,
+        pose_port=args.pose_server
+    ).run()
@@ -0,0 +1,265 @@
+"""Docstring for the pose_server.py module
+
+This module implements a pose server that estimates the poses of several camera streams with a single
+PoseNet model, such that the streams on one machine share one model instead of loading one each.
+
+Each stream sends its frames over a local TCP connection with the remote_posenet custom Node.
+The server collects the frames of the different streams into a micro-batch, until either `max_batch_size`
+frames have arrived or the first frame has waited for `max_wait_ms` milliseconds, and tiles them into
+a single mosaic image. PoseNet is run once on the mosaic, and the poses found on each tile are sent back
+to the stream that sent it, as keypoints relative to its own frame.
+
+Usage
+-----
+This file can be run on the terminal from the root directory:
+
+```
+python pose_server.py --max-batch-size 4 --max-wait-ms 10
+```
+
+The streams then replace their pose model with `custom_nodes.model.remote_posenet`,
+for example with `python orchestrator.py --sources 0 1 2 3 --pose-server`.
+"""
+
+import argparse
+import logging
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+
+# Define constants
+logger = logging.getLogger(__name__)
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(ROOT_DIR, 'cv', 'src'))
+from custom_nodes.model.utils import (  # pylint: disable=wrong-import-position
+    POSE_HOST, POSE_PORT, obtain_mosaic_grid, recv_frame, send_poses, split_mosaic_poses
+)
+
+
+class PoseRequest:
+    """Holds a frame waiting in the micro-batch, and the poses estimated on it"""
+
+    __slots__ = ('img', 'keypoints', 'keypoint_scores', 'done')
+
+    def __init__(
+            self,
+            img: np.ndarray
+    ) -> None:
+
+        self.img = img
+        self.keypoints = np.empty((0, 17, 2))
+        self.keypoint_scores = np.empty((0, 17))
+        self.done = threading.Event()
+
+
+class PoseServer:
+    """Batches the frames of several streams into a single PoseNet call"""
+
+    def __init__(
+            self,
+            port: int = POSE_PORT,
+            max_batch_size: int = 4,
+            max_wait_ms: float = 10.0,
+            tile_width: int = 225,
+            tile_height: int = 225,
+            model_type: str = 'resnet',
+            score_threshold: float = 0.6,
+            max_pose_detection: int = 10
+    ) -> None:
+        """Loads the PoseNet model and opens the server
+
+        Parameters
+        ----------
+        port : int, default=`POSE_PORT`
+            TCP port on localhost to receive the frames from
+        max_batch_size : int, default=4
+            Maximum number of frames estimated in one model call
+        max_wait_ms : float, default=10.0
+            Maximum number of milliseconds the first frame of a batch waits for more frames
+        tile_width : int, default=225
+            Width in pixels of each frame in the mosaic
+        tile_height : int, default=225
+            Height in pixels of each frame in the mosaic
+        model_type : str, default='resnet'
+            PoseNet model type to use: 50, 75, 100 or resnet
+        score_threshold : float, default=0.6
+            Minimum score of a pose to be detected
+        max_pose_detection : int, default=10
+            Maximum number of poses detected per frame
+
+        Raises
+        ------
+        OSError
+            If the port is already in use.
+        """
+
+        from peekingduck.pipeline.nodes.model import posenet  # pylint: disable=import-outside-toplevel
+
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+
+        # The mosaic always has room for a full batch, so every frame is estimated at the same scale
+        self.rows, self.cols = obtain_mosaic_grid(max_batch_size)
+        self.model = posenet.Node(
+            model_type=model_type,
+            resolution={'height': self.rows * tile_height, 'width': self.cols * tile_width},
+            max_pose_detection=max_pose_detection * max_batch_size,
+            score_threshold=score_threshold
+        )
+        self.mosaic = np.zeros((self.rows * tile_height, self.cols * tile_width, 3), dtype=np.uint8)
+
+        # Implement trackers
+        self.requests: 'queue.Queue[PoseRequest]' = queue.Queue()
+        self.num_batches = 0
+        self.num_frames = 0
+        self.model_seconds = 0.0
+
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            """Estimates the poses of every frame sent by one stream, in order"""
+
+            def handle(self) -> None:
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                while True:
+                    try:
+                        request = server.submit(recv_frame(self.request))
+                        send_poses(self.request, request.keypoints, request.keypoint_scores)
+                    except (ConnectionError, OSError):
+                        return
+
+        self.server = socketserver.ThreadingTCPServer((POSE_HOST, port), Handler)
+        self.server.daemon_threads = True
+
+    def submit(self, img: np.ndarray) -> PoseRequest:
+        """Adds a frame to the next micro-batch, and waits for its poses to be estimated"""
+
+        request = PoseRequest(img)
+        self.requests.put(request)
+        request.done.wait()
+        return request
+
+    def _collect(self) -> List[PoseRequest]:
+
+        # Wait for the first frame, then for more frames until the batch is full or the first frame is due
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def estimate(self, batch: List[PoseRequest]) -> None:
+        """Estimates the poses of a batch of frames with a single model call on their mosaic"""
+
+        import cv2  # pylint: disable=import-outside-toplevel
+
+        self.mosaic[:] = 0
+        for i, request in enumerate(batch):
+            row, col = divmod(i, self.cols)
+            img = request.img
+            if img.shape[:2] != (self.tile_height, self.tile_width):
+                img = cv2.resize(img, (self.tile_width, self.tile_height), interpolation=cv2.INTER_AREA)
+            self.mosaic[row * self.tile_height:(row + 1) * self.tile_height,
+                        col * self.tile_width:(col + 1) * self.tile_width] = img
+
+        start = time.perf_counter()
+        outputs = self.model.run({'img': self.mosaic})
+        self.model_seconds += time.perf_counter() - start
+        self.num_batches += 1
+        self.num_frames += len(batch)
+
+        tiles = split_mosaic_poses(outputs['keypoints'], outputs['keypoint_scores'], self.rows, self.cols, len(batch))
+        for request, (keypoints, keypoint_scores) in zip(batch, tiles):
+            request.keypoints, request.keypoint_scores = keypoints, keypoint_scores
+            request.done.set()
+
+    def _batch(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                self.estimate(batch)
+            except Exception as error:  # pylint: disable=broad-except
+                # Answer the waiting streams with no poses rather than leaving them hanging
+                logger.exception('Unable to estimate a batch of %d frames: %s', len(batch), error)
+                for request in batch:
+                    request.done.set()
+
+    def stats(self) -> str:
+        """Returns the number of frames estimated, the mean batch size and the mean model time per frame"""
+
+        return (f'{self.num_frames} frames in {self.num_batches} batches, '
+                f'mean batch size {self.num_frames / max(self.num_batches, 1):.2f}, '
+                f'{self.model_seconds / max(self.num_frames, 1) * 1000:.1f} ms of model time per frame')
+
+    def serve_forever(self, report_interval: Optional[float] = None) -> None:
+        """Serves the streams until interrupted, logging the stats every `report_interval` seconds if given"""
+
+        self.start()
+        logger.info('Pose server listening on port %d, with batches of up to %d frames in a %dx%d mosaic.',
+                    self.server.server_address[1], self.max_batch_size, self.rows, self.cols)
+        try:
+            while True:
+                time.sleep(report_interval or 3600)
+                if report_interval:
+                    logger.info(self.stats())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def start(self) -> None:
+        """Serves the streams on background threads"""
+
+        threading.Thread(target=self._batch, name='pose-batcher', daemon=True).start()
+        threading.Thread(target=self.server.serve_forever, name='pose-server', daemon=True).start()
+
+    def shutdown(self) -> None:
+        """Stops accepting frames and closes the server"""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Stretch925 pose server',
+        description='Estimate the poses of several streams with one batched PoseNet model.'
+    )
+    parser.add_argument('--port', type=int, default=POSE_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=4, help='maximum number of frames per model call')
+    parser.add_argument('--max-wait-ms', type=float, default=10.0,
+                        help='maximum number of milliseconds to wait for a batch to fill up')
+    parser.add_argument('--tile-width', type=int, default=225)
+    parser.add_argument('--tile-height', type=int, default=225)
+    parser.add_argument('--model-type', default='resnet', choices=['50', '75', '100', 'resnet'])
+    parser.add_argument('--score-threshold', type=float, default=0.6)
+    parser.add_argument('--report-interval', type=float, default=10.0,
+                        help='number of seconds between logs of the batching stats')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    model_type = int(args.model_type) if args.model_type.isdigit() else args.model_type
+    PoseServer(
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        tile_width=args.tile_width,
+        tile_height=args.tile_height,
+        model_type=model_type,
+        score_threshold=args.score_threshold
+    ).serve_forever(args.report_interval)
@@ -0,0 +1,223 @@
+"""Docstring for the profiler.py module
+
+This module implements the timing of every Node of a PeekingDuck pipeline, including the built-in Nodes.
+
+The `run()` method of every Node is wrapped to record its wall time and the CPU time of the process
+on every frame, into a fixed-size ring buffer of the latest `capacity` frames, so that profiling
+a long session takes constant memory. When the pipeline shuts down, the buffered frames are exported
+as Chrome trace-event JSON, which can be opened in `chrome://tracing` or [Perfetto](https://ui.perfetto.dev),
+together with the p50, p95 and p99 wall and CPU times of every Node.
+
+Usage
+-----
+This file can be run on the terminal from the root directory, to run `cv/pipeline_config.yml` with profiling:
+
+```
+python profiler.py --output profile
+```
+
+The worker can also be profiled with `python worker.py --profile profile`.
+Either saves `profile.trace.json` and `profile.summary.json`, and prints the summary.
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Any, Callable, Dict, List, Mapping
+
+import numpy as np
+
+
+# Define constants
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CAPACITY = 10000
+
+
+class NodeProfiler:
+    """Records the wall and CPU time of every Node on the latest frames of a pipeline"""
+
+    def __init__(
+            self,
+            nodes: List[Any],
+            capacity: int = CAPACITY,
+            clock: Callable[[], float] = time.perf_counter,
+            cpu_clock: Callable[[], float] = time.process_time
+    ) -> None:
+        """Wraps the `run()` method of every given Node
+
+        Parameters
+        ----------
+        nodes : list
+            Nodes of the pipeline, in order; the first Node starts every frame
+        capacity : int, default=`CAPACITY`
+            Number of latest frames to keep the times of
+        clock : callable, default=time.perf_counter
+            Function returning the wall time in seconds
+        cpu_clock : callable, default=time.process_time
+            Function returning the CPU time of the process in seconds, including the threads of the models
+        """
+
+        self.node_names = [node.node_name for node in nodes]
+        self.capacity = capacity
+        self.clock = clock
+        self.cpu_clock = cpu_clock
+
+        # Implement trackers
+        # Each row holds one frame, and each column one Node; Nodes skipped on a frame are left as NaN
+        self.starts = np.full((capacity, len(nodes)), np.nan)
+        self.walls = np.full((capacity, len(nodes)), np.nan)
+        self.cpus = np.full((capacity, len(nodes)), np.nan)
+        self.frames = np.full(capacity, -1, dtype=np.int64)
+        self.num_frames = 0
+        self.origin = clock()
+
+        for index, node in enumerate(nodes):
+            node.run = self._wrap(index, node.run)
+
+    def _wrap(self, index: int, run: Callable[[Mapping[str, Any]], Mapping[str, Any]]):
+
+        def timed_run(inputs: Mapping[str, Any]) -> Mapping[str, Any]:
+            if index == 0:
+                self._next_frame()
+            start, cpu_start = self.clock(), self.cpu_clock()
+            try:
+                return run(inputs)
+            finally:
+                row = (self.num_frames - 1) % self.capacity
+                self.starts[row, index] = start - self.origin
+                self.walls[row, index] = self.clock() - start
+                self.cpus[row, index] = self.cpu_clock() - cpu_start
+
+        return timed_run
+
+    def _next_frame(self) -> None:
+
+        # Overwrite the oldest frame once the buffer is full
+        row = self.num_frames % self.capacity
+        self.starts[row] = self.walls[row] = self.cpus[row] = np.nan
+        self.frames[row] = self.num_frames
+        self.num_frames += 1
+
+    def _rows(self) -> np.ndarray:
+
+        # Rows of the buffered frames, from the oldest to the latest
+        if self.num_frames <= self.capacity:
+            return np.arange(self.num_frames)
+        return (np.arange(self.capacity) + self.num_frames) % self.capacity
+
+    def trace_events(self) -> List[Dict[str, Any]]:
+        """Returns the buffered Node runs as Chrome trace events, with times in microseconds"""
+
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [
+            {'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'Stretch925 pipeline'}},
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'pipeline'}}
+        ]
+        for row in self._rows():
+            for index in np.flatnonzero(~np.isnan(self.walls[row])):
+                events.append({
+                    'name': self.node_names[index],
+                    'cat': self.node_names[index].split('.', 1)[0],
+                    'ph': 'X',
+                    'ts': round(float(self.starts[row, index]) * 1e6, 3),
+                    'dur': round(float(self.walls[row, index]) * 1e6, 3),
+                    'pid': pid,
+                    'tid': 0,
+                    'args': {'frame': int(self.frames[row]), 'cpu_us': round(float(self.cpus[row, index]) * 1e6, 3)}
+                })
+        return events
+
+    def summary(self) -> Dict[str, Any]:
+        """Returns the p50, p95 and p99 wall and CPU times of every Node, and of whole frames, in milliseconds"""
+
+        rows = self._rows()
+
+        def percentiles(times: np.ndarray) -> Dict[str, float]:
+            times = times[~np.isnan(times)] * 1000
+            return {f'p{q}': float(np.percentile(times, q)) if len(times) else 0.0 for q in (50, 95, 99)}
+
+        return {
+            'frames': int(self.num_frames),
+            'buffered_frames': len(rows),
+            'frame': {'wall_ms': percentiles(np.nansum(self.walls[rows], axis=1)),
+                      'cpu_ms': percentiles(np.nansum(self.cpus[rows], axis=1))},
+            'nodes': {name: {'runs': int(np.count_nonzero(~np.isnan(self.walls[rows, index]))),
+                             'wall_ms': percentiles(self.walls[rows, index]),
+                             'cpu_ms': percentiles(self.cpus[rows, index])}
+                      for index, name in enumerate(self.node_names)}
+        }
+
+    def report(self) -> str:
+        """Returns the summary as a table"""
+
+        summary = self.summary()
+        lines = [f"{'node':<36}{'runs':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'cpu p50':>10}"]
+        for name, times in [*summary['nodes'].items(), ('frame', {'runs': summary['buffered_frames'],
+                                                                 **summary['frame']})]:
+            lines.append(f"{name[-35:]:<36}{times['runs']:>8}{times['wall_ms']['p50']:>10.2f}"
+                         f"{times['wall_ms']['p95']:>10.2f}{times['wall_ms']['p99']:>10.2f}"
+                         f"{times['cpu_ms']['p50']:>10.2f}")
+        return '\n'.join(lines)
+
+    def export(self, prefix: str) -> None:
+        """Saves the trace events to `<prefix>.trace.json` and the summary to `<prefix>.summary.json`"""
+
+        with open(f'{prefix}.trace.json', 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, file)
+        with open(f'{prefix}.summary.json', 'w', encoding='utf-8') as file:
+            json.dump(self.summary(), file, indent=2)
+
+
+def profile_pipeline(
+        output: str,
+        config_path: str = 'pipeline_config.yml',
+        capacity: int = CAPACITY
+) -> NodeProfiler:
+    """Runs a pipeline of the cv directory with every Node profiled, exporting the times when it shuts down
+
+    Parameters
+    ----------
+    output : str
+        Prefix of the paths to export the trace and summary to, see `NodeProfiler.export()`
+    config_path : str, default='pipeline_config.yml'
+        Path of the pipeline configuration, relative to the cv directory
+    capacity : int, default=`CAPACITY`
+        Number of latest frames to keep the times of
+
+    Returns
+    -------
+    `NodeProfiler`
+        The profiler of the pipeline, after it has shut down.
+    """
+
+    output = os.path.abspath(output)
+    os.chdir(os.path.join(ROOT_DIR, 'cv'))
+    sys.path.insert(0, os.path.join(ROOT_DIR, 'cv', 'src'))
+
+    from peekingduck.runner import Runner  # pylint: disable=import-outside-toplevel
+
+    runner = Runner(pipeline_path=Path(config_path), config_updates_cli='None', custom_nodes_parent_subdir='src')
+    profiler = NodeProfiler(runner.pipeline.nodes, capacity)
+    try:
+        runner.run()
+    finally:
+        profiler.export(output)
+        print(profiler.report())
+    return profiler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Stretch925 profiler',
+        description='Run the pipeline with the wall and CPU time of every Node recorded.'
+    )
+    parser.add_argument('--config_path', default='pipeline_config.yml',
+                        help='pipeline configuration to run, relative to the cv directory')
+    parser.add_argument('--output', default='profile', help='prefix of the trace and summary JSON files')
+    parser.add_argument('--capacity', type=int, default=CAPACITY, help='number of latest frames to keep')
+
+    args = parser.parse_args()
+    profile_pipeline(args.output, args.config_path, args.capacity)
@@ -0,0 +1,127 @@
+"""Docstring for the run_pipeline.py module
+
+This module runs a pipeline of the cv directory as `peekingduck run` does, with the latency of every Node
+recorded into the metrics of the metrics Node, if the pipeline has one, see `cv/src/custom_nodes/output/metrics.py`.
+
+PeekingDuck gives a Node no access to the other Nodes of its pipeline, so the metrics Node can only time
+the other Nodes once it is handed them by whatever loads the pipeline. The pipelines started by main.py
+and by the orchestrator are run through this module for that reason, as is the pipeline of the worker.
+
+When the process is terminated, as main.py and the orchestrator stop their pipelines, the current frame is
+finished and the Nodes handling the end of the pipeline are run, so that the pending scores are saved.
+
+Usage
+-----
+This file can be run on the terminal from the root directory, taking the same options as `peekingduck run`:
+
+```
+python run_pipeline.py --config_path pipeline_config.yml --node_config "{'input.visual': {'source': 1}}"
+```
+"""
+
+import argparse
+import logging
+import os
+from pathlib import Path
+import signal
+import sys
+from typing import Any, List, Optional
+
+
+# Define constants
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CV_DIR = os.path.join(ROOT_DIR, 'cv')
+
+
+def instrument_metrics(nodes: List[Any]) -> bool:
+    """Records the latency of every given Node into the metrics Node among them, if any
+
+    Parameters
+    ----------
+    nodes : list
+        Nodes of the pipeline, in order
+
+    Returns
+    -------
+    bool
+        Whether the pipeline has a metrics Node.
+    """
+
+    metrics_node = next((node for node in nodes if node.name.endswith('output.metrics')), None)
+    if metrics_node is None:
+        return False
+    metrics_node.instrument(nodes)
+    return True
+
+
+def end_pipeline(pipeline: Any) -> None:
+    """Runs the Nodes that take the 'pipeline_end' input, as the runner does once the input Node has ended
+
+    Parameters
+    ----------
+    pipeline : Pipeline
+        Pipeline that was stopped before its input Node ended
+    """
+
+    pipeline.data['pipeline_end'] = True
+    for node in pipeline.nodes:
+        if 'pipeline_end' in node.inputs:
+            pipeline.data.update(node.run({key: pipeline.data[key] for key in node.inputs if key in pipeline.data}))
+
+
+def run_pipeline(
+        config_path: str = 'pipeline_config.yml',
+        node_config: Optional[str] = None,
+        num_iter: Optional[int] = None
+) -> None:
+    """Runs a pipeline of the cv directory until it ends, with every Node timed by the metrics Node
+
+    Parameters
+    ----------
+    config_path : str, default='pipeline_config.yml'
+        Path of the pipeline configuration, relative to the cv directory
+    node_config : str, optional
+        Updates to the configurations of the Nodes, as the `--node_config` option of `peekingduck run`
+    num_iter : int, optional
+        Number of frames to run the pipeline for; until the pipeline ends if not given
+    """
+
+    os.chdir(CV_DIR)
+    sys.path.insert(0, os.path.join(CV_DIR, 'src'))
+
+    from peekingduck.runner import Runner  # pylint: disable=import-outside-toplevel
+
+    runner = Runner(
+        pipeline_path=Path(config_path),
+        config_updates_cli=node_config or 'None',
+        custom_nodes_parent_subdir='src',
+        num_iter=num_iter
+    )
+    instrument_metrics(runner.pipeline.nodes)
+
+    # Finish the current frame on termination instead of dying mid-frame, then end the pipeline
+    terminated = []
+
+    def terminate(signum: int, _frame: Any) -> None:
+        terminated.append(signum)
+        runner.pipeline.terminate = True
+
+    signal.signal(signal.SIGTERM, terminate)
+    runner.run()
+    if terminated and not runner.pipeline.data.get('pipeline_end', False):
+        end_pipeline(runner.pipeline)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Stretch925 pipeline',
+        description='Run a pipeline of the cv directory with the latency of every Node recorded in its metrics.'
+    )
+    parser.add_argument('--config_path', default='pipeline_config.yml',
+                        help='pipeline configuration to run, relative to the cv directory')
+    parser.add_argument('--node_config', help='updates to the configurations of the Nodes, as a JSON string')
+    parser.add_argument('--num_iter', type=int, help='number of frames to run the pipeline for')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    run_pipeline(args.config_path, args.node_config, args.num_iter)
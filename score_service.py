@@ -0,0 +1,263 @@
+"""Docstring for the score_service.py module
+
+This module implements an asynchronous ASGI score service that keeps the scores of many concurrent
+stretch sessions in memory, each keyed by its own session ID.
+
+The service exposes the following routes:
+
+- 'POST /sessions' - starts a session, optionally with the ID given as {"session": "..."}
+- 'POST /sessions/<session>/updates' - records score updates given as {"updates": [{"id", "score", "reps"}, ...]}
+- 'GET /sessions/<session>' - gets the live score and repetitions of each person in the session
+- 'POST /sessions/<session>/finish' - finishes the session, returning its final score
+
+The final score of a session is the sum of the maximum score of each person in the session.
+Sessions that have not been updated for `SESSION_TTL` seconds are dropped.
+
+Usage
+-----
+The service can be run by any ASGI server from the root directory, for example:
+
+```
+uvicorn score_service:app --port 8000
+```
+
+See `benchmarks/score_service_load.py` for a load test with concurrent sessions.
+"""
+
+import json
+import re
+import secrets
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+
+# Define constants
+SESSION_TTL = 3600.0
+MAX_SESSIONS = 10000
+MAX_BODY_SIZE = 1 << 20
+ROUTES = (
+    ('POST', re.compile(r'^/sessions/?$'), 'start'),
+    ('POST', re.compile(r'^/sessions/(?P<session>[\w-]+)/updates/?$'), 'update'),
+    ('GET', re.compile(r'^/sessions/(?P<session>[\w-]+)/?$'), 'get'),
+    ('POST', re.compile(r'^/sessions/(?P<session>[\w-]+)/finish/?$'), 'finish')
+)
+
+
+class Session:
+    """Stores the scores of a single stretch session"""
+
+    __slots__ = ('scores', 'reps', 'updated')
+
+    def __init__(
+            self,
+            now: float
+    ) -> None:
+
+        self.scores: Dict[int, int] = {}
+        self.reps: Dict[int, int] = {}
+        self.updated = now
+
+    def update(
+            self,
+            updates: List[Mapping[str, Any]],
+            now: float
+    ) -> None:
+        """Keeps the maximum score and latest repetitions of each person in the given updates
+
+        Every update is validated before any is applied, so that malformed updates leave the session unchanged.
+
+        Raises
+        ------
+        KeyError, TypeError, ValueError, OverflowError
+            If any of the updates is malformed.
+        """
+
+        parsed = [(int(update['id']), int(update['score']), int(update['reps']) if 'reps' in update else None)
+                  for update in updates]
+        for curr_id, score, reps in parsed:
+            self.scores[curr_id] = max(self.scores.get(curr_id, score), score)
+            if reps is not None:
+                self.reps[curr_id] = reps
+        self.updated = now
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Returns the live score and repetitions of each person, and the total score of the session"""
+
+        return {
+            'people': {str(curr_id): {'score': score, 'reps': self.reps.get(curr_id, 0)}
+                       for curr_id, score in self.scores.items()},
+            'score': sum(self.scores.values())
+        }
+
+
+class HTTPError(Exception):
+    """Raised to answer a request with an error status"""
+
+    def __init__(
+            self,
+            status: int,
+            message: str,
+            headers: Optional[List[Tuple[bytes, bytes]]] = None
+    ) -> None:
+
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+
+class ScoreService:
+    """ASGI application storing the scores of concurrent sessions in memory"""
+
+    def __init__(
+            self,
+            ttl: float = SESSION_TTL,
+            max_sessions: int = MAX_SESSIONS,
+            clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Initialises the service
+
+        Parameters
+        ----------
+        ttl : float, default=`SESSION_TTL`
+            Number of seconds a session can go without updates before it is dropped
+        max_sessions : int, default=`MAX_SESSIONS`
+            Maximum number of concurrent sessions
+        clock : callable, default=time.monotonic
+            Function returning the current time in seconds
+        """
+
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+
+        # Implement trackers
+        # Every handler runs on the event loop without awaiting in between reads and writes,
+        # so the sessions need no locking
+        self.sessions: Dict[str, Session] = {}
+        self.last_pruned = clock()
+
+    def _prune(self, now: float) -> None:
+
+        # Drop the abandoned sessions at most once every minute
+        if now - self.last_pruned < 60:
+            return
+        self.last_pruned = now
+        expiry = now - self.ttl
+        for session in [session for session, state in self.sessions.items() if state.updated < expiry]:
+            del self.sessions[session]
+
+    def _session(self, session: str) -> Session:
+
+        state = self.sessions.get(session)
+        if state is None:
+            raise HTTPError(404, f"unknown session '{session}'")
+        return state
+
+    def start(self, body: Mapping[str, Any], now: float, session: Optional[str] = None) -> Tuple[int, Any]:
+        """Starts a session, with the given ID or a random one"""
+
+        session = str(body.get('session') or secrets.token_hex(8))
+        if not re.fullmatch(r'[\w-]+', session):
+            raise HTTPError(400, 'session IDs may only contain letters, digits, underscores and hyphens')
+        if session in self.sessions:
+            raise HTTPError(409, f"session '{session}' already exists")
+        if len(self.sessions) >= self.max_sessions:
+            raise HTTPError(503, 'too many concurrent sessions')
+        self.sessions[session] = Session(now)
+        return 201, {'session': session}
+
+    def update(self, body: Mapping[str, Any], now: float, session: Optional[str] = None) -> Tuple[int, Any]:
+        """Records score updates for the given session"""
+
+        state = self._session(session)
+        try:
+            state.update(body.get('updates', []), now)
+        except (KeyError, TypeError, ValueError, OverflowError) as error:
+            raise HTTPError(400, f'malformed updates: {error!r}') from error
+        return 200, {'session': session, 'score': sum(state.scores.values())}
+
+    def get(self, body: Mapping[str, Any], now: float, session: Optional[str] = None) -> Tuple[int, Any]:
+        """Gets the live scores of the given session"""
+
+        return 200, {'session': session, **self._session(session).as_dict()}
+
+    def finish(self, body: Mapping[str, Any], now: float, session: Optional[str] = None) -> Tuple[int, Any]:
+        """Finishes the given session, returning its final scores"""
+
+        state = self._session(session)
+        del self.sessions[session]
+        return 200, {'session': session, **state.as_dict()}
+
+    async def __call__(
+            self,
+            scope: Dict[str, Any],
+            receive: Callable[[], Awaitable[Dict[str, Any]]],
+            send: Callable[[Dict[str, Any]], Awaitable[None]]
+    ) -> None:
+
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        headers: List[Tuple[bytes, bytes]] = []
+        try:
+            # Find the route of the request, telling apart unknown paths from unsupported methods
+            allowed = []
+            for method, pattern, handler in ROUTES:
+                match = pattern.match(scope['path'])
+                if match is None:
+                    continue
+                if scope['method'] == method:
+                    break
+                allowed.append(method)
+            else:
+                if allowed:
+                    raise HTTPError(405, f"method {scope['method']} is not allowed for {scope['path']}",
+                                    [(b'allow', ', '.join(allowed).encode())])
+                raise HTTPError(404, f"no route for {scope['method']} {scope['path']}")
+
+            # Read the JSON body, if any
+            body = b''
+            more_body = True
+            while more_body:
+                message = await receive()
+                body += message.get('body', b'')
+                more_body = message.get('more_body', False)
+                if len(body) > MAX_BODY_SIZE:
+                    raise HTTPError(413, 'request body is too large')
+            try:
+                payload = json.loads(body) if body else {}
+            except ValueError as error:
+                raise HTTPError(400, 'request body is not valid JSON') from error
+            if not isinstance(payload, dict):
+                raise HTTPError(400, 'request body is not a JSON object')
+
+            now = self.clock()
+            self._prune(now)
+            status, response = getattr(self, handler)(payload, now, **match.groupdict())
+        except HTTPError as error:
+            status, response, headers = error.status, {'error': error.message}, error.headers
+
+        content = json.dumps(response).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(content)).encode()),
+                        *headers]
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+
+app = ScoreService()
+
+
+if __name__ == '__main__':
+    pass
@@ -1,10 +1,25 @@
 import styles from '@/styles/StretchCam.module.css'
 import Webcam from 'react-webcam';
-import React, { useRef } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import * as tf from "@tensorflow/tfjs";
 import * as posenet from "@tensorflow-models/posenet";
 import { drawKeypoints, drawSkeleton } from "../pages/utilities";
 
+// Flask score server streaming the live scores of the computer vision pipeline
+const SCORE_SERVER = process.env.NEXT_PUBLIC_SCORE_SERVER || "http://127.0.0.1:5000";
+
+// MJPEG stream of the annotated frames of a headless worker (`python worker.py --headless`), served by its
+// frame_stream Node, for example "http://127.0.0.1:9254"; the frames are only drawn and encoded while they are shown.
+// Without it, the webcam is shown with the poses estimated in the browser
+const FRAME_SERVER = process.env.NEXT_PUBLIC_FRAME_SERVER;
+
+// Stretches of the worker, in the order they are shown
+const STRETCHES = [
+    { exercise: "arm", name: "Y-W", image: "../assets/yw-stretch.svg" },
+    { exercise: "neck", name: "Neck", image: "../assets/neck-stretch.svg" },
+    { exercise: "side", name: "Side", image: "../assets/side-stretch.svg" },
+];
+
 const StretchCam = ({
     numSessions,
     breakSecondsLeft,
@@ -14,18 +29,47 @@ const StretchCam = ({
 
     const webcamRef = useRef(null);
     const canvasRef = useRef(null);
+    const [score, setScore] = useState(0);
+    const [reps, setReps] = useState(0);
+    const [session, setSession] = useState({ status: "idle", exercise: null });
 
-    //  Load posenet
-    const runPosenet = async () => {
-        const net = await posenet.load({
-        inputResolution: { width: 640, height: 480 },
-        scale: 0.8,
+    // Subscribe to the live scores and repetitions, summed over every person in front of the camera,
+    // and to the state of the session, to highlight the stretch being analysed
+    useEffect(() => {
+        const source = new EventSource(`${SCORE_SERVER}/stream`);
+        source.addEventListener("scores", (event) => {
+            const people = Object.values(JSON.parse(event.data));
+            setScore(people.reduce((total, person) => total + person.score, 0));
+            setReps(people.reduce((total, person) => total + person.reps, 0));
         });
-        //
-        setInterval(() => {
-        detect(net);
-        }, 100);
-    };
+        source.addEventListener("state", (event) => {
+            setSession(JSON.parse(event.data));
+        });
+        return () => source.close();
+    }, []);
+
+    //  Load posenet, unless the frames are streamed from the worker
+    useEffect(() => {
+        if (FRAME_SERVER) {
+            return;
+        }
+        let cancelled = false;
+        let interval = null;
+        posenet.load({
+            inputResolution: { width: 640, height: 480 },
+            scale: 0.8,
+        }).then((net) => {
+            if (!cancelled) {
+                interval = setInterval(() => {
+                    detect(net);
+                }, 100);
+            }
+        });
+        return () => {
+            cancelled = true;
+            clearInterval(interval);
+        };
+    }, []);
 
     const detect = async (net) => {
         if (
@@ -44,7 +88,6 @@ const StretchCam = ({
 
             // Make Detections
             const pose = await net.estimateSinglePose(video);
-            console.log(pose);
 
             drawCanvas(pose, video, videoWidth, videoHeight, canvasRef);
         }
@@ -59,39 +102,56 @@ const StretchCam = ({
         drawSkeleton(pose["keypoints"], 0.7, ctx);
     };
 
-    runPosenet();
-
     return (
         <div className={styles.main}>
             <p>Number of sessions left: {numSessions}</p>
             <p className={styles.breakTimer}>Break time left: {Math.floor(breakSecondsLeft / 60)}:{(breakSecondsLeft - (Math.floor(breakSecondsLeft / 60) * 60) < 10) ? 0 : <></>}{breakSecondsLeft - (Math.floor(breakSecondsLeft / 60) * 60)}</p>
+            <p className={styles.sessionStatus}>
+                {session.status === "active" ? "Analysing your stretches" : "Waiting for the stretch session to start"}
+            </p>
             <div className={styles.camContainer}>
-                <Webcam
-                    ref={webcamRef}
-                    style={{
-                        position: "absolute",
-                        textAlign: "center",
-                        zindex: 1,
-                        width: 640,
-                        height: 480,
-                    }}
-                />
-                <canvas
-                    ref={canvasRef}
-                    style={{
-                        textAlign: "center",
-                        zindex: 2,
-                        width: 640,
-                        height: 480,
-                    }}
-                />
+                {FRAME_SERVER ? (
+                    <img
+                        src={`${FRAME_SERVER}/frames`}
+                        alt="The camera feed is not available"
+                        style={{
+                            textAlign: "center",
+                            objectFit: "contain",
+                            width: 640,
+                            height: 480,
+                        }}
+                    />
+                ) : (
+                    <>
+                        <Webcam
+                            ref={webcamRef}
+                            style={{
+                                position: "absolute",
+                                textAlign: "center",
+                                zindex: 1,
+                                width: 640,
+                                height: 480,
+                            }}
+                        />
+                        <canvas
+                            ref={canvasRef}
+                            style={{
+                                textAlign: "center",
+                                zindex: 2,
+                                width: 640,
+                                height: 480,
+                            }}
+                        />
+                    </>
+                )}
             </div>
 
             <div className={styles.infoContainer}>
                 <div className={styles.leftBoxesContainer}>
                     <div className={styles.scoreBox}>
                         <p>Score</p>
-                        <h1>120</h1>
+                        <h1>{score}</h1>
+                        <p>Reps: {reps}</p>
                     </div>
                     <div className={styles.timeBox}>
                         <p>Time Left</p>
@@ -101,18 +161,16 @@ const StretchCam = ({
                 </div>
 
                 <div className={styles.stretchesBox}>
-                    <div className={styles.stretch}>
-                        <img src="../assets/yw-stretch.svg" alt="" />
-                        <p>Y-W</p>
-                    </div>
-                    <div className={styles.stretch}>
-                        <img src="../assets/neck-stretch.svg" alt="" />
-                        <p>Neck</p>
-                    </div>
-                    <div className={styles.stretch}>
-                        <img src="../assets/side-stretch.svg" alt="" />
-                        <p>Side</p>
-                    </div>
+                    {STRETCHES.map(({ exercise, name, image }) => (
+                        <div
+                            key={exercise}
+                            className={session.status === "active" && session.exercise === exercise
+                                ? `${styles.stretch} ${styles.activeStretch}` : styles.stretch}
+                        >
+                            <img src={image} alt="" />
+                            <p>{name}</p>
+                        </div>
+                    ))}
                 </div>
             </div>
 
@@ -0,0 +1,374 @@
+"""Docstring for the worker.py module
+
+This module implements a long-lived computer vision worker that loads and warms up
+the PeekingDuck pipeline once, then analyses stretches on demand.
+
+The worker is controlled over a local TCP socket with one command per line:
+
+- 'start [arm | neck | side]' - starts a new session, optionally switching the exercise; every person,
+  repetition and score of the previous sessions is forgotten
+- 'exercise { arm | neck | side }' - switches the exercise of the current session, starting afresh
+  on a stretch that has not been done during the session
+- 'stop' - stops the current session, keeping the models loaded
+- 'status' - reports whether a session is active, and its exercise
+- 'diagnostics' - reports the poses rejected by the stretch Node during the current or last session, as JSON
+- 'shutdown' - stops the worker
+
+Every command is answered with a single line starting with either 'ok' or 'error'.
+The number of rejected poses of each session is also logged when the session stops.
+
+Usage
+-----
+This file can be run on the terminal from the root directory:
+
+```
+python worker.py
+```
+
+Commands can then be sent with `send_command()`, or with `python main.py` while the worker is running.
+
+When the web app drives the sessions and nobody looks at the screen, run the worker headless instead:
+
+```
+python worker.py --headless --stream-quality 70 --stream-width 640
+```
+
+The pipeline then has no screen window and draws nothing, except while the annotated frames are viewed
+from the '/frames' route of the frame_stream Node, as done by the web app when `NEXT_PUBLIC_FRAME_SERVER`
+points at it; see `obtain_headless_pipeline()`.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Define constants
+logger = logging.getLogger(__name__)
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_HOST = '127.0.0.1'
+WORKER_PORT = 9251
+HEADLESS_CONFIG_PATH = os.path.join(ROOT_DIR, 'cv', '.headless_pipeline_config.yml')
+
+
+def send_command(
+        command: str,
+        port: int = WORKER_PORT,
+        timeout: Optional[float] = 5.0
+) -> str:
+    """Sends a command to a running worker
+
+    Parameters
+    ----------
+    command : str
+        Command to send, see the module docstring
+    port : int, default=`WORKER_PORT`
+        TCP port of the worker on localhost
+    timeout : float, optional
+        Seconds to wait for the worker to reply
+
+    Returns
+    -------
+    str
+        The reply of the worker.
+
+    Raises
+    ------
+    OSError
+        If the worker is not running or does not reply in time.
+    """
+
+    with socket.create_connection((WORKER_HOST, port), timeout=timeout) as sock:
+        sock.sendall(f'{command.strip()}\n'.encode('utf-8'))
+        with sock.makefile('r', encoding='utf-8') as reply:
+            return reply.readline().strip()
+
+
+def is_running(port: int = WORKER_PORT) -> bool:
+    """Checks if a worker is listening on the given port"""
+
+    try:
+        return send_command('status', port=port, timeout=0.5).startswith('ok')
+    except OSError:
+        return False
+
+
+def obtain_headless_pipeline(
+        nodes: List[Any],
+        stream: Optional[Dict[str, Any]] = None
+) -> Dict[str, List[Any]]:
+    """Obtains the headless version of a pipeline configuration, which only draws while its frames are viewed
+
+    The output.screen Node and the draw Nodes of PeekingDuck are dropped, the stats Nodes leave their text
+    to the overlay Node, which only draws while the frames are viewed, and the frame_stream Node is added
+    to encode the frames while they are viewed.
+
+    Parameters
+    ----------
+    nodes : list
+        Nodes of the pipeline configuration, as in `cv/pipeline_config.yml`
+    stream : dict, optional
+        Configuration of the frame_stream Node, such as its 'quality' and 'width'
+
+    Returns
+    -------
+    dict
+        Pipeline configuration with the 'nodes' key.
+    """
+
+    pipeline = []
+    for node in nodes:
+        node_name = node if isinstance(node, str) else next(iter(node))
+        config = dict(node[node_name] or {}) if isinstance(node, dict) else {}
+        if node_name == 'output.screen' or node_name.startswith('draw.'):
+            continue
+        if node_name.startswith('custom_nodes.draw.') and node_name.endswith('_stats'):
+            config['draw'] = False
+        elif node_name == 'custom_nodes.draw.overlay':
+            config['headless'] = True
+        pipeline.append({node_name: config} if config else node_name)
+
+    pipeline.append({'custom_nodes.output.frame_stream': dict(stream or {})} if stream
+                    else 'custom_nodes.output.frame_stream')
+    return {'nodes': pipeline}
+
+
+class Worker:
+    """Hosts a warm PeekingDuck pipeline and runs it while a session is active"""
+
+    def __init__(
+            self,
+            port: int = WORKER_PORT,
+            exercise: str = 'arm',
+            profile: Optional[str] = None,
+            headless: bool = False,
+            stream: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Loads and warms up the pipeline
+
+        Parameters
+        ----------
+        port : int, default=`WORKER_PORT`
+            TCP port on localhost to receive commands from
+        exercise : str, default='arm'
+            Exercise to analyse when a session is started without one
+        profile : str, optional
+            Prefix of the paths to export the times of every Node to on shutdown, see profiler.py
+        headless : bool, default=False
+            Whether to run the pipeline without a screen, see `obtain_headless_pipeline()`
+        stream : dict, optional
+            Configuration of the frame_stream Node of the headless pipeline
+        """
+
+        from main import config  # pylint: disable=import-outside-toplevel
+
+        # Use the multi-exercise Nodes, so that switching exercises does not reload the pipeline
+        os.chdir(ROOT_DIR)
+        config('multi')
+        os.chdir(os.path.join(ROOT_DIR, 'cv'))
+        sys.path.insert(0, os.path.join(ROOT_DIR, 'cv', 'src'))
+
+        from peekingduck.runner import Runner  # pylint: disable=import-outside-toplevel
+
+        # Run a generated headless copy of the pipeline configuration, if required
+        self.headless = headless
+        pipeline_path = Path('pipeline_config.yml')
+        if headless:
+            import yaml  # pylint: disable=import-outside-toplevel
+            with open(pipeline_path, 'r', encoding='utf-8') as file:
+                nodes = yaml.safe_load(file)['nodes']
+            pipeline_path = Path(HEADLESS_CONFIG_PATH)
+            with open(pipeline_path, 'w', encoding='utf-8') as file:
+                yaml.safe_dump(obtain_headless_pipeline(nodes, stream), file)
+
+        start = time.perf_counter()
+        self.pipeline = Runner(
+            pipeline_path=pipeline_path,
+            config_updates_cli='None',
+            custom_nodes_parent_subdir='src'
+        ).pipeline
+        self.stretch_node = next(node for node in self.pipeline.nodes if node.name.endswith('multi_stretch'))
+        self.stretch_node.select(exercise)
+        self.warm_up()
+        logger.info('Pipeline loaded and warmed up in %.2f seconds.', time.perf_counter() - start)
+
+        # Record the latency of every Node into the metrics, if the metrics Node is in the pipeline
+        from run_pipeline import instrument_metrics  # pylint: disable=import-outside-toplevel
+        instrument_metrics(self.pipeline.nodes)
+
+        # Time every Node from the first session frame onwards, if required
+        self.profile = os.path.abspath(os.path.join(ROOT_DIR, profile)) if profile else None
+        self.profiler = None
+        if self.profile:
+            from profiler import NodeProfiler  # pylint: disable=import-outside-toplevel
+            self.profiler = NodeProfiler(self.pipeline.nodes)
+
+        # Implement trackers
+        self.active = False
+        self.running = True
+        self.commands: 'queue.Queue[Tuple[str, queue.Queue]]' = queue.Queue()
+        self.server = _Server((WORKER_HOST, port), _Handler)
+        self.server.worker = self
+
+    def warm_up(self) -> None:
+        """Runs the model Nodes once on a blank frame, so that the first session frame is not delayed"""
+
+        import numpy as np  # pylint: disable=import-outside-toplevel
+
+        img = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        for node in self.pipeline.nodes:
+            if node.node_name.startswith('model.'):
+                node.run({'img': img})
+
+    def reset(self) -> None:
+        """Clears the pipeline data and the state every Node keeps between frames, as for a new session
+
+        This covers the poses kept by the model Nodes, the trackers of every stretch, the tracking IDs
+        and the scores saved by the local_save Node.
+        """
+
+        self.pipeline.data = {}
+        for node in self.pipeline.nodes:
+            if callable(getattr(node, 'reset', None)):
+                node.reset()
+
+    def handle(self, command: str) -> str:
+        """Handles a single command on the pipeline thread, see the module docstring"""
+
+        action, *args = command.lower().split()
+        if action == 'start':
+            exercise = args[0] if args else self.stretch_node.exercise
+            if exercise not in self.stretch_node.stretches:
+                return f"error unknown exercise '{exercise}'"
+            self.reset()
+            self.stretch_node.select(exercise)
+            self.active = True
+        elif action == 'exercise':
+            # Only carry over the trackers of a stretch that has already been done during the session
+            if not args or not self.stretch_node.select(args[0], reset=args[0] not in self.stretch_node.used):
+                return 'error expected one of arm, neck or side'
+        elif action == 'stop':
+            self.stop()
+        elif action == 'shutdown':
+            self.stop()
+            self.running = False
+        elif action == 'diagnostics':
+            return f'ok {json.dumps(self.stretch_node.diagnostics.summary())}'
+        elif action != 'status':
+            return f"error unknown command '{action}'"
+        return f"ok {'active' if self.active else 'idle'} {self.stretch_node.exercise}"
+
+    def stop(self) -> None:
+        """Stops the current session, if any"""
+
+        if not self.active:
+            return
+        self.active = False
+        for reason, counts in self.stretch_node.diagnostics.summary().items():
+            logger.info('Rejected %d poses of %d people during the session: %s.',
+                        counts['rejections'], counts['people'], reason)
+        if self.headless:
+            return
+        try:
+            import cv2  # pylint: disable=import-outside-toplevel
+            cv2.destroyAllWindows()  # pylint: disable=no-member
+        except ImportError:
+            pass
+
+    def run_frame(self) -> None:
+        """Runs a single frame through the pipeline, as done by `peekingduck run`"""
+
+        data = self.pipeline.data
+        for node in self.pipeline.nodes:
+            if data.get('pipeline_end', False) and 'pipeline_end' not in node.inputs:
+                continue
+            if 'all' in node.inputs:
+                inputs = copy.deepcopy(data)
+            else:
+                inputs = {key: data[key] for key in node.inputs if key in data}
+                inputs.update({key: data[key] for key in getattr(node, 'optional_inputs', []) if key in data})
+            data.update(node.run(inputs))
+
+        # End the session if the video feed has ended, or if the window was closed
+        if data.get('pipeline_end', False):
+            self.stop()
+
+    def serve_forever(self) -> None:
+        """Serves commands until shut down
+
+        Frames are analysed on the calling thread, which should be the main thread
+        for the output.screen Node to be able to display its window.
+        """
+
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info('Worker listening on %s:%d.', *self.server.server_address)
+        try:
+            while self.running:
+                try:
+                    # Block while idle, but only poll while a session is active
+                    command, reply = self.commands.get(block=not self.active)
+                    reply.put(self.handle(command))
+                    continue
+                except queue.Empty:
+                    pass
+                if self.active:
+                    self.run_frame()
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            if self.profiler is not None:
+                self.profiler.export(self.profile)
+                logger.info('Saved the times of every Node to %s.*.json:\n%s', self.profile, self.profiler.report())
+
+
+class _Server(socketserver.ThreadingTCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+    worker: Any = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            command = line.decode('utf-8', errors='replace').strip()
+            if not command:
+                continue
+
+            # Forward the command to the pipeline thread and wait for its reply
+            reply: queue.Queue = queue.Queue(maxsize=1)
+            self.server.worker.commands.put((command, reply))
+            self.wfile.write(f'{reply.get()}\n'.encode('utf-8'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='Stretch925 worker',
+        description='Keep the computer vision pipeline warm between stretches.'
+    )
+    parser.add_argument("--port", type=int, default=WORKER_PORT)
+    parser.add_argument("--exercise", choices=['arm', 'neck', 'side'], default='arm')
+    parser.add_argument("--profile", metavar='PREFIX',
+                        help="time every Node, saving the trace and summary to PREFIX.*.json on shutdown")
+    parser.add_argument("--headless", action='store_true',
+                        help="run without a screen, only drawing and encoding the frames while they are viewed")
+    parser.add_argument("--stream-quality", type=int, help="JPEG quality of the streamed frames, from 0 to 100")
+    parser.add_argument("--stream-width", type=int, help="width in pixels to scale the streamed frames down to")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    stream_config = {key: value for key, value in (('quality', args.stream_quality), ('width', args.stream_width))
+                     if value is not None}
+    Worker(port=args.port, exercise=args.exercise, profile=args.profile, headless=args.headless,
+           stream=stream_config).serve_forever()